@@ -0,0 +1,68 @@
+# CLI script to compare this run's results.fits against an external catalog (e.g., MAGPHYS, or the output
+# of an alternative photometry run), matched by galaxy ID or -- with -sky <radius in arcsec> -- by position.
+# prints (and writes to destination/out/comparison_stats.txt) the CIGALE - catalog residuals of log stellar
+# mass and log SFR.
+#
+# for -sky, the results' RA/DEC are taken from the photometry table in params.txt.
+
+import sys
+import os
+import numpy as np
+from astropy.table import Table
+
+#covering all bases...just in case.
+sys.path.insert(0,'utils')
+sys.path.insert(0,'../utils')
+
+from param_utils import Params
+from compare_utils import join_catalogs, compare_mass_sfr, match_ids
+
+if __name__ == "__main__":
+
+    if '-h' in sys.argv or '--help' in sys.argv:
+        print("USAGE: %s [-params <param_file>] [-catalog <catalog .fits>] [-id_col VFID] [-sky <radius arcsec>]"
+              " [-ra_col RA] [-dec_col DEC] [-mass_col MAGPHYS_logMstar_med] [-sfr_col MAGPHYS_logSFR_med] [-linear]")
+        sys.exit()
+
+    if '-params' in sys.argv:
+        p = sys.argv.index('-params')
+        param_file = str(sys.argv[p+1])
+    else:
+        print('-params argument not found. exiting.')
+        sys.exit()
+
+    if '-catalog' in sys.argv:
+        p = sys.argv.index('-catalog')
+        catalog_file = str(sys.argv[p+1])
+    else:
+        print('-catalog argument not found. exiting.')
+        sys.exit()
+
+    def option(flag, default):
+        return str(sys.argv[sys.argv.index(flag)+1]) if flag in sys.argv else default
+
+    params = Params(param_file)
+    out_dir = os.path.join(params.destination, params.output_dir_name)
+
+    results = Table.read(os.path.join(out_dir, 'results.fits'))
+    catalog = Table.read(catalog_file)
+
+    sky = None
+    if '-sky' in sys.argv:
+        #photometry rows are row-matched to the main table, whose IDs are the results' IDs
+        rows_results, rows_main = match_ids(results['id'], params.main_tab[params.id_col])
+        results = results[rows_results]
+        ra_col = 'RA_MOMENT' if 'RA_MOMENT' in params.flux_tab.colnames else 'RA'
+        dec_col = 'DEC_MOMENT' if 'DEC_MOMENT' in params.flux_tab.colnames else 'DEC'
+        sky = (np.asarray(params.flux_tab[ra_col])[rows_main], np.asarray(params.flux_tab[dec_col])[rows_main],
+               option('-ra_col', 'RA'), option('-dec_col', 'DEC'))
+
+    results, catalog = join_catalogs(results, catalog, catalog_id_col=option('-id_col', 'VFID'), sky=sky,
+                                     radius_arcsec=float(option('-sky', 3.)))
+
+    columns = {'logMstar': ('bayes.stellar.m_star', option('-mass_col', 'MAGPHYS_logMstar_med')),
+               'logSFR': ('bayes.sfh.sfr', option('-sfr_col', 'MAGPHYS_logSFR_med'))}
+    stats = compare_mass_sfr(results, catalog, columns, catalog_is_log=('-linear' not in sys.argv))
+
+    stats.pprint(max_width=-1)
+    stats.write(os.path.join(out_dir, 'comparison_stats.txt'), format='ascii.fixed_width_two_line', overwrite=True)
@@ -0,0 +1,43 @@
+# CLI script to size up the CIGALE model grid in destination/pcigale.ini BEFORE running CIGALE:
+# models per module and in total, SFH combinations CIGALE will drop, memory per block, and predicted wall time.
+#
+# after a run, record its wall time with -calibrate <seconds> so later predictions can use it.
+# calibration runs are kept in destination/grid_calibration.json
+
+import sys
+import os
+
+#covering all bases...just in case.
+sys.path.insert(0,'utils')
+sys.path.insert(0,'../utils')
+
+from param_utils import Params
+from grid_utils import plan_grid, print_plan, add_calibration, predict_walltime
+
+if __name__ == "__main__":
+
+    if '-h' in sys.argv or '--help' in sys.argv:
+        print("USAGE: %s [-params <param_file>] [-calibrate <wall time of the last run, in seconds>]")
+        sys.exit()
+
+    if '-params' in sys.argv:
+        p = sys.argv.index('-params')
+        param_file = str(sys.argv[p+1])
+    else:
+        print('-params argument not found. exiting.')
+        sys.exit()
+
+    params = Params(param_file)
+
+    ini_path = os.path.join(params.destination, 'pcigale.ini')
+    data_path = os.path.join(params.destination, params.data_file)
+    calibration_path = os.path.join(params.destination, 'grid_calibration.json')
+
+    plan = plan_grid(ini_path, data_path if os.path.exists(data_path) else None)
+
+    if '-calibrate' in sys.argv:
+        p = sys.argv.index('-calibrate')
+        add_calibration(calibration_path, plan, float(sys.argv[p+1]))
+        print(f'Calibration run added to {calibration_path}')
+
+    print_plan(plan, predict_walltime(calibration_path, plan))
@@ -0,0 +1,64 @@
+# CLI script to run the pipeline over every brick of a tiled catalog (e.g., SGA2025) under brick_root.
+# the brick path_to_repos points at in params.txt is the template for the others' table names.
+#
+#   -inputs  write galaxy_data.txt for every brick (batch_workers processes)
+#   -fit     per_brick: fit every brick in {destination}/bricks/{brick}/, side by side under cpu_budget cores
+#            combined:  fit all bricks as one catalog in destination (brick of each galaxy in galaxy_bricks.txt)
+# with neither flag, both steps are run. progress is kept in {destination}/batch_ledger.txt, so an interrupted
+# batch resumes where it stopped; delete a brick's lines from the ledger to redo it.
+
+import sys
+import os
+
+#covering all bases...just in case.
+sys.path.insert(0,'utils')
+sys.path.insert(0,'../utils')
+
+from param_utils import Params
+from batch_utils import find_bricks, build_brick_inputs, ready_bricks, combine_brick_inputs, fit_bricks, write_ledger
+from init_utils import create_ini_files
+from pipeline_utils import run_pipeline
+
+if __name__ == "__main__":
+
+    if '-h' in sys.argv or '--help' in sys.argv:
+        print("USAGE: %s [-params <param_file>] [-inputs] [-fit]")
+        sys.exit()
+
+    if '-params' in sys.argv:
+        p = sys.argv.index('-params')
+        param_file = str(sys.argv[p+1])
+    else:
+        print('-params argument not found. exiting.')
+        sys.exit()
+
+    params = Params(param_file)
+
+    if params.brick_root is None:
+        print('brick_root not found in params.txt. exiting.')
+        sys.exit()
+    if params.batch_mode not in ('per_brick', 'combined'):
+        print(f'Unknown batch_mode = {params.batch_mode}. Please use per_brick or combined.')
+        sys.exit()
+    if params.batch_mode == 'combined' and params.data_format != 'txt':
+        print('batch_mode combined concatenates the bricks\' galaxy_data.txt; use data_format txt. exiting.')
+        sys.exit()
+
+    do_all = ('-inputs' not in sys.argv) and ('-fit' not in sys.argv)
+    os.makedirs(params.destination, exist_ok=True)
+
+    bricks = find_bricks(params)
+    ready = build_brick_inputs(params, bricks) if (do_all or '-inputs' in sys.argv) else ready_bricks(params, bricks)
+
+    if do_all or '-fit' in sys.argv:
+        if params.batch_mode == 'per_brick':
+            fit_bricks(params, ready)
+        else:
+            combine_brick_inputs(params, ready)
+            create_ini_files(params)
+            run_pipeline(params, ['genconf', 'preflight', 'run', 'export_results', 'sed_plots', 'pdfs'])
+            if os.path.exists(os.path.join(params.destination, params.output_dir_name, 'results.fits')):
+                for brick in ready:
+                    write_ledger(params.destination, brick, 'fitted', 'combined')
+
+    print(f'Batch ledger: {os.path.join(params.destination, "batch_ledger.txt")}')
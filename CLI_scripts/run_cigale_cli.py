@@ -7,7 +7,7 @@ sys.path.insert(0,'utils')
 sys.path.insert(0,'../utils')
 
 from param_utils import Params
-from cigale_utils import run_cigale, run_sed_plots, organize_sed_output
+from pipeline_utils import run_pipeline
 
 if __name__ == "__main__":
 
@@ -27,24 +27,13 @@ if __name__ == "__main__":
     #define ALL parameters using Params class (utils/param_utils.py)
     params = Params(param_file)
 
-    #in order to save the probability distribution functions, ncores = nblocks = 1
-    #note that ncores = nblocks = 1 is already established in param_utils.py if params.create_pdfs=1.
-    #this print statement is just a confirmation message.
+    #in order to save the probability distribution functions, ncores = nblocks = 1 per CIGALE process
+    #note that this is already established in param_utils.py if params.create_pdfs=1; the catalog is then
+    #split into (params.txt) ncores shards run side by side. this print statement is just a confirmation message.
     if params.create_pdfs:
-        print('Create PDFs set to True! nblocks = ncores = 1.')
+        print(f'Create PDFs set to True! nblocks = ncores = 1 per shard, {params.pdf_shards} shard(s).')
 
-    #run CIGALE
-    print('Executing CIGALE...')
-    run_cigale(params.destination)
-
-    params.find_out()     #determine most recently edited out*/ directory. needed!
-    
-    #if SED plots requested, generate them and organize output
-    if params.sed_plots:
-        print('Generating SED plots...')
-        run_sed_plots(params.destination)
-
-        print('Organizing output...')
-        organize_sed_output(params.destination, params.main_tab, params.output_dir_name)
+    #run CIGALE, then (if requested) generate SED plots and organize output
+    run_pipeline(params, ['preflight', 'run', 'export_results', 'sed_plots'])
 
     print('CIGALE is Fin!')
\ No newline at end of file
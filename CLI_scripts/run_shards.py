@@ -0,0 +1,54 @@
+# CLI script to run CIGALE on shards of galaxy_data.txt, possibly spread over several nodes
+# that share the destination directory.
+#
+#   -prepare       split galaxy_data.txt into params.txt's nshards (by shard_by)
+#   -run           run every shard, under params.txt's cpu_budget cores
+#   -shards 0,3,5  run only these shard numbers, under cpu_budget cores
+#   -merge         merge every shard's output into destination/out/
+#
+# e.g., prepare once, run a different -shards list on each node, then merge once all have finished.
+
+import sys
+
+#covering all bases...just in case.
+sys.path.insert(0,'utils')
+sys.path.insert(0,'../utils')
+
+from param_utils import Params
+from shard_utils import split_galaxy_data, list_shards, run_shards, merge_shard_output
+from tuning_utils import resolve_auto_tuning
+
+if __name__ == "__main__":
+
+    if '-h' in sys.argv or '--help' in sys.argv:
+        print("USAGE: %s [-params <param_file>] [-prepare] [-run | -shards <comma-separated shard numbers>] [-merge]")
+        sys.exit()
+
+    if '-params' in sys.argv:
+        p = sys.argv.index('-params')
+        param_file = str(sys.argv[p+1])
+    else:
+        print('-params argument not found. exiting.')
+        sys.exit()
+
+    params = Params(param_file)
+    resolve_auto_tuning(params)
+
+    #PDF runs are limited to one core per CIGALE process
+    cores_per_shard = 1 if params.create_pdfs else int(params.ncores)
+
+    if '-prepare' in sys.argv:
+        shard_dirs = split_galaxy_data(params.destination, params.nshards, by=params.shard_by,
+                                       cores_per_shard=cores_per_shard)
+        print(f'{len(shard_dirs)} shards prepared in {params.destination}shards/')
+
+    if '-shards' in sys.argv:
+        p = sys.argv.index('-shards')
+        shard_dirs = [list_shards(params.destination)[int(n)] for n in sys.argv[p+1].split(',')]
+        run_shards(shard_dirs, params.cpu_budget, cores_per_shard)
+    elif '-run' in sys.argv:
+        run_shards(list_shards(params.destination), params.cpu_budget, cores_per_shard)
+
+    if '-merge' in sys.argv:
+        out_dir = merge_shard_output(list_shards(params.destination), params.destination, params.output_dir_name)
+        print(f'Merged shard output in {out_dir}')
@@ -0,0 +1,46 @@
+# CLI script to run a parameter sweep: several variants of the SED model grid (sfh_module, dust_module,
+# lim_flag, module parameter lists, dropped bands), each in its own directory, fit to the same photometry
+# side by side under one core budget. see sweep_example.json and utils/sweep_utils.py.
+#
+# writes {sweep destination}/sweep_summary.txt: runtime, mean reduced chi2, and stellar mass/SFR offsets
+# from the reference variant. -summary only rebuilds the summary from finished variants.
+
+import sys
+
+#covering all bases...just in case.
+sys.path.insert(0,'utils')
+sys.path.insert(0,'../utils')
+
+from param_utils import Params
+from sweep_utils import read_sweep, run_sweep, summarize_sweep
+
+if __name__ == "__main__":
+
+    if '-h' in sys.argv or '--help' in sys.argv:
+        print("USAGE: %s [-params <param_file>] [-sweep <sweep .json file>] [-summary]")
+        sys.exit()
+
+    if '-params' in sys.argv:
+        p = sys.argv.index('-params')
+        param_file = str(sys.argv[p+1])
+    else:
+        print('-params argument not found. exiting.')
+        sys.exit()
+
+    if '-sweep' in sys.argv:
+        p = sys.argv.index('-sweep')
+        sweep_file = str(sys.argv[p+1])
+    else:
+        print('-sweep argument not found. exiting.')
+        sys.exit()
+
+    params = Params(param_file)
+    sweep = read_sweep(sweep_file, params)
+
+    if '-summary' in sys.argv:
+        summary = summarize_sweep(sweep, {}, {})
+    else:
+        summary = run_sweep(params, sweep)
+
+    summary.pprint(max_lines=-1, max_width=-1)
+    print(f"Sweep output located in {sweep['destination']}")
@@ -7,8 +7,7 @@ sys.path.insert(0,'utils')
 sys.path.insert(0,'../utils')
 
 from param_utils import Params
-from init_utils import create_flux_table, create_ini_files, add_params
-from cigale_utils import run_genconf
+from pipeline_utils import run_pipeline
 
 if __name__ == "__main__":
     
@@ -25,24 +24,8 @@ if __name__ == "__main__":
 
     params = Params(param_file)
     
-    #send the print warning about where previous run's CIGALE output will be moved
-    #will ONLY print if '$/out' exists
-    params.find_out()
-    
-    #load IDs and redshifts!
-    params.load_columns()
-    
-    print('Generating flux table and input .ini files for CIGALE...')
-    
-    create_flux_table(params)
-    create_ini_files(params)
-    
-    #configure input files and generate configuration files
-    print('Configuring input text files...')
-    run_genconf(params.dir_path)
-
-    #modify pcigale.ini according to our settings
-    add_params(params.dir_path, params.sed_plots, params.lim_flag, params.nblocks, 
-               create_pdfs=params.create_pdfs)
+    #flux table, pcigale.ini and pcigale.ini.spec, then genconf and our pcigale.ini parameter edits
+    #(timings, memory and I/O of both go to run_report.json)
+    run_pipeline(params, ['write_inputs', 'genconf', 'preflight'])
     
     print('Input files successfully generated!')
\ No newline at end of file
@@ -0,0 +1,69 @@
+'''
+Startup-time benchmark for the CLI entry points.
+
+For each script, a fresh interpreter runs the module-level code (imports, sys.path setup) without
+the __main__ block, then constructs Params(param_file). Reported times are the median over -n runs.
+
+USAGE: python benchmarks/bench_cli_startup.py -params params.txt [-n 5]
+(run from the repository root)
+'''
+
+import sys
+import os
+import time
+import subprocess
+import numpy as np
+
+entry_points = ['run_cigale.py',
+                'CLI_scripts/write_input_files.py',
+                'CLI_scripts/run_cigale_cli.py',
+                'CLI_scripts/plot_PDF.py']
+
+#executed in a fresh interpreter; prints import time and Params construction time
+startup_snippet = '''
+import sys, time, runpy
+t0 = time.perf_counter()
+namespace = runpy.run_path({script!r}, run_name='startup_benchmark')
+t1 = time.perf_counter()
+params = namespace['Params']({param_file!r})
+t2 = time.perf_counter()
+print(t1-t0, t2-t1)
+'''
+
+
+def time_entry_point(script, param_file, nruns=5):
+
+    wall_times, import_times, params_times = [], [], []
+
+    for n in range(nruns):
+        t0 = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', startup_snippet.format(script=script, param_file=param_file)],
+                                capture_output=True, text=True, check=True).stdout
+        wall_times.append(time.perf_counter() - t0)
+
+        t_import, t_params = [float(x) for x in output.split()[-2:]]
+        import_times.append(t_import)
+        params_times.append(t_params)
+
+    return np.median(wall_times), np.median(import_times), np.median(params_times)
+
+
+if __name__ == "__main__":
+
+    if '-h' in sys.argv or '--help' in sys.argv:
+        print("USAGE: %s [-params (name of parameter.txt file)] [-n (number of runs per script)]")
+        sys.exit()
+
+    if '-params' in sys.argv:
+        p = sys.argv.index('-params')
+        param_file = os.path.abspath(sys.argv[p+1])
+    else:
+        print('-params argument not found. exiting.')
+        sys.exit()
+
+    nruns = int(sys.argv[sys.argv.index('-n')+1]) if '-n' in sys.argv else 5
+
+    print(f'{"entry point":<36} {"total [s]":>10} {"imports [s]":>12} {"Params [s]":>11}')
+    for script in entry_points:
+        wall, t_import, t_params = time_entry_point(script, param_file, nruns)
+        print(f'{script:<36} {wall:>10.3f} {t_import:>12.3f} {t_params:>11.3f}')
@@ -0,0 +1,283 @@
+'''
+Regression benchmarks for the Python wrapper layer, on synthetic SGA-like catalogs (see synthetic_catalog.py)
+so that neither the real catalogs nor a CIGALE install are needed:
+
+    params_load   -- Params(param_file), load_tables() and load_columns() (whole-table mode)
+    fauxtab       -- create_fauxtab() on the loaded (trimmed) tables
+    write_region  -- write_region() for the north and the south galaxies
+    add_params    -- add_params() on the example pcigale.ini (pcigale_ini_examples/)
+    pdf_render    -- render_all_pdfs() for -pdf_galaxies galaxies, out/ written by stub_pcigale.py
+
+Every benchmark reports the median over -repeat runs, compared to the baselines saved earlier on this machine
+(-workdir/baselines.json, or -baselines <path>). Anything slower than its baseline by more than -tolerance
+(a fraction) is flagged and the script exits with status 1. -save stores the current medians as the new
+baselines. Timings are machine-specific: baselines from another host or CPU count are shown but never
+gate, and none are kept in the repository.
+
+Catalogs are written once per size to -workdir and reused. 10^7 rows is ~1.3 GB on disk, and params_load
+holds the whole table in memory (as the pipeline does with chunk_size 0).
+
+USAGE: python benchmarks/bench_wrapper.py [-rows 1e3,1e4,1e5] [-repeat 3] [-pdf_galaxies 2]
+                                          [-workdir /tmp/wiseseds_bench] [-baselines (path)] [-tolerance 0.25] [-save]
+                                          [-only params_load,fauxtab,write_region,add_params,pdf_render]
+(run from the repository root)
+'''
+
+import sys
+import os
+import json
+import time
+import shutil
+import platform
+import subprocess
+from datetime import datetime
+import numpy as np
+
+#covering all bases...just in case.
+sys.path.insert(0,'utils')
+sys.path.insert(0,'../utils')
+sys.path.insert(0,os.path.dirname(os.path.abspath(__file__)))
+
+from param_utils import Params
+from init_utils import (trim_tables, create_fauxtab, create_fauxarray, create_flux_table, write_region,
+                        BandLayout, add_params)
+from synthetic_catalog import write_synthetic_catalog, write_params
+
+bench_dir = os.path.dirname(os.path.abspath(__file__))
+stub_path = os.path.join(bench_dir, 'stub_pcigale.py')
+example_ini = os.path.join(bench_dir, '..', 'pcigale_ini_examples', 'pcigale_north_sfh2exp.ini')
+template_params = os.path.join(bench_dir, '..', 'params.txt')
+
+benchmark_names = ['params_load', 'fauxtab', 'write_region', 'add_params', 'pdf_render']
+
+#timings this close to their baseline (seconds) are never flagged, however large the ratio
+noise_floor = 0.005
+
+
+#########
+# Setup #
+#########
+
+def synthetic_params(workdir, nrows, **overrides):
+    '''
+    synthetic catalog of nrows rows (written once) and a params file pointing at it. returns the params path.
+    '''
+    table_name = f'synthetic-ephot-{nrows}.fits'
+    if not os.path.exists(os.path.join(workdir, table_name)):
+        print(f'Writing synthetic catalog with {nrows} rows...')
+        write_synthetic_catalog(os.path.join(workdir, table_name), nrows)
+
+    destination = os.path.join(workdir, f'run_{nrows}') + '/'
+    os.makedirs(destination, exist_ok=True)
+
+    settings = {'path_to_repos': workdir + '/', 'phot_table': table_name, 'extinction_table': table_name,
+                'main_table': table_name, 'destination': destination, 'chunk_size': 0,
+                'redshift_column': 'Z', 'galaxy_ID_col': 'OBJID', 'flux_ID_col': 'FLUX_AP03_',
+                'flux_ID_col_err': 'FLUX_ERR_AP03_', 'extinction_col': 'MW_TRANSMISSION_',
+                'nanomaggies_to_mJy': 1, 'IVAR_to_ERR': 0, 'transmission_to_extinction': 1,
+                'sed_plots': 0, 'create_pdfs': 0, 'delete_PDF_fits': 0, 'pdf_workers': 1,
+                'pdf_store': 0, 'results_store': 0, 'genconf_cache': 'none'}
+    settings.update(overrides)
+    return write_params(template_params, os.path.join(destination, 'params.txt'), settings)
+
+
+def median_time(function, repeat, setup=None, warmup=True):
+    #median wall time of function() over repeat runs; setup() (if any) runs untimed before each.
+    #one untimed warm-up run first, so lazy imports and cold caches do not count
+    if warmup:
+        if setup is not None:
+            setup()
+        function()
+    seconds = []
+    for n in range(repeat):
+        if setup is not None:
+            setup()
+        t0 = time.perf_counter()
+        function()
+        seconds.append(time.perf_counter() - t0)
+    return float(np.median(seconds))
+
+
+##############
+# Benchmarks #
+##############
+
+def bench_catalog(param_file, repeat, only):
+    #params_load, fauxtab and write_region on one catalog size
+    timings = {}
+
+    def load():
+        params = Params(param_file)
+        params.load_tables()
+        params.load_columns()
+        return params
+
+    if 'params_load' in only:
+        timings['params_load'] = median_time(load, repeat)
+
+    if not {'fauxtab', 'write_region'} & set(only):
+        return timings
+
+    params = load()
+    IDs, redshifts, flux_tab, ext_tab = trim_tables(params.IDs, params.redshifts, params.flux_tab, params.ext_tab)
+
+    if 'fauxtab' in only:
+        timings['fauxtab'] = median_time(lambda: create_fauxtab(params, flux_tab, ext_tab, IDs, redshifts), repeat)
+
+    if 'write_region' in only:
+        faux_array = create_fauxarray(params, flux_tab, ext_tab, IDs, redshifts)
+        layout = BandLayout(params.bands_north, params.bands_south)
+
+        def write():
+            with open(os.path.join(params.destination, 'galaxy_data.txt'), 'w') as file:
+                file.write(layout.header())
+                write_region(file, faux_array, layout, 'north', verbose=False)
+                write_region(file, faux_array, layout, 'south', verbose=False)
+
+        timings['write_region'] = median_time(write, repeat)
+
+    return timings
+
+
+def bench_add_params(workdir, repeat):
+    ini_dir = os.path.join(workdir, 'add_params')
+    os.makedirs(ini_dir, exist_ok=True)
+
+    #add_params edits pcigale.ini in place, so start from the example each time
+    setup = lambda: shutil.copy(example_ini, os.path.join(ini_dir, 'pcigale.ini'))
+    return median_time(lambda: add_params(ini_dir, False, 'noscaling', 1, False), repeat, setup)
+
+
+def bench_pdf_render(workdir, ngalaxies, repeat):
+    #matplotlib + seaborn are slow to import; only pay for them if this benchmark runs
+    from pipeline_utils import render_all_pdfs
+
+    param_file = synthetic_params(workdir, ngalaxies, create_pdfs=1)
+    params = Params(param_file)
+    params.load_columns()
+    create_flux_table(params)
+    out_dir = os.path.join(params.destination, params.output_dir_name)
+
+    #fresh stub CIGALE output for every run, since rendered PDFs are skipped (and .fits files moved) afterwards
+    def setup():
+        if os.path.isdir(out_dir):
+            shutil.rmtree(out_dir)
+        subprocess.run([sys.executable, stub_path, 'run'], cwd=params.destination, check=True)
+
+    cwd = os.getcwd()
+    def render():
+        try:
+            render_all_pdfs(params)
+        finally:
+            os.chdir(cwd)
+
+    return median_time(render, repeat, setup, warmup=False)
+
+
+#############
+# Baselines #
+#############
+
+def machine():
+    #what the baselines must have been measured on to be comparable
+    return {'host': platform.node(), 'cpu_count': os.cpu_count()}
+
+
+def read_baselines(path):
+    if not os.path.exists(path):
+        return {'timings': {}}
+    with open(path) as file:
+        return json.load(file)
+
+
+def save_baselines(timings, path):
+    baselines = read_baselines(path)
+    #timings from another machine are not kept alongside these
+    if any(baselines.get(key) != value for key, value in machine().items()):
+        baselines = {'timings': {}}
+    baselines['timings'].update({key: round(seconds, 5) for key, seconds in timings.items()})
+    baselines.update(created=datetime.now().isoformat(timespec='seconds'), python=platform.python_version(),
+                     numpy=np.__version__, **machine())
+    with open(path, 'w') as file:
+        json.dump(baselines, file, indent=1, sort_keys=True)
+
+
+def compare_to_baselines(timings, baselines, tolerance):
+    '''
+    prints current vs. baseline for every benchmark. returns the keys slower than their baseline by more than
+    the tolerance (a fraction), or None if the baselines were measured on another machine (nothing to gate on).
+    '''
+    other = {key: baselines.get(key) for key, value in machine().items() if baselines.get(key) != value}
+    if other and baselines['timings']:
+        print(f'\nBaselines were measured on {other}, not {machine()}; shown for reference only. '
+              'Run with -save to record baselines on this machine.')
+    
+    slower = []
+    print(f'\n{"benchmark":<28} {"median [s]":>11} {"baseline [s]":>13} {"ratio":>7}  status')
+    for key, seconds in timings.items():
+        baseline = baselines['timings'].get(key)
+        if baseline is None:
+            print(f'{key:<28} {seconds:>11.4f} {"-":>13} {"-":>7}  new')
+            continue
+
+        ratio = seconds / baseline if baseline else np.inf
+        if seconds > baseline * (1 + tolerance) + noise_floor:
+            status = 'SLOWER'
+            slower.append(key)
+        elif seconds * (1 + tolerance) + noise_floor < baseline:
+            status = 'faster'
+        else:
+            status = 'ok'
+        if other:
+            status = f'{status.lower()} (reference only)'
+        print(f'{key:<28} {seconds:>11.4f} {baseline:>13.4f} {ratio:>7.2f}  {status}')
+
+    if baselines.get('host'):
+        print(f'\n(baselines from {baselines["host"]}, {baselines.get("cpu_count")} CPUs, {baselines.get("created", "")})')
+    return None if other else slower
+
+
+if __name__ == "__main__":
+
+    if '-h' in sys.argv or '--help' in sys.argv:
+        print("USAGE: %s [-rows 1e3,1e4,1e5] [-repeat 3] [-pdf_galaxies 2] [-workdir /tmp/wiseseds_bench] "
+              "[-baselines (path)] [-tolerance 0.25] [-save] [-only (comma-separated benchmarks)]")
+        sys.exit()
+
+    rows = sys.argv[sys.argv.index('-rows')+1] if '-rows' in sys.argv else '1e3,1e4,1e5'
+    rows = [int(float(n)) for n in rows.split(',')]
+    repeat = int(sys.argv[sys.argv.index('-repeat')+1]) if '-repeat' in sys.argv else 3
+    pdf_galaxies = int(sys.argv[sys.argv.index('-pdf_galaxies')+1]) if '-pdf_galaxies' in sys.argv else 2
+    workdir = sys.argv[sys.argv.index('-workdir')+1] if '-workdir' in sys.argv else '/tmp/wiseseds_bench'
+    tolerance = float(sys.argv[sys.argv.index('-tolerance')+1]) if '-tolerance' in sys.argv else 0.25
+    only = sys.argv[sys.argv.index('-only')+1].split(',') if '-only' in sys.argv else benchmark_names
+
+    unknown = set(only) - set(benchmark_names)
+    if unknown:
+        print(f'unknown benchmark(s) {sorted(unknown)}; choose from {benchmark_names}. exiting.')
+        sys.exit()
+
+    workdir = os.path.abspath(workdir)
+    os.makedirs(workdir, exist_ok=True)
+    
+    #kept next to the synthetic catalogs, outside the repository
+    baseline_path = sys.argv[sys.argv.index('-baselines')+1] if '-baselines' in sys.argv else \
+                    os.path.join(workdir, 'baselines.json')
+
+    timings = {}
+    for nrows in rows:
+        for name, seconds in bench_catalog(synthetic_params(workdir, nrows), repeat, only).items():
+            timings[f'{name}@{nrows}'] = seconds
+    if 'add_params' in only:
+        timings['add_params'] = bench_add_params(workdir, repeat)
+    if 'pdf_render' in only:
+        timings[f'pdf_render@{pdf_galaxies}'] = bench_pdf_render(workdir, pdf_galaxies, repeat)
+
+    slower = compare_to_baselines(timings, read_baselines(baseline_path), tolerance)
+
+    if '-save' in sys.argv:
+        save_baselines(timings, baseline_path)
+        print(f'Baselines saved to {baseline_path}')
+    elif slower:
+        print(f'\n{len(slower)} benchmark(s) slower than baseline by more than {tolerance:.0%}: {", ".join(slower)}')
+        sys.exit(1)
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+'''
+Stand-in for `pcigale run` in the benchmarks: reads galaxy_data.txt in the working directory and writes what
+CIGALE would leave in out/ for the PDF stage -- results.fits (id, bayes values and errors, best values) and
+one {id}_{parameter}.fits probability grid per galaxy and parameter. No fitting is done.
+
+USAGE (from a directory holding galaxy_data.txt): python stub_pcigale.py run
+'''
+
+import sys
+import os
+import numpy as np
+from astropy.table import Table
+
+#as in a typical sfhdelayed + bc03 + dl2014 run; tau_main and metallicity are dropped by the PDF plots
+stub_params = ['sfh.sfr', 'stellar.m_star', 'dust.luminosity', 'sfh.age_main', 'sfh.tau_main',
+               'stellar.metallicity', 'attenuation.E_BV_lines', 'dust.alpha', 'dust.qpah']
+
+grid_points = 20
+
+
+def read_ids(data_path='galaxy_data.txt'):
+    with open(data_path) as file:
+        return [line.split(maxsplit=1)[0] for line in file if line.strip() and not line.startswith('#')]
+
+
+def stub_run(out_dir='out', seed=1):
+    rng = np.random.default_rng(seed)
+    ids = read_ids()
+    os.makedirs(out_dir, exist_ok=True)
+
+    results = Table()
+    results['id'] = ids
+    for param in stub_params:
+        values = 10**rng.uniform(-1, 1, len(ids))
+        results[f'bayes.{param}'] = values
+        results[f'bayes.{param}_err'] = 0.1 * values
+        results[f'best.{param}'] = values * rng.uniform(0.8, 1.2, len(ids))
+    results.write(os.path.join(out_dir, 'results.fits'), overwrite=True)
+
+    #one probability grid per galaxy and parameter, as written by CIGALE with save_chi2/pdf options on
+    for galaxy_id, row in zip(ids, results):
+        for param in stub_params:
+            grid = np.linspace(0.5, 1.5, grid_points) * row[f'bayes.{param}']
+            probability = np.exp(-0.5 * ((grid - row[f'bayes.{param}']) / row[f'bayes.{param}_err'])**2)
+            Table([grid, probability / probability.sum()], names=[param, 'probability']).write(
+                os.path.join(out_dir, f'{galaxy_id}_{param}.fits'), overwrite=True)
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) < 2 or sys.argv[1] != 'run':
+        print('stub pcigale: only "run" is implemented. exiting.')
+        sys.exit()
+
+    stub_run()
@@ -0,0 +1,125 @@
+'''
+Synthetic SGA-like ephot catalogs for the benchmarks: OBJID, Z, RA, DEC and, for every band,
+FLUX_AP03_<band>, FLUX_ERR_AP03_<band> and MW_TRANSMISSION_<band> (nanomaggies, as in the SGA2025 ephot files).
+Photometry, extinction and redshifts share one file, so it serves as phot_table, extinction_table and main_table.
+
+A few rows mimic what the real catalogs contain: no photometry in a band (flux = error = 0), negative
+fluxes (some far outside their errors), and z <= 0 (trimmed by the wrapper). DEC spans both sides of 32 deg,
+so north and south galaxies are both written.
+
+The table is written in blocks of chunk_rows rows straight to disk, so even 10^7 rows (~1.3 GB) never sit
+in memory at once.
+
+USAGE: python benchmarks/synthetic_catalog.py -rows 100000 -out /tmp/synthetic-ephot.fits [-seed 1]
+'''
+
+import sys
+import os
+import numpy as np
+from astropy.io import fits
+
+bands = ['FUV','NUV','G','R','Z','W1','W2','W3','W4']
+
+flux_prefix = 'FLUX_AP03_'
+flux_err_prefix = 'FLUX_ERR_AP03_'
+extinction_prefix = 'MW_TRANSMISSION_'
+
+#rough median flux per band (nanomaggies) of a nearby SGA galaxy
+median_flux = {'FUV': 20., 'NUV': 40., 'G': 400., 'R': 700., 'Z': 1000.,
+               'W1': 800., 'W2': 500., 'W3': 600., 'W4': 400.}
+
+#fraction of rows (per band) with no photometry, and with z <= 0
+no_flux_frac = 0.03
+bad_z_frac = 0.01
+
+
+def catalog_dtype():
+    #FITS binary tables are big-endian and unpadded
+    dtype = [('OBJID', '>i8'), ('Z', '>f8'), ('RA', '>f8'), ('DEC', '>f8')]
+    for band in bands:
+        dtype += [(flux_prefix + band, '>f4'), (flux_err_prefix + band, '>f4'), (extinction_prefix + band, '>f4')]
+    return np.dtype(dtype)
+
+
+def synthetic_rows(start, nrows, rng):
+    rows = np.zeros(nrows, dtype=catalog_dtype())
+    rows['OBJID'] = np.arange(start, start + nrows)
+    rows['Z'] = rng.uniform(0.002, 0.05, nrows)
+    rows['Z'][rng.random(nrows) < bad_z_frac] = 0.
+    rows['RA'] = rng.uniform(0., 360., nrows)
+    rows['DEC'] = rng.uniform(-20., 80., nrows)
+
+    ebv = rng.exponential(0.03, nrows)
+    for n, band in enumerate(bands):
+        flux = median_flux[band] * rng.lognormal(0., 1., nrows)
+        err = flux * rng.uniform(0.01, 0.3, nrows)
+        #a few negative fluxes, most within 4 sigma of zero
+        negative = rng.random(nrows) < 0.02
+        flux[negative] = -err[negative] * rng.uniform(0., 6., negative.sum())
+
+        missing = rng.random(nrows) < no_flux_frac
+        flux[missing] = err[missing] = 0.
+
+        rows[flux_prefix + band] = flux
+        rows[flux_err_prefix + band] = err
+        rows[extinction_prefix + band] = 10**(-0.4 * ebv * (3. - 0.3*n))
+    return rows
+
+
+def table_header(nrows):
+    #header of a BinTableHDU with this layout and nrows rows, without allocating the rows
+    dtype = catalog_dtype()
+    formats = {'>i8': 'K', '>f8': 'D', '>f4': 'E'}
+    columns = [fits.Column(name=name, format=formats[dtype[name].str], array=np.zeros(0, dtype[name]))
+               for name in dtype.names]
+    header = fits.BinTableHDU.from_columns(columns).header
+    header['NAXIS2'] = nrows
+    return header
+
+
+def write_synthetic_catalog(path, nrows, seed=1, chunk_rows=1000000):
+    '''
+    write an nrows-row synthetic ephot catalog to path. returns path.
+    '''
+    rng = np.random.default_rng(seed)
+    with open(path, 'wb') as file:
+        file.write(fits.PrimaryHDU().header.tostring().encode('ascii'))
+        file.write(table_header(nrows).tostring().encode('ascii'))
+        for start in range(0, nrows, chunk_rows):
+            file.write(synthetic_rows(start, min(chunk_rows, nrows - start), rng).tobytes())
+        #data blocks are padded to a multiple of 2880 bytes
+        file.write(b'\0' * (-file.tell() % 2880))
+    return path
+
+
+def write_params(template_path, out_path, overrides):
+    '''
+    copy a params.txt, replacing the value of every key in overrides (keys not found are appended)
+    '''
+    remaining = dict(overrides)
+    lines = []
+    with open(template_path) as file:
+        for line in file:
+            key = line.split()[0] if line.split() else None
+            if key in remaining:
+                line = f'{key:<20} {remaining.pop(key)}\n'
+            lines.append(line)
+    lines += [f'{key:<20} {value}\n' for key, value in remaining.items()]
+
+    with open(out_path, 'w') as file:
+        file.writelines(lines)
+    return out_path
+
+
+if __name__ == "__main__":
+
+    if '-h' in sys.argv or '--help' in sys.argv:
+        print("USAGE: %s [-rows (number of galaxies)] [-out (output .fits)] [-seed (random seed)]")
+        sys.exit()
+
+    nrows = int(float(sys.argv[sys.argv.index('-rows')+1])) if '-rows' in sys.argv else 1000
+    out_path = sys.argv[sys.argv.index('-out')+1] if '-out' in sys.argv else f'synthetic-ephot-{nrows}.fits'
+    seed = int(sys.argv[sys.argv.index('-seed')+1]) if '-seed' in sys.argv else 1
+
+    write_synthetic_catalog(os.path.abspath(out_path), nrows, seed)
+    print(f'{nrows} rows written to {out_path}')
@@ -1,22 +1,24 @@
 import sys
 import os
-from astropy.table import Table, vstack
 homedir = os.getenv("HOME")
 
 # ensure utils is in path
 sys.path.insert(0, 'utils')
 from param_utils import Params   #inherit Params class
+from pipeline_utils import run_pipeline
 
 
-def run_cigale_all(herschel=False):
+def run_cigale_all(params, herschel=False):
         
-    #IF HERSCHEL BANDS, then user must manually complete this following step (e.g., generate 
-    #their own .txt files...pending some sort of photometry catalog with row-matched Herschel
-    #data).
+    #IF HERSCHEL BANDS without a pacs_table in params.txt, then user must manually complete this 
+    #following step (e.g., generate their own .txt files). with a pacs_table, the PACS catalog is 
+    #matched to the main table (by ID or position) and written with the rest of the photometry.
+    stages = ['preflight', 'run', 'export_results', 'sed_plots', 'pdfs']
     if not herschel:
-        os.system('python CLI_scripts/write_input_files.py -params params.txt')
+        stages = ['write_inputs', 'genconf'] + stages
     
-    os.system('python CLI_scripts/run_cigale_cli.py -params params.txt')
+    #every stage runs in this process, sharing the same Params object (and loaded tables)
+    return run_pipeline(params, stages)
 
     
 if __name__ == "__main__":
@@ -36,26 +38,9 @@ if __name__ == "__main__":
     params = Params(param_file)
 
     herschel = False
-    if 'PACS' in params.bands_north:
+    if ('PACS' in params.bands_north) and (params.pacs_table is None):
         herschel = True
                 
-    run_cigale_all(herschel)
-    
-    #find most recently edited out*/ directory. NEEDED.
-    params.find_out()   #returns self.output_dir_name
-    
-    if params.create_pdfs:
-        
-        #read results.fits output
-        results_path = os.path.join(params.destination, params.output_dir_name, 'results.fits')
-        results = Table.read(results_path)
-    
-        #ensure output directory exists...
-        pdf_dir = os.path.join(params.destination, params.output_dir_name, 'PDF_fits')
-        os.makedirs(pdf_dir, exist_ok=True)
-        
-        #loop through each galaxy to generate PDFs
-        for index in range(len(results)):
-            os.system('python CLI_scripts/plot_PDF.py -params params.txt')
+    run_cigale_all(params, herschel)
             
     print(f"Results of this run's SEDs+PDFs (if applicable) and results.fits located in {params.destination}{params.output_dir_name}/.\n")
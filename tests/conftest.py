@@ -0,0 +1,5 @@
+import os
+import sys
+
+#the utils/ modules import each other by name, as in the CLI scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'utils'))
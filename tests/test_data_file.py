@@ -0,0 +1,83 @@
+'''
+galaxy_data.fits (write_fits_data) against galaxy_data.txt (write_text_data), written from the same faux tables
+whole and chunk by chunk, and for an empty catalog.
+'''
+
+import numpy as np
+import pytest
+from astropy.io import fits
+from astropy.table import Table
+
+from init_utils import BandLayout, filter_names_all, write_fits_data, write_text_data
+from shard_utils import read_data_table, read_galaxy_data
+
+layout = BandLayout('FUV-NUV-G-R-W1-W2-W3-W4'.split('-'), 'FUV-NUV-G-R-Z-W1-W2-W3-W4'.split('-'))
+
+
+def make_faux_table(nrows, seed=0):
+    rng = np.random.default_rng(seed)
+    dtype = [('OBJID', np.int64), ('redshift', float)]
+    for band in filter_names_all:
+        dtype += [(band, float), (f'{band}_err', float)]
+    dtype += [('flag_north', bool), ('flag_south', bool)]
+
+    table = np.empty(nrows, dtype=dtype)
+    table['OBJID'] = np.arange(nrows) * 7 + 1000
+    table['redshift'] = rng.uniform(0.001, 0.1, nrows)
+    for band in filter_names_all:
+        table[band] = rng.uniform(0, 10, nrows)
+        table[f'{band}_err'] = rng.uniform(0, 1, nrows)
+    table['W4'][::5] = np.nan
+
+    #north, south, or neither (DEC exactly 32)
+    region = rng.integers(0, 3, nrows)
+    table['flag_north'] = region == 0
+    table['flag_south'] = region == 1
+    return table
+
+
+def chunks(table, chunk_size):
+    for start in range(0, len(table), chunk_size):
+        yield table[start:start+chunk_size]
+
+
+def text_columns(data_path):
+    header, rows = read_galaxy_data(data_path)
+    values = np.array([[float(value) for value in row.split()[1:]] for row in rows]).reshape(len(rows), -1)
+    return header[-1].split()[1:], [row.split()[0] for row in rows], values
+
+
+@pytest.mark.parametrize('chunk_size', [0, 7, 1000])
+def test_fits_matches_text(tmp_path, chunk_size):
+    table = make_faux_table(53)
+    text_path, fits_path = str(tmp_path / 'galaxy_data.txt'), str(tmp_path / 'galaxy_data.fits')
+
+    write_text_data(text_path, iter([table]), layout)
+    write_fits_data(fits_path, chunks(table, chunk_size) if chunk_size else iter([table]), layout)
+
+    names, ids, values = text_columns(text_path)
+
+    with fits.open(fits_path) as hdul:
+        hdul.verify('exception')
+        assert hdul[1].header['NAXIS2'] == len(ids)
+
+    data = read_data_table(fits_path)
+    assert data.colnames == names
+    assert [str(galaxy_id) for galaxy_id in data['id']] == ids
+
+    fits_values = np.column_stack([np.asarray(data[name], dtype=float) for name in names[1:]])
+    assert np.allclose(np.round(fits_values, 4), values, equal_nan=True, atol=1e-4)
+
+
+@pytest.mark.parametrize('fauxtabs', [[], [make_faux_table(0)]], ids=['no_chunks', 'empty_chunk'])
+def test_fits_empty_catalog(tmp_path, fauxtabs):
+    fits_path = str(tmp_path / 'galaxy_data.fits')
+    write_fits_data(fits_path, iter(fauxtabs), layout)
+
+    with fits.open(fits_path) as hdul:
+        hdul.verify('exception')
+        assert hdul[1].header['NAXIS2'] == 0
+
+    data = Table.read(fits_path)
+    assert len(data) == 0
+    assert data.colnames == layout.header().split()[1:]
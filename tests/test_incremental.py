@@ -0,0 +1,87 @@
+'''
+incremental runs: which galaxies changed since the manifest, and how the previous out/ and the refit galaxies'
+output are merged (stacked tables in galaxy_data.txt order, per-galaxy files carried over).
+'''
+
+import os
+from astropy.table import Table
+
+from incremental_utils import hash_galaxy_rows, grid_hash, write_manifest, changed_galaxies, merge_incremental_output
+
+ids = ['G1', 'G2', 'G_3', 'G4', 'G5']
+
+
+def write_data(destination, redshifts):
+    with open(os.path.join(destination, 'galaxy_data.txt'), 'w') as file:
+        file.write('# id redshift FUV FUV_err \n')
+        file.writelines(f'{galaxy_id} {z} 1.0 0.1 \n' for galaxy_id, z in zip(ids, redshifts))
+
+
+def write_out(out_dir, galaxy_ids, label):
+    os.makedirs(os.path.join(out_dir, 'best_SED_models'))
+    for name in ['results.fits', 'observations.fits']:
+        Table({'id': galaxy_ids, 'run': [label] * len(galaxy_ids)}).write(os.path.join(out_dir, name))
+    for galaxy_id in galaxy_ids:
+        with open(os.path.join(out_dir, 'best_SED_models', f'{galaxy_id}_best_model.pdf'), 'w') as file:
+            file.write(label)
+        with open(os.path.join(out_dir, f'{galaxy_id}_sfh.sfr.fits'), 'w') as file:
+            file.write(label)
+
+
+def read_text(path):
+    with open(path) as file:
+        return file.read()
+
+
+def test_changed_galaxies(tmp_path):
+    destination = str(tmp_path)
+    write_data(destination, [0.01, 0.02, 0.03, 0.04, 0.05])
+    with open(os.path.join(destination, 'pcigale.ini'), 'w') as file:
+        file.write('data_file = galaxy_data.txt\ncores = 4\nsfh_module = sfh2exp\n')
+    os.makedirs(os.path.join(destination, 'out'))
+    Table({'id': ids}).write(os.path.join(destination, 'out', 'results.fits'))
+    write_manifest(os.path.join(destination, 'out'), hash_galaxy_rows(os.path.join(destination, 'galaxy_data.txt')),
+                   grid_hash(os.path.join(destination, 'pcigale.ini')))
+
+    assert changed_galaxies(destination)[0] == []
+
+    write_data(destination, [0.01, 0.025, 0.03, 0.04, 0.05])
+    assert changed_galaxies(destination)[0] == ['G2']
+
+    #cores does not change the fits; the grid does
+    with open(os.path.join(destination, 'pcigale.ini'), 'w') as file:
+        file.write('data_file = galaxy_data.txt\ncores = 8\nsfh_module = sfh2exp\n')
+    assert changed_galaxies(destination)[0] == ['G2']
+    with open(os.path.join(destination, 'pcigale.ini'), 'w') as file:
+        file.write('data_file = galaxy_data.txt\ncores = 8\nsfh_module = sfhdelayed\n')
+    assert changed_galaxies(destination)[0] is None
+
+
+def test_merge_incremental_output(tmp_path):
+    destination = str(tmp_path)
+    write_data(destination, [0.01, 0.02, 0.03, 0.04, 0.05])
+    write_out(os.path.join(destination, 'out'), ids, 'old')
+
+    #G2 and G4 were refit
+    work_dir = os.path.join(destination, 'incremental')
+    write_out(os.path.join(work_dir, 'out'), ['G4', 'G2'], 'new')
+
+    out_dir = merge_incremental_output(destination, work_dir, {'G1', 'G_3', 'G5'})
+
+    for name in ['results.fits', 'observations.fits']:
+        merged = Table.read(os.path.join(out_dir, name))
+        assert [str(galaxy_id) for galaxy_id in merged['id']] == ids
+        assert [str(run) for run in merged['run']] == ['old', 'new', 'old', 'new', 'old']
+
+    #per-galaxy files: the kept galaxies' from the previous out/, the refit galaxies' from this run
+    for galaxy_id, label in zip(ids, ['old', 'new', 'old', 'new', 'old']):
+        assert read_text(os.path.join(out_dir, 'best_SED_models', f'{galaxy_id}_best_model.pdf')) == label
+        assert read_text(os.path.join(out_dir, f'{galaxy_id}_sfh.sfr.fits')) == label
+
+    #the previous out/ was rotated, keeping only what was not carried over
+    previous = [name for name in os.listdir(destination) if name.endswith('_out')]
+    assert len(previous) == 1
+    assert sorted(os.listdir(os.path.join(destination, previous[0], 'best_SED_models'))) == \
+           ['G2_best_model.pdf', 'G4_best_model.pdf']
+    assert all(os.path.exists(os.path.join(destination, previous[0], name))
+               for name in ['results.fits', 'observations.fits'])
@@ -0,0 +1,48 @@
+'''
+shard_groups: every row in exactly one shard, and with by='redshift' no redshift (model grid) shared by two shards.
+'''
+
+import numpy as np
+import pytest
+
+from shard_utils import shard_groups
+from redshift_bin_utils import quantize_redshifts
+
+header = ['# id redshift FUV FUV_err \n']
+
+
+def make_rows(redshifts):
+    return [f'{n} {z} 1.0 0.1 \n' for n, z in enumerate(redshifts)]
+
+
+def shard_redshifts(rows, groups):
+    return [{float(rows[i].split()[1]) for i in group} for group in groups]
+
+
+@pytest.mark.parametrize('by', ['rows', 'redshift', 'region'])
+def test_every_row_once(by):
+    rows = make_rows(np.round(np.random.default_rng(0).uniform(0.001, 0.1, 101), 4))
+    groups = shard_groups(header, rows, 4, by=by)
+    assert sorted(np.concatenate(groups).tolist()) == list(range(len(rows)))
+
+
+@pytest.mark.parametrize('nshards', [2, 3, 5, 40])
+def test_redshift_shards_hold_whole_bins(nshards):
+    redshifts = quantize_redshifts(np.random.default_rng(1).uniform(0.001, 0.1, 500), 0.005)
+    rows = make_rows(redshifts)
+    groups = shard_groups(header, rows, nshards, by='redshift')
+
+    assert sorted(np.concatenate(groups).tolist()) == list(range(len(rows)))
+    assert all(len(group) for group in groups)
+    assert len(groups) <= min(nshards, len(np.unique(redshifts)))
+
+    #no redshift in two shards, and shards hold contiguous redshift ranges
+    per_shard = shard_redshifts(rows, groups)
+    assert sum(len(zs) for zs in per_shard) == len(np.unique(redshifts))
+    assert all(max(a) < min(b) for a, b in zip(per_shard[:-1], per_shard[1:]))
+
+
+def test_redshift_shards_single_redshift():
+    rows = make_rows([0.02] * 10)
+    groups = shard_groups(header, rows, 3, by='redshift')
+    assert len(groups) == 1 and len(groups[0]) == 10
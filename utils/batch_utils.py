@@ -0,0 +1,225 @@
+'''
+Batch driver for tiled (brick) catalogs such as SGA2025: dr9-north/234/23490p5933/SGA2025_23490p5933-ephot.fits
+
+The brick that path_to_repos points at in params.txt serves as the template: every directory under brick_root
+holding a file named like phot_table (with the template brick ID swapped for the directory name) is a brick.
+Bricks are named by their path under brick_root (e.g. dr9-north/234/23490p5933), so a brick ID found in two
+trees (north and south) stays two bricks, with two ledger entries and two directories under bricks/.
+
+    1. inputs  -- galaxy_data.txt of every brick, built by batch_workers processes (each handles many bricks,
+                  so Python/astropy start up once per worker rather than once per brick) in
+                  {destination}/bricks/{brick}/. a galaxy_bricks.txt sidecar records each galaxy's brick.
+    2. fit     -- per_brick: CIGALE runs in every brick directory, side by side under cpu_budget cores.
+                  combined:  the bricks are concatenated into {destination}/galaxy_data.txt (+ galaxy_bricks.txt)
+                             and fit as one catalog by the usual pipeline stages.
+
+Progress goes to {destination}/batch_ledger.txt (one line per brick and step; the latest line wins), so an
+interrupted batch picks up where it stopped.
+'''
+
+import os
+import sys
+import copy
+import time
+from datetime import datetime
+from multiprocessing import Pool
+
+from init_utils import create_flux_table, create_ini_files, add_params
+from ini_utils import generate_pcigale_ini
+from shard_utils import read_galaxy_data, data_redshifts, run_shards
+from tuning_utils import apply_auto_tuning
+
+ledger_name = 'batch_ledger.txt'
+provenance_name = 'galaxy_bricks.txt'
+
+#ledger statuses of bricks whose galaxy_data.txt is written (a failed fit is retried from the same inputs)
+inputs_ready = ('inputs_written', 'fitted', 'fit_failed')
+
+
+###################
+# Find the bricks #
+###################
+
+def template_brick(params):
+    #brick ID of the directory path_to_repos points at, e.g. '23490p5933'
+    return os.path.basename(os.path.normpath(params.path_to_repos))
+
+
+def brick_table_name(table_name, template, brick):
+    return table_name.replace(template, brick) if template else table_name
+
+
+def brick_id(brick):
+    #'dr9-north/234/23490p5933' --> '23490p5933', the ID in the brick's table names
+    return os.path.basename(os.path.normpath(brick))
+
+
+def find_bricks(params):
+    '''
+    returns {brick: brick directory} for every directory under brick_root that holds this brick's photometry.
+    brick is the directory's path relative to brick_root.
+    '''
+    template = template_brick(params)
+    bricks = {}
+    for dir_path, _, file_names in os.walk(params.brick_root):
+        if brick_table_name(params.phot_table, template, brick_id(dir_path)) in file_names:
+            brick = os.path.relpath(dir_path, params.brick_root)
+            bricks[brick_id(dir_path) if brick == '.' else brick] = dir_path + '/'
+    return dict(sorted(bricks.items()))
+
+
+def brick_params(params, brick, brick_dir):
+    #Params reading this brick's tables and writing into {destination}/bricks/{brick}/
+    template = template_brick(params)
+    brick_name = brick_id(brick)
+    bparams = copy.copy(params)
+    for key in ['main_tab', 'flux_tab', 'ext_tab']:
+        vars(bparams).pop(key, None)   #drop tables already loaded (cached_property) for the template brick
+    bparams._table_cache = {}
+
+    bparams.path_to_repos = brick_dir
+    bparams.main_table = brick_table_name(params.main_table, template, brick_name)
+    bparams.phot_table = brick_table_name(params.phot_table, template, brick_name)
+    bparams.extinction_table = brick_table_name(params.extinction_table, template, brick_name)
+    bparams.dir_path = bparams.destination = os.path.join(params.destination, 'bricks', brick)
+    return bparams
+
+
+##########
+# Ledger #
+##########
+
+def write_ledger(destination, brick, status, note=''):
+    with open(os.path.join(destination, ledger_name), 'a') as file:
+        file.write(f'{brick} {status} {datetime.now().strftime("%Y-%m-%dT%H:%M:%S")} {note}'.rstrip() + '\n')
+
+
+def read_ledger(destination):
+    #{brick: latest status}
+    path = os.path.join(destination, ledger_name)
+    statuses = {}
+    if os.path.exists(path):
+        with open(path) as file:
+            for line in file:
+                if line.strip():
+                    brick, status = line.split()[:2]
+                    statuses[brick] = status
+    return statuses
+
+
+################
+# Brick inputs #
+################
+
+def _build_brick_input(args):
+    #worker: galaxy_data.txt for one brick. returns (brick, number of galaxies or None, error message)
+    params, brick, brick_dir = args
+    bparams = brick_params(params, brick, brick_dir)
+    try:
+        os.makedirs(bparams.dir_path, exist_ok=True)
+        bparams.load_columns()
+        create_flux_table(bparams)
+        return brick, len(data_redshifts(os.path.join(bparams.dir_path, bparams.data_file))), ''
+    except Exception as error:
+        return brick, None, f'{type(error).__name__}: {error}'
+
+
+def build_brick_inputs(params, bricks):
+    '''
+    write galaxy_data.txt for every brick the ledger does not already list as done, using batch_workers
+    processes. returns the bricks whose inputs are ready.
+    '''
+    statuses = read_ledger(params.destination)
+    todo = [(params, brick, brick_dir) for brick, brick_dir in bricks.items()
+            if statuses.get(brick) not in inputs_ready]
+    print(f'{len(bricks)} bricks found, {len(bricks) - len(todo)} already have their inputs.')
+
+    if todo:
+        t0 = time.perf_counter()
+        with Pool(max(1, min(params.batch_workers, len(todo)))) as pool:
+            for n, (brick, n_galaxies, error) in enumerate(pool.imap_unordered(_build_brick_input, todo), 1):
+                if n_galaxies is None:
+                    write_ledger(params.destination, brick, 'inputs_failed', error)
+                    print(f'[{n}/{len(todo)}] {brick}: FAILED ({error})')
+                else:
+                    write_ledger(params.destination, brick, 'inputs_written', f'{n_galaxies}')
+                    print(f'[{n}/{len(todo)}] {brick}: {n_galaxies} galaxies')
+        print(f'Inputs written in {time.perf_counter() - t0:.1f} s')
+
+    return ready_bricks(params, bricks)
+
+
+def ready_bricks(params, bricks):
+    #bricks whose galaxy_data.txt is written, according to the ledger (including failed fits, to retry them)
+    statuses = read_ledger(params.destination)
+    return [brick for brick in bricks if statuses.get(brick) in inputs_ready]
+
+
+def combine_brick_inputs(params, bricks):
+    '''
+    concatenate the bricks' galaxy_data.txt into {destination}/galaxy_data.txt, and write the brick of every
+    galaxy to {destination}/galaxy_bricks.txt. galaxy IDs must be unique across the bricks.
+    '''
+    header, seen = None, {}
+    with open(os.path.join(params.destination, 'galaxy_data.txt'), 'w') as data_file, \
+         open(os.path.join(params.destination, provenance_name), 'w') as brick_file:
+        brick_file.write('# id brick\n')
+        for brick in bricks:
+            brick_header, rows = read_galaxy_data(os.path.join(params.destination, 'bricks', brick, 'galaxy_data.txt'))
+            if header is None:
+                header = brick_header
+                data_file.writelines(header)
+            for row in rows:
+                galaxy_id = row.split(maxsplit=1)[0]
+                if galaxy_id in seen:
+                    print(f'Galaxy ID {galaxy_id} is in bricks {seen[galaxy_id]} and {brick}. '
+                          'Use batch_mode per_brick for catalogs whose IDs are only unique within a brick. exiting.')
+                    sys.exit()
+                seen[galaxy_id] = brick
+                data_file.write(row)
+                brick_file.write(f'{galaxy_id} {brick}\n')
+
+    print(f'{len(seen)} galaxies from {len(bricks)} bricks written to {params.destination}galaxy_data.txt')
+
+
+##############
+# Brick fits #
+##############
+
+def prepare_brick_fit(params, brick):
+    #pcigale.ini for one brick directory (genconf output comes from the cache after the first brick)
+    bparams = brick_params(params, brick, None)
+    bparams.ncores = 1 if params.auto_ncores else params.ncores
+    bparams.auto_ncores = False
+
+    create_ini_files(bparams)
+    generate_pcigale_ini(bparams.dir_path, params.genconf_cache)
+    add_params(bparams.dir_path, params.sed_plots, params.lim_flag, 1 if params.auto_nblocks else params.nblocks,
+               create_pdfs=params.create_pdfs)
+    if bparams.auto_nblocks:
+        apply_auto_tuning(bparams)
+    return bparams.dir_path
+
+
+def fit_bricks(params, bricks):
+    '''
+    run CIGALE in every brick directory not yet fitted, at most cpu_budget cores at once.
+    auto ncores --> one core per brick (many bricks side by side keep every core busy anyway).
+    '''
+    statuses = read_ledger(params.destination)
+    todo = [brick for brick in bricks if statuses.get(brick) != 'fitted']
+    print(f'{len(bricks) - len(todo)} of {len(bricks)} bricks already fitted.')
+    if not todo:
+        return
+
+    brick_dirs = {prepare_brick_fit(params, brick): brick for brick in todo}
+
+    cores = 1 if (params.auto_ncores or params.create_pdfs) else int(params.ncores)
+    timings = {}
+    return_codes = run_shards(list(brick_dirs), params.cpu_budget, cores, timings)
+
+    for brick_dir, brick in brick_dirs.items():
+        if return_codes[brick_dir] == 0:
+            write_ledger(params.destination, brick, 'fitted', f'{timings[brick_dir]:.1f}s')
+        else:
+            write_ledger(params.destination, brick, 'fit_failed', f'return code {return_codes[brick_dir]}')
@@ -1,4 +1,5 @@
 import os
+from organize_utils import organize_output
 
 ##################################
 # Run CIGALE -- helper functions #
@@ -25,21 +26,11 @@ def run_sed_plots(dir_path):
     os.system('pcigale-plots sed')
 
     
-def organize_sed_output(dir_path, main_tab, out_dir_name):
+def organize_sed_output(dir_path, main_tab=None, out_dir_name='out', archive='none'):
     
-    os.chdir(os.path.join(dir_path, out_dir_name))
-    print(os.path.join(dir_path, out_dir_name))
+    #best model .fits and SFH files are removed; the best model plots go to best_SED_models/ (or its archive)
+    counts = organize_output(os.path.join(dir_path, out_dir_name), ['best_model_fits', 'best_model', 'sfh'],
+                             delete_kinds=('best_model_fits', 'sfh'), archive=archive)
     
-    print(os.listdir())
-    
-    #create directory for best SED models
-    os.makedirs('best_SED_models', exist_ok=True)
-    
-    #remove old best model fits files
-    os.system('rm *best_model*.fits')
-    
-    #move best model fits files into folder
-    os.system('mv *best_model* best_SED_models')
-    
-    #remove all SFH fits files
-    os.system('rm *_SFH*')
\ No newline at end of file
+    print(f"{counts['best_model']} best model plots kept, "
+          f"{counts['best_model_fits'] + counts['sfh']} best model/SFH .fits files removed")
@@ -0,0 +1,217 @@
+'''
+Compare CIGALE results.fits against external catalogs (MAGPHYS, alternative photometry runs, ...).
+
+Rows are joined through a sorted ID index (argsort + searchsorted, O(N log N)) or, optionally, by sky
+position within a matching radius (a KD-tree through astropy + scipy, or declination windows without scipy). Residual statistics for stellar mass and SFR are computed on whole
+columns at once.
+'''
+
+import numpy as np
+from astropy.table import Table
+
+
+####################
+# Match on the IDs #
+####################
+
+def normalize_ids(ids):
+    #bytes / numbers / padded strings --> stripped str, so that 'VFID0001' matches b'VFID0001 '
+    ids = np.asarray(ids)
+    if ids.dtype.kind == 'S':
+        ids = np.char.decode(ids, 'utf-8')
+    return np.char.strip(ids.astype(str))
+
+
+class IDIndex():
+    '''
+    sorted index of one catalog's IDs. lookup() returns, for every query ID, the row in that catalog
+    (or -1 if absent). duplicate IDs in the indexed catalog resolve to their first row.
+    '''
+
+    def __init__(self, ids):
+        ids = normalize_ids(ids)
+        self.order = np.argsort(ids, kind='stable')
+        self.sorted_ids = ids[self.order]
+
+    def lookup(self, query_ids):
+        query_ids = normalize_ids(query_ids)
+        if not len(self.sorted_ids):
+            return np.full(len(query_ids), -1)
+        position = np.searchsorted(self.sorted_ids, query_ids)
+        position = np.clip(position, 0, len(self.sorted_ids) - 1)
+        found = self.sorted_ids[position] == query_ids
+        return np.where(found, self.order[position], -1)
+
+
+def match_ids(ids_a, ids_b):
+    #returns (rows of a, rows of b) of every ID found in both, in the order of a
+    rows_b = IDIndex(ids_b).lookup(ids_a)
+    rows_a = np.flatnonzero(rows_b >= 0)
+    return rows_a, rows_b[rows_a]
+
+
+####################
+# Match on the sky #
+####################
+
+def angular_separation(ra1, dec1, ra2, dec2):
+    #degrees in, arcsec out (haversine; accurate at small separations)
+    ra1, dec1, ra2, dec2 = map(np.radians, (ra1, dec1, ra2, dec2))
+    a = np.sin((dec2 - dec1) / 2)**2 + np.cos(dec1) * np.cos(dec2) * np.sin((ra2 - ra1) / 2)**2
+    return np.degrees(2 * np.arcsin(np.sqrt(np.clip(a, 0, 1)))) * 3600
+
+
+def match_sky(ra_a, dec_a, ra_b, dec_b, radius_arcsec=3., chunk_size=100000):
+    '''
+    nearest b within radius_arcsec for every a, through astropy's KD-tree matcher (SkyCoord.match_to_catalog_sky).
+    that needs scipy; without it, match_sky_windows is used instead. rows without a finite position never match.
+    returns (rows of a, rows of b, separations in arcsec).
+    '''
+    try:
+        import scipy.spatial   #match_to_catalog_sky builds its KD-tree with scipy
+    except ImportError:
+        return match_sky_windows(ra_a, dec_a, ra_b, dec_b, radius_arcsec, chunk_size)
+    from astropy.coordinates import SkyCoord
+
+    ra_a, dec_a = np.asarray(ra_a, dtype=float), np.asarray(dec_a, dtype=float)
+    ra_b, dec_b = np.asarray(ra_b, dtype=float), np.asarray(dec_b, dtype=float)
+
+    good_a = np.flatnonzero(np.isfinite(ra_a) & np.isfinite(dec_a))
+    good_b = np.flatnonzero(np.isfinite(ra_b) & np.isfinite(dec_b))
+    if not (len(good_a) and len(good_b)):
+        return np.array([], int), np.array([], int), np.array([])
+
+    nearest, sep, _ = SkyCoord(ra_a[good_a], dec_a[good_a], unit='deg').match_to_catalog_sky(
+                          SkyCoord(ra_b[good_b], dec_b[good_b], unit='deg'))
+    sep = sep.arcsec
+    close = sep <= radius_arcsec
+    return good_a[close], good_b[nearest[close]], sep[close]
+
+
+def match_sky_windows(ra_a, dec_a, ra_b, dec_b, radius_arcsec=3., chunk_size=100000):
+    '''
+    same as match_sky, with numpy only. b is sorted by declination once; each a only looks at the b rows
+    inside its declination window (searchsorted), and all candidate pairs of a chunk are tested at once.
+    '''
+    ra_a, dec_a = np.asarray(ra_a, dtype=float), np.asarray(dec_a, dtype=float)
+    ra_b, dec_b = np.asarray(ra_b, dtype=float), np.asarray(dec_b, dtype=float)
+
+    order = np.argsort(dec_b, kind='stable')
+    dec_sorted = dec_b[order]
+    radius_deg = radius_arcsec / 3600
+
+    rows_a, rows_b, separations = [], [], []
+    for start in range(0, len(ra_a), chunk_size):
+        a = np.arange(start, min(start + chunk_size, len(ra_a)))
+        lo = np.searchsorted(dec_sorted, dec_a[a] - radius_deg, side='left')
+        hi = np.searchsorted(dec_sorted, dec_a[a] + radius_deg, side='right')
+        n_candidates = hi - lo
+        if not n_candidates.sum():
+            continue
+
+        #every (a, candidate b) pair of this chunk, flattened
+        pair_a = np.repeat(a, n_candidates)
+        offsets = np.arange(n_candidates.sum()) - np.repeat(np.cumsum(n_candidates) - n_candidates, n_candidates)
+        pair_b = order[np.repeat(lo, n_candidates) + offsets]
+        sep = angular_separation(ra_a[pair_a], dec_a[pair_a], ra_b[pair_b], dec_b[pair_b])
+
+        close = sep <= radius_arcsec
+        pair_a, pair_b, sep = pair_a[close], pair_b[close], sep[close]
+
+        #nearest b per a: sort by (a, separation) and keep the first pair of each a
+        nearest = np.lexsort((sep, pair_a))
+        first = np.concatenate([[True], np.diff(pair_a[nearest]) != 0]) if len(nearest) else np.array([], bool)
+        keep = nearest[first]
+        rows_a.append(pair_a[keep])
+        rows_b.append(pair_b[keep])
+        separations.append(sep[keep])
+
+    if not rows_a:
+        return np.array([], int), np.array([], int), np.array([])
+    return np.concatenate(rows_a), np.concatenate(rows_b), np.concatenate(separations)
+
+
+def unique_matches(rows_a, rows_b, separations):
+    '''
+    match_sky pairs every a with its nearest b, so one b can be matched to several a. keep only the nearest
+    a of every b. returns (rows of a, rows of b, separations, number of a rows dropped), in the order of a.
+    '''
+    order = np.lexsort((separations, rows_b))
+    first = np.concatenate([[True], np.diff(rows_b[order]) != 0]) if len(order) else np.array([], bool)
+    keep = np.sort(order[first])
+    return rows_a[keep], rows_b[keep], separations[keep], len(rows_a) - len(keep)
+
+
+#############
+# Join them #
+#############
+
+def join_catalogs(results, catalog, catalog_id_col='VFID', results_id_col='id',
+                  sky=None, radius_arcsec=3.):
+    '''
+    returns (matched rows of results, matched rows of catalog) as two row-aligned Tables.
+    sky = (results RA, results DEC, catalog RA column, catalog DEC column) --> match by position instead of ID.
+    '''
+    if sky is None:
+        rows_results, rows_catalog = match_ids(results[results_id_col], catalog[catalog_id_col])
+    else:
+        ra, dec, ra_col, dec_col = sky
+        rows_results, rows_catalog, _ = match_sky(ra, dec, catalog[ra_col], catalog[dec_col], radius_arcsec)
+
+    print(f'{len(rows_results)} of {len(results)} results matched to the catalog ({len(catalog)} rows).')
+    return results[rows_results], catalog[rows_catalog]
+
+
+#######################
+# Residual statistics #
+#######################
+
+def residual_stats(x_ref, x):
+    '''
+    statistics of x - x_ref over the rows where both are finite: count, median, mean, standard deviation,
+    normalized median absolute deviation, and the fraction of |residual| > 0.3 (dex, for log quantities)
+    '''
+    residuals = np.asarray(x, dtype=float) - np.asarray(x_ref, dtype=float)
+    residuals = residuals[np.isfinite(residuals)]
+    if not len(residuals):
+        return {'n': 0, 'median': np.nan, 'mean': np.nan, 'std': np.nan, 'nmad': np.nan, 'outlier_frac': np.nan}
+
+    median = np.median(residuals)
+    return {'n': len(residuals),
+            'median': median,
+            'mean': np.mean(residuals),
+            'std': np.std(residuals),
+            'nmad': 1.4826 * np.median(np.abs(residuals - median)),
+            'outlier_frac': np.mean(np.abs(residuals) > 0.3)}
+
+
+def log10_positive(values):
+    #log10 with non-positive values --> nan instead of warnings
+    values = np.asarray(values, dtype=float)
+    out = np.full(values.shape, np.nan)
+    np.log10(values, out=out, where=values > 0)
+    return out
+
+
+#results.fits column (linear) --> default catalog column (already log10, as in the MAGPHYS catalog)
+compare_columns = {'logMstar': ('bayes.stellar.m_star', 'MAGPHYS_logMstar_med'),
+                   'logSFR': ('bayes.sfh.sfr', 'MAGPHYS_logSFR_med')}
+
+
+def compare_mass_sfr(results, catalog, columns=compare_columns, catalog_is_log=True):
+    '''
+    results and catalog must already be row-aligned (see join_catalogs). returns a Table with one row
+    per quantity: CIGALE - catalog residual statistics, in dex.
+    '''
+    rows = []
+    for label, (results_col, catalog_col) in columns.items():
+        cigale = log10_positive(results[results_col])
+        reference = np.asarray(catalog[catalog_col], dtype=float)
+        if not catalog_is_log:
+            reference = log10_positive(reference)
+        rows.append({'quantity': label, **residual_stats(reference, cigale)})
+
+    stats = Table(rows=rows)
+    for column in ['median', 'mean', 'std', 'nmad', 'outlier_frac']:
+        stats[column].format = '.4f'
+    return stats
@@ -31,16 +31,34 @@ def apply_extinction(flux, ext_values, transmission_to_extinction=True):
 ##############################
 # Error floor for fluxes #
 ##############################
-def apply_error_floor(fluxes, errs, band):
+def error_floor_frac(band):
+    #10% for grz; 13% for FUV, NUV, W1-4
     if band in ['FUV','NUV','W1','W2','W3','W4']:
-        frac = 0.13
-    else:
-        frac = 0.10
+        return 0.13
+    return 0.10
+
+
+def apply_error_floor(fluxes, errs, band):
+    frac = error_floor_frac(band)
     mask = (errs / np.abs(fluxes)) < frac
     errs[mask] = np.abs(frac * fluxes[mask])
     return errs
 
 
+def apply_error_floor_2d(fluxes, errs, bands):
+    """
+    Same as apply_error_floor, but for a stacked (galaxy x band) array in one pass.
+    - fluxes, errs: 2-D arrays with one column per band
+    - bands: list of band names, in column order
+    """
+    #keep the floors in the flux dtype so float32 tables round exactly as the per-band version
+    fracs = np.array([error_floor_frac(band) for band in bands], dtype=fluxes.dtype)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mask = (errs / np.abs(fluxes)) < fracs
+    errs[mask] = np.abs(fracs * fluxes)[mask]
+    return errs
+
+
 def clip_negative_outliers(fluxes, errs):
     mask = (fluxes<0.) & ~((0.<(fluxes+4*errs)) & (0.>(fluxes-4*errs)))
     fluxes[mask] = np.nan
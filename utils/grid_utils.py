@@ -0,0 +1,222 @@
+'''
+Model-grid planning for a rendered pcigale.ini: number of models per SED module and in total, memory
+per block, and a wall-time prediction calibrated on earlier runs -- all before CIGALE is launched.
+'''
+
+import os
+import re
+import json
+import numpy as np
+
+from shard_utils import data_redshifts
+
+
+#####################
+# Parse pcigale.ini #
+#####################
+
+def parse_values(value):
+    #'1e3, 3e3, 5e3' --> ['1e3', '3e3', '5e3'];  '' --> []
+    return [x.strip() for x in value.split(',') if x.strip()]
+
+
+def parse_pcigale_ini(ini_path):
+    '''
+    returns {'general': {key: [values]}, 'sed_modules_params': {module: {key: [values]}},
+             'analysis_params': {key: [values]}}
+    '''
+    config = {'general': {}, 'sed_modules_params': {}, 'analysis_params': {}}
+    section = config['general']
+
+    with open(ini_path) as file:
+        for line in file:
+            line = line.split('#')[0].strip()
+            if not line:
+                continue
+
+            #[[module]] sub-section
+            subsection = re.match(r'^\[\[\s*(.+?)\s*\]\]$', line)
+            if subsection:
+                section = config['sed_modules_params'].setdefault(subsection.group(1), {})
+                continue
+
+            #[section]
+            main_section = re.match(r'^\[\s*(.+?)\s*\]$', line)
+            if main_section:
+                section = config.setdefault(main_section.group(1), {})
+                continue
+
+            if '=' in line:
+                key, value = line.split('=', 1)
+                section[key.strip()] = parse_values(value)
+
+    return config
+
+
+def as_floats(values):
+    return np.array([float(x) for x in values])
+
+
+##############
+# Grid sizes #
+##############
+
+#(parameter, parameter that it must be smaller than) for each SFH module. CIGALE drops the other combinations.
+sfh_age_rules = {'sfh2exp': ('burst_age', 'age'),
+                 'sfhdelayed': ('age_burst', 'age_main')}
+
+
+def count_module_models(module_params):
+    #Cartesian product of every parameter list in one module
+    return int(np.prod([max(1, len(values)) for values in module_params.values()]))
+
+
+def count_invalid_sfh(config):
+    '''
+    returns (number of SFH parameter combinations, number CIGALE would drop because the burst is not younger
+    than the main population), or (combinations, 0) if the SFH module has no such rule.
+    '''
+    for module, (burst_key, age_key) in sfh_age_rules.items():
+        module_params = config['sed_modules_params'].get(module)
+        if module_params is None or burst_key not in module_params or age_key not in module_params:
+            continue
+
+        n_total = count_module_models(module_params)
+        burst, age = as_floats(module_params[burst_key]), as_floats(module_params[age_key])
+        n_bad_pairs = np.sum(burst[:, None] >= age[None, :])
+
+        #every other SFH parameter multiplies each (burst, age) pair equally
+        return n_total, int(n_total * n_bad_pairs / (len(burst) * len(age)))
+
+    return None, 0
+
+
+def count_redshifts(data_path, redshift_decimals=2):
+    #CIGALE builds one model grid per distinct (rounded) redshift of the input catalog
+    redshifts = data_redshifts(data_path)
+    nrows = len(redshifts)
+    if redshift_decimals >= 0:
+        redshifts = np.round(redshifts, redshift_decimals)
+    return len(np.unique(redshifts)), nrows
+
+
+def plan_grid(ini_path, data_path=None):
+    '''
+    summary dictionary of the model grid defined by a rendered pcigale.ini (and, optionally, its data file)
+    '''
+    config = parse_pcigale_ini(ini_path)
+    analysis = config['analysis_params']
+
+    modules = config['general'].get('sed_modules', [])
+    models_per_module = {module: count_module_models(config['sed_modules_params'].get(module, {}))
+                         for module in modules}
+
+    #'redshift = ' left empty --> redshifts come from the data file
+    redshifting = config['sed_modules_params'].get('redshifting', {})
+    models_per_module.pop('redshifting', None)
+    models_per_z = int(np.prod(list(models_per_module.values()))) if models_per_module else 0
+
+    n_sfh, n_invalid_sfh = count_invalid_sfh(config)
+    if n_sfh:
+        models_per_z = int(models_per_z * (1 - n_invalid_sfh / n_sfh))
+
+    n_redshifts, n_galaxies = (len(redshifting.get('redshift', [])) or 1), None
+    if data_path is not None and not redshifting.get('redshift'):
+        decimals = int(analysis.get('redshift_decimals', ['2'])[0])
+        n_redshifts, n_galaxies = count_redshifts(data_path, decimals)
+
+    nblocks = int(analysis.get('blocks', ['1'])[0])
+    ncores = int(config['general'].get('cores', ['1'])[0])
+
+    #one float64 per model for every band, variable and a few bookkeeping arrays (rough, but scales right)
+    n_bands = len([band for band in config['general'].get('bands', []) if not band.endswith('_err')])
+    n_variables = len(analysis.get('variables', []))
+    bytes_per_model = 8 * (n_bands + n_variables + 4)
+    models_total = models_per_z * n_redshifts
+
+    return {'models_per_module': models_per_module,
+            'sfh_combinations': n_sfh,
+            'sfh_combinations_dropped': n_invalid_sfh,
+            'models_per_redshift': models_per_z,
+            'n_redshifts': n_redshifts,
+            'models_total': models_total,
+            'n_galaxies': n_galaxies,
+            'nblocks': nblocks,
+            'ncores': ncores,
+            'bytes_per_model': bytes_per_model,
+            'bytes_per_block': int(np.ceil(models_total / nblocks)) * bytes_per_model}
+
+
+#############
+# Wall time #
+#############
+
+#cost terms of a run: building every model, and comparing each galaxy against the models at its redshift
+def cost_terms(plan):
+    n_galaxies = plan['n_galaxies'] or 0
+    return np.array([plan['models_total'], plan['models_per_redshift'] * n_galaxies]) / max(1, plan['ncores'])
+
+
+def add_calibration(calibration_path, plan, wall_seconds):
+    #append a finished run (its plan + measured wall time in seconds) to the calibration file
+    runs = []
+    if os.path.exists(calibration_path):
+        with open(calibration_path) as file:
+            runs = json.load(file)
+    runs.append({'terms': list(cost_terms(plan)), 'seconds': wall_seconds})
+    with open(calibration_path, 'w') as file:
+        json.dump(runs, file, indent=1)
+
+
+def predict_walltime(calibration_path, plan):
+    '''
+    predicted wall time in seconds (None without calibration). with one calibration run, both cost terms share
+    a single rate; with two or more, each gets its own (non-negative least-squares) rate.
+    '''
+    if not os.path.exists(calibration_path):
+        return None
+    with open(calibration_path) as file:
+        runs = json.load(file)
+    if not runs:
+        return None
+
+    terms = np.array([run['terms'] for run in runs])
+    seconds = np.array([run['seconds'] for run in runs])
+
+    if len(runs) == 1:
+        rate = seconds[0] / max(terms[0].sum(), 1)
+        return float(rate * cost_terms(plan).sum())
+
+    rates = np.clip(np.linalg.lstsq(terms, seconds, rcond=None)[0], 0, None)
+    return float(rates @ cost_terms(plan))
+
+
+##########
+# Report #
+##########
+
+def format_bytes(n_bytes):
+    for unit in ['B', 'kB', 'MB', 'GB', 'TB']:
+        if n_bytes < 1024:
+            return f'{n_bytes:.1f} {unit}'
+        n_bytes /= 1024
+    return f'{n_bytes:.1f} PB'
+
+
+def print_plan(plan, predicted_seconds=None):
+    print('\n###################### Model grid ######################')
+    for module, n_models in plan['models_per_module'].items():
+        print(f'{module:<25} {n_models:>12,d} models')
+    if plan['sfh_combinations_dropped']:
+        print(f'SFH combinations with burst age >= main age (dropped by CIGALE): '
+              f'{plan["sfh_combinations_dropped"]:,d} of {plan["sfh_combinations"]:,d}')
+    print(f'{"models per redshift":<25} {plan["models_per_redshift"]:>12,d}')
+    print(f'{"distinct redshifts":<25} {plan["n_redshifts"]:>12,d}')
+    print(f'{"models in total":<25} {plan["models_total"]:>12,d}')
+    if plan['n_galaxies'] is not None:
+        print(f'{"galaxies":<25} {plan["n_galaxies"]:>12,d}')
+    print(f'{"memory per block":<25} {format_bytes(plan["bytes_per_block"]):>12} '
+          f'({plan["nblocks"]} blocks, {plan["ncores"]} cores)')
+    if predicted_seconds is not None:
+        print(f'{"predicted wall time":<25} {predicted_seconds/3600:>10.2f} h')
+    print('########################################################\n')
@@ -0,0 +1,241 @@
+'''
+Incremental CIGALE runs: only galaxies whose input row (redshift, fluxes, errors) or whose model grid
+(pcigale.ini) changed since the last run are fit again; everyone else keeps their previous results.
+
+A manifest (out/manifest.txt) next to results.fits records the pcigale.ini grid hash and one hash per
+galaxy row of galaxy_data.txt.
+'''
+
+import os
+import re
+import shutil
+import hashlib
+import subprocess
+import numpy as np
+from astropy.table import Table, vstack
+
+from shard_utils import read_galaxy_data, run_shards, rotate_out_dir, stacked_outputs
+from shard_utils import split_galaxy_data, merge_shard_output
+from cigale_utils import organize_sed_output
+
+#pcigale.ini settings that do not change the fit results
+ignored_ini_keys = ['data_file', 'cores', 'blocks']
+
+
+##########
+# Hashes #
+##########
+
+def hash_galaxy_rows(data_path):
+    #{galaxy ID: hash of everything else on its galaxy_data.txt row}
+    _, rows = read_galaxy_data(data_path)
+    hashes = {}
+    for row in rows:
+        galaxy_id, values = row.split(maxsplit=1)
+        hashes[galaxy_id] = hashlib.sha1(' '.join(values.split()).encode()).hexdigest()
+    return hashes
+
+
+def grid_hash(ini_path):
+    #hash of the effective pcigale.ini: comments, blank lines, whitespace and ignored_ini_keys left out
+    sha = hashlib.sha1()
+    with open(ini_path) as file:
+        for line in file:
+            line = line.split('#')[0].strip()
+            if not line or any(re.match(fr'^{key}\s*=', line) for key in ignored_ini_keys):
+                continue
+            sha.update(' '.join(line.split()).encode() + b'\n')
+    return sha.hexdigest()
+
+
+############
+# Manifest #
+############
+
+def write_manifest(out_dir, row_hashes, ini_hash):
+    with open(os.path.join(out_dir, 'manifest.txt'), 'w') as file:
+        file.write(f'# grid {ini_hash}\n')
+        file.writelines(f'{galaxy_id} {row_hash}\n' for galaxy_id, row_hash in row_hashes.items())
+
+
+def read_manifest(out_dir):
+    #returns ({galaxy ID: row hash}, grid hash), or (None, None) if there is no manifest
+    path = os.path.join(out_dir, 'manifest.txt')
+    if not os.path.exists(path):
+        return None, None
+
+    row_hashes = {}
+    with open(path) as file:
+        ini_hash = file.readline().split()[-1]
+        for line in file:
+            galaxy_id, row_hash = line.split()
+            row_hashes[galaxy_id] = row_hash
+    return row_hashes, ini_hash
+
+
+def changed_galaxies(destination, out_dir_name='out', data_file='galaxy_data.txt'):
+    '''
+    compare galaxy_data.txt + pcigale.ini against the manifest of the previous run.
+    returns (IDs to fit, current row hashes, current grid hash). IDs to fit is None if everything must be refit.
+    '''
+    row_hashes = hash_galaxy_rows(os.path.join(destination, data_file))
+    ini_hash = grid_hash(os.path.join(destination, 'pcigale.ini'))
+
+    out_dir = os.path.join(destination, out_dir_name)
+    old_hashes, old_ini_hash = read_manifest(out_dir)
+
+    if (old_hashes is None) or (old_ini_hash != ini_hash) or not os.path.exists(os.path.join(out_dir, 'results.fits')):
+        return None, row_hashes, ini_hash
+
+    to_fit = [galaxy_id for galaxy_id, row_hash in row_hashes.items() if old_hashes.get(galaxy_id) != row_hash]
+    return to_fit, row_hashes, ini_hash
+
+
+#########################
+# Merge old + new output #
+#########################
+
+def move_galaxy_files(src_dir, dest_dir, galaxy_ids, subdirs=('best_SED_models', 'PDF_fits')):
+    #move every {galaxy_id}_* file (top level and the usual sub-directories) of the given galaxies
+    galaxy_ids = set(galaxy_ids)
+    for subdir in ('',) + tuple(subdirs):
+        src = os.path.join(src_dir, subdir)
+        if not os.path.isdir(src):
+            continue
+        with os.scandir(src) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                #galaxy IDs may contain '_' themselves, so try every '_' as the end of the ID
+                prefixes = [entry.name[:n] for n, char in enumerate(entry.name) if char == '_']
+                if any(prefix in galaxy_ids for prefix in prefixes):
+                    os.makedirs(os.path.join(dest_dir, subdir), exist_ok=True)
+                    os.rename(entry.path, os.path.join(dest_dir, subdir, entry.name))
+
+
+def merge_incremental_output(destination, work_dir, keep_ids, out_dir_name='out', data_file='galaxy_data.txt'):
+    '''
+    new out/ = previous results of the keep_ids galaxies + everything fit in work_dir, in galaxy_data.txt order.
+    the previous out/ is rotated to {timestamp}_out/ (and keeps whatever was not carried over).
+    '''
+    out_dir, previous_dir = rotate_out_dir(destination, out_dir_name)
+
+    _, rows = read_galaxy_data(os.path.join(destination, data_file))
+    input_order = {row.split(maxsplit=1)[0]: n for n, row in enumerate(rows)}
+
+    for table_name in stacked_outputs:
+        tables = []
+        if os.path.exists(os.path.join(previous_dir, table_name)):
+            old = Table.read(os.path.join(previous_dir, table_name))
+            tables.append(old[np.isin([str(x) for x in old['id']], list(keep_ids))])
+        if os.path.exists(os.path.join(work_dir, 'out', table_name)):
+            tables.append(Table.read(os.path.join(work_dir, 'out', table_name)))
+        if not tables:
+            continue
+        merged = vstack(tables)
+        order = np.argsort([input_order.get(str(galaxy_id), len(rows)) for galaxy_id in merged['id']], kind='stable')
+        merged[order].write(os.path.join(out_dir, table_name))
+
+    #per-galaxy files: unchanged galaxies from the previous run, refit galaxies from this one
+    move_galaxy_files(previous_dir, out_dir, keep_ids)
+    with os.scandir(os.path.join(work_dir, 'out')) as entries:
+        for entry in entries:
+            if entry.name in stacked_outputs:
+                continue
+            target = os.path.join(out_dir, entry.name)
+            #sub-directories (e.g., best_SED_models/) may already hold the carried-over galaxies' files
+            if entry.is_dir() and os.path.isdir(target):
+                with os.scandir(entry.path) as sub_entries:
+                    for sub_entry in sub_entries:
+                        os.rename(sub_entry.path, os.path.join(target, sub_entry.name))
+            else:
+                os.rename(entry.path, target)
+
+    return out_dir
+
+
+###################
+# Incremental run #
+###################
+
+def plot_refit_seds(work_dir):
+    #SED plots of the refit galaxies only: the unchanged ones keep their plots, and their best model .fits
+    #files (which pcigale-plots needs) were removed after the previous run. returns True if the plots were made.
+    with open(os.path.join(work_dir, 'cigale_plots.log'), 'w') as log:
+        return_code = subprocess.run(['pcigale-plots', 'sed'], cwd=work_dir, stdout=log,
+                                     stderr=subprocess.STDOUT).returncode
+    if return_code != 0:
+        print(f'pcigale-plots failed (return code {return_code}). See {work_dir}/cigale_plots.log.')
+        return False
+    organize_sed_output(work_dir)
+    return True
+
+
+def run_cigale_incremental(destination, cores=1, out_dir_name='out', data_file='galaxy_data.txt', nshards=1,
+                           by='rows', cpu_budget=None, sed_plots=False):
+    '''
+    fit only new or changed galaxies (or everyone, if pcigale.ini changed or there is no manifest),
+    merge them into the previous results, and write the new manifest.
+    the refit galaxies are split into nshards shards of cores cores each (at most cpu_budget cores at once),
+    as in run_cigale_sharded. with sed_plots, their SED plots are made before the merge (see plot_refit_seds).
+    '''
+    to_fit, row_hashes, ini_hash = changed_galaxies(destination, out_dir_name, data_file)
+
+    header, rows = read_galaxy_data(os.path.join(destination, data_file))
+
+    if to_fit is None:
+        print('No usable manifest (or pcigale.ini changed): fitting every galaxy.')
+        to_fit = list(row_hashes)
+    elif not to_fit:
+        print('All galaxies unchanged since the last run. Nothing to fit.')
+        out_dir = os.path.join(destination, out_dir_name)
+        old_hashes, _ = read_manifest(out_dir)
+        if set(old_hashes) == set(row_hashes):
+            return out_dir
+    else:
+        print(f'{len(to_fit)} of {len(rows)} galaxies are new or changed. Fitting only these.')
+
+    #CIGALE working directory holding only the galaxies to fit
+    work_dir = os.path.join(destination, 'incremental')
+    if os.path.isdir(work_dir):
+        shutil.rmtree(work_dir)
+    os.makedirs(work_dir)
+
+    fit_ids = set(to_fit)
+    with open(os.path.join(work_dir, data_file), 'w') as file:
+        file.writelines(header + [row for row in rows if row.split(maxsplit=1)[0] in fit_ids])
+    shutil.copy(os.path.join(destination, 'pcigale.ini.spec'), work_dir)
+    shutil.copy(os.path.join(destination, 'pcigale.ini'), work_dir)
+
+    if fit_ids:
+        if nshards > 1:
+            shard_dirs = split_galaxy_data(work_dir, nshards, data_file, by=by, cores_per_shard=cores)
+        else:
+            shard_dirs = [work_dir]
+        
+        return_codes = run_shards(shard_dirs, cpu_budget or os.cpu_count(), cores)
+        failed = [shard_dir for shard_dir in shard_dirs if return_codes[shard_dir] != 0]
+        if failed:
+            print('CIGALE failed in:', *failed, sep='\n    ')
+            print('See cigale.log in each directory. Previous results left untouched.')
+            return os.path.join(destination, out_dir_name)
+        
+        if nshards > 1:
+            merge_shard_output(shard_dirs, work_dir, data_file=data_file)
+        
+        if sed_plots:
+            plot_refit_seds(work_dir)
+    else:
+        os.makedirs(os.path.join(work_dir, 'out'))   #only removals --> nothing to fit
+
+    keep_ids = set(row_hashes) - fit_ids
+    if os.path.isdir(os.path.join(destination, out_dir_name)):
+        out_dir = merge_incremental_output(destination, work_dir, keep_ids, out_dir_name, data_file)
+    else:
+        out_dir = os.path.join(destination, out_dir_name)
+        os.rename(os.path.join(work_dir, 'out'), out_dir)
+
+    write_manifest(out_dir, row_hashes, ini_hash)
+    shutil.rmtree(work_dir)
+
+    return out_dir
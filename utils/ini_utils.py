@@ -0,0 +1,221 @@
+'''
+Structured pcigale.ini handling. The file is kept as an ordered list of lines plus an index of which
+(section, key) lives on which line, so our module parameters are set by section rather than by running
+a regex over every line.
+
+'pcigale genconf' is only needed to lay out the default parameters of a given set of SED modules. Its
+output is cached (keyed on sed_modules, analysis_method and the pcigale version), so repeat runs with the
+same modules skip the genconf subprocess and only re-render the run-specific lines: data_file, cores and
+the bands read from the galaxy_data file.
+'''
+
+import os
+import re
+import shutil
+import hashlib
+
+from cigale_utils import run_genconf
+from shard_utils import data_columns
+
+
+##################################################
+# The parameter values we use, by module/section #
+##################################################
+
+#different modules, different naming schemes...
+#sfhdelayed --> age_main, age_burst
+#sfh2exp --> age, burst_age
+#keyed by parameter name: every [[module]] section that has the key gets the value (sfhdelayedbq, dl2007,
+#themis, ... included), and keys a module does not have are simply left out of its section.
+module_param_values = {
+    'tau_main': '300, 500, 1000, 3000, 6000, 1e5',
+    'age': '1e3, 3e3, 5e3, 7e3, 1e4, 13000',
+    'age_main': '1e3, 3e3, 5e3, 7e3, 1e4, 13000',
+    'tau_burst': '100, 200, 400',
+    'burst_age': '20, 80, 200, 400, 800, 1e3',
+    'age_burst': '20, 80, 200, 400, 800, 1e3',
+    'f_burst': '0, 0.001, 0.005, 0.01, 0.05, 0.1',
+    'imf': '1',
+    'metallicity': '0.004, 0.02, 0.05',
+    'normalise': 'True',
+    'Av_ISM': '0.0, 0.01, 0.025, 0.03, 0.035, 0.04, 0.05, 0.06, 0.12, 0.15, 1.0, 1.3, 1.5, 1.8, 2.1, 2.4, 2.7, 3.0, 3.3',
+    'fracAGN': '0.0, 0.05, 0.1, 0.5',
+    'umin': '1.0, 5.0, 10.0',
+    'alpha': '1.0, 2.0, 2.8',
+    'gamma': '0.02, 0.1',
+}
+
+analysis_variables = ('sfh.sfr, stellar.m_star, stellar.metallicity, sfh.burst_age, sfh.age, sfh.f_burst, '
+                      'sfh.tau_burst, sfh.tau_main, agn.fracAGN, attenuation.Av_ISM, dust.mass')
+
+
+def analysis_param_values(sed_plots=False, lim_flag='noscaling', nblocks=1, create_pdfs=False):
+    values = {'variables': analysis_variables,
+              'blocks': nblocks,
+              'lim_flag': lim_flag}
+    if sed_plots:
+        values['save_best_sed'] = 'True'
+    if create_pdfs:
+        values['save_chi2'] = 'properties'
+    return values
+
+
+###############################
+# pcigale.ini as a line model #
+###############################
+
+class PcigaleIni():
+    '''
+    sections are () for the top level, ('analysis_params',), or ('sed_modules_params', module).
+    comments and layout are kept as genconf wrote them; only the lines that are set are rewritten.
+    '''
+
+    def __init__(self, lines):
+        self.lines = list(lines)
+        self._keys = {}
+        self.modules = []
+
+        section = ()
+        for n, line in enumerate(self.lines):
+            stripped = line.split('#')[0].strip()
+            subsection = re.match(r'^\[\[\s*(.+?)\s*\]\]$', stripped)
+            main_section = re.match(r'^\[\s*(.+?)\s*\]$', stripped)
+            if subsection:
+                section = (section[0] if section else '', subsection.group(1))
+                self.modules.append(subsection.group(1))
+            elif main_section:
+                section = (main_section.group(1),)
+            elif '=' in stripped:
+                self._keys[(section, stripped.split('=', 1)[0].strip())] = n
+
+    @classmethod
+    def read(cls, ini_path):
+        with open(ini_path) as file:
+            return cls(file.readlines())
+
+    def write(self, ini_path):
+        with open(ini_path, 'w') as file:
+            file.writelines(self.lines)
+
+    def __contains__(self, section_key):
+        return tuple(section_key) in self._keys
+
+    def get(self, key, section=()):
+        line = self.lines[self._keys[(tuple(section), key)]]
+        return line.split('#')[0].split('=', 1)[1].strip()
+
+    def set(self, key, value, section=()):
+        #returns False (and changes nothing) if the section has no such key
+        n = self._keys.get((tuple(section), key))
+        if n is None:
+            return False
+        line = self.lines[n]
+        indent = line[:len(line) - len(line.lstrip())]
+        self.lines[n] = f'{indent}{key} = {value} \n'
+        return True
+
+    def update(self, values, section=()):
+        for key, value in values.items():
+            self.set(key, value, section)
+
+    def set_module_params(self, param_values=module_param_values, module_overrides=None):
+        #{key: value} --> every [[module]] of this file that has the key. module_overrides ({module: {key: value}})
+        #replace individual values in one module only
+        for module in self.modules:
+            values = dict(param_values)
+            values.update((module_overrides or {}).get(module, {}))
+            self.update(values, ('sed_modules_params', module))
+
+
+#################
+# Genconf cache #
+#################
+
+def genconf_key(ini_path):
+    #genconf's layout only depends on the module list, the analysis method and the CIGALE version
+    ini = PcigaleIni.read(ini_path)
+    try:
+        from importlib.metadata import version
+        pcigale_version = version('pcigale')
+    except Exception:
+        pcigale_version = 'unknown'
+    key = f"{ini.get('sed_modules')}|{ini.get('analysis_method')}|{pcigale_version}"
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def data_bands(data_path):
+    #(every band + error column, bands only) from the galaxy_data header, as genconf lists them
+    columns = data_columns(data_path)[2:]   #drop id, redshift
+    return columns, [column for column in columns if not column.endswith('_err')]
+
+
+def render_from_template(template_path, pre_ini_path, data_path, out_path):
+    '''
+    cached genconf output --> pcigale.ini for this run: data_file and cores from the pcigale.ini written by
+    create_ini_files(), bands from the galaxy_data file (any data_format)
+    '''
+    pre_ini = PcigaleIni.read(pre_ini_path)
+    ini = PcigaleIni.read(template_path)
+
+    ini.update({'data_file': pre_ini.get('data_file'), 'cores': pre_ini.get('cores')})
+    all_bands, bands = data_bands(data_path)
+    ini.set('bands', ', '.join(all_bands))
+    ini.set('bands', ', '.join(bands), ('analysis_params',))
+    ini.write(out_path)
+
+
+def generate_pcigale_ini(dir_path, cache_dir=None):
+    '''
+    turn the minimal pcigale.ini from create_ini_files() into genconf's full layout, from the cache when the
+    module set was seen before (and through 'pcigale genconf' otherwise). cache_dir=None disables the cache.
+    '''
+    ini_path = os.path.join(dir_path, 'pcigale.ini')
+    spec_path = os.path.join(dir_path, 'pcigale.ini.spec')
+
+    if cache_dir is None:
+        run_genconf(dir_path)
+        return
+
+    entry = os.path.join(cache_dir, genconf_key(ini_path))
+    if os.path.exists(os.path.join(entry, 'pcigale.ini')):
+        print(f'Using cached genconf output for these SED modules ({entry}).')
+        render_from_template(os.path.join(entry, 'pcigale.ini'), ini_path,
+                             os.path.join(dir_path, PcigaleIni.read(ini_path).get('data_file')), ini_path)
+        shutil.copy(os.path.join(entry, 'pcigale.ini.spec'), spec_path)
+        return
+
+    run_genconf(dir_path)
+
+    #save under a temporary name first, so an interrupted copy never looks like a cache hit
+    os.makedirs(entry, exist_ok=True)
+    shutil.copy(spec_path, os.path.join(entry, 'pcigale.ini.spec'))
+    shutil.copy(ini_path, os.path.join(entry, 'pcigale.ini.tmp'))
+    os.replace(os.path.join(entry, 'pcigale.ini.tmp'), os.path.join(entry, 'pcigale.ini'))
+
+
+def apply_param_values(dir_path, sed_plots=False, lim_flag='noscaling', nblocks=1, create_pdfs=False,
+                       module_overrides=None, analysis_overrides=None):
+    '''
+    our module + analysis parameters --> {dir_path}/pcigale.ini. module_overrides ({module: {key: value}})
+    and analysis_overrides ({key: value}) replace individual values, e.g. for one variant of a sweep.
+    '''
+    ini_path = os.path.join(dir_path, 'pcigale.ini')
+    ini = PcigaleIni.read(ini_path)
+    ini.set_module_params(module_param_values, module_overrides)
+
+    analysis_values = analysis_param_values(sed_plots, lim_flag, nblocks, create_pdfs)
+    analysis_values.update(analysis_overrides or {})
+    ini.update(analysis_values, ('analysis_params',))
+    ini.write(ini_path)
+
+
+def drop_bands(ini_path, bands):
+    #leave bands (and their _err columns) out of the fit; galaxy_data.txt still carries them
+    ini = PcigaleIni.read(ini_path)
+    for section in [(), ('analysis_params',)]:
+        if (section, 'bands') not in ini:
+            continue
+        kept = [band.strip() for band in ini.get('bands', section).split(',')
+                if band.strip() and band.strip().replace('_err', '') not in bands]
+        ini.set('bands', ', '.join(kept), section)
+    ini.write(ini_path)
@@ -1,9 +1,22 @@
 import os
 import sys
-import re
+import shutil
+import tempfile
 import numpy as np
-from astropy.table import Table
-from conversion_utils import clip_negative_outliers, apply_error_floor
+from astropy.table import Table, vstack
+from astropy.io import fits
+from conversion_utils import clip_negative_outliers, apply_error_floor_2d
+from ini_utils import apply_param_values
+from profile_utils import substage
+from pacs_utils import pacs_bands, pacs_labels, load_pacs_photometry
+from preflight_utils import PreflightScan, write_preflight
+from redshift_bin_utils import RedshiftBinner
+
+
+#all of the possible wavelength bands (CIGALE filter names)
+cigale_band_names = ['FUV','NUV','WISE1','WISE2','WISE3','WISE4',
+                     'BASS-g','decamDR1-g','BASS-r','decamDR1-r','decamDR1-z',
+                     'PACS-blue','PACS-green','PACS-red']
 
 
 ###################################################################
@@ -15,9 +28,7 @@ def get_bayes_list(results):
     header_list = results.colnames
     
     #all of the possible wavelength bands
-    bands = ['FUV','NUV','WISE1','WISE2','WISE3','WISE4',
-         'BASS-g','decamDR1-g','BASS-r','decamDR1-r','decamDR1-z',
-            'PACS-blue','PACS-green','PACS-red']
+    bands = cigale_band_names
     
     #this one is fun!
     #create a list of all bayes parameters which are NOT fluxes
@@ -31,16 +42,6 @@ def get_bayes_list(results):
     return bayes_list
 
 
-################################################################
-# Move or delete PDF fits files once used for diagnostic plots #
-################################################################
-def handle_pdf_fits(destination, galaxy_id, delete_fits=False):
-    if delete_fits:
-        os.system(f'rm {destination}out/{galaxy_id}*.fits')
-    else:
-        os.system(f'mv {destination}out/{galaxy_id}*.fits {destination}out/PDF_fits')
-
-
 #####################################################
 # Names of each band in the cigale filter textfile! #
 #####################################################
@@ -63,9 +64,10 @@ def define_flux_dict(n_or_s):
 ##############
 # Trim Table #
 ##############
-def trim_tables(IDs, redshifts, flux_tab, ext_tab):
+def trim_tables(IDs, redshifts, flux_tab, ext_tab, *tables):
     '''
-    trim flags according to redshift values (must be positive) and whether the galaxies contain photometry data
+    trim flags according to redshift values (must be positive) and whether the galaxies contain photometry data.
+    any further row-matched tables (e.g., PACS photometry) are trimmed alongside.
     '''
     
     #convert to numpy arrays...
@@ -74,7 +76,8 @@ def trim_tables(IDs, redshifts, flux_tab, ext_tab):
     
     all_flags = (redshifts>0.) # & (flux_tab['photFlag'])
     
-    return IDs[all_flags], redshifts[all_flags], flux_tab[all_flags], ext_tab[all_flags]
+    return (IDs[all_flags], redshifts[all_flags], flux_tab[all_flags], ext_tab[all_flags], 
+            *[table[all_flags] for table in tables])
 
 
 ####################################################
@@ -92,206 +95,495 @@ def check_dir(dir_path):
 
 filter_names_all = ['FUV','NUV','G','R','Z','W1','W2','W3','W4']
 
-def create_fauxtab(params_class, flux_tab, ext_tab, IDs, redshifts):
+def stack_bands(table, prefix, bands):
+    #one (galaxy x band) array from the per-band columns, e.g. FLUX_AP03_FUV, FLUX_AP03_NUV, ...
+    return np.column_stack([np.asarray(table[prefix + band]) for band in bands])
+
+
+def clean_photometry(params_class, flux_tab, ext_tab, bands=filter_names_all):
+    '''
+    run the full cleaning chain (no-flux mask, IVAR conversion, extinction, error floors, 
+    negative outliers) on every band at once. returns the cleaned (galaxy x band) flux and error arrays.
+    '''
     
-    #isolate needed flux_tab fluxes; convert from nanomaggies to mJy
-    #order: FUV, NUV, g, r, (z,) W1, W2, W3, W4
-    try:
-        flag_n = flux_tab['DEC_MOMENT']>32   #isolates north galaxies
-        flag_s = flux_tab['DEC_MOMENT']<32   #isolates south galaxies
-    except:
-        flag_n = flux_tab['DEC']>32   #isolates north galaxies
-        flag_s = flux_tab['DEC']<32   #isolates south galaxies
-    
-    N=len(flux_tab) #all galaxies...north and south.
-    dtype=[('OBJID','str'),('redshift','f4'),('FUV','f4'),('FUV_err','f4'),
-           ('NUV','f4'),('NUV_err','f4'),('G','f4'),('G_err','f4'),
-          ('R','f4'),('R_err','f4'),('Z','f4'),('Z_err','f4'),
-          ('W1','f4'),('W1_err','f4'),('W2','f4'),('W2_err','f4'),
-          ('W3','f4'),('W3_err','f4'),('W4','f4'),('W4_err','f4')]
-    
-    faux_tab = Table(data=np.zeros(N,dtype=dtype))
-    faux_tab['OBJID']=IDs
-    faux_tab['redshift']=redshifts
-        
     #define conversion factor for flux
     conversion_factor = 1.
     #if True, convert fluxes from nanomaggies to mJy
     if params_class.convert_flux:
         conversion_factor = 3.631e-3
-        
-    #for all filters in filter_names_all...populate the respective data column
-    for i in filter_names_all:
-        
-        fluxes = flux_tab[params_class.flux_id_col + i] * conversion_factor
-        flux_errs = flux_tab[params_class.flux_id_col_err + i]   #do not apply conversion factor just yet
-        
-        ###################
-        # Clean the data! #
-        ###################
-        
-        #first create flags to identify every row with no photometry
-        no_flux_flag = (fluxes==0.) & (flux_errs==0.)
-
-        #any row with no fluxes will be assigned an np.nan
-        fluxes[no_flux_flag] = np.nan
-        flux_errs[no_flux_flag] = np.nan
-        
-        #for galaxies WITH photometry!
+    
+    #stacking already copies the columns, so the input tables are never modified
+    fluxes = stack_bands(flux_tab, params_class.flux_id_col, bands) * conversion_factor
+    flux_errs = stack_bands(flux_tab, params_class.flux_id_col_err, bands)   #do not apply conversion factor just yet
+    ext_values = stack_bands(ext_tab, params_class.extinction_col, bands)
+    
+    #first create flags to identify every row with no photometry
+    #(these entries are set to NaN at the end; NaNs pass through every step below untouched)
+    no_flux_flag = (fluxes==0.) & (flux_errs==0.)
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
         
         #if need to convert invariance to an error...do so
         if params_class.ivar_to_err:
-            flux_errs[~no_flux_flag] = np.sqrt(1/flux_errs[~no_flux_flag]) * conversion_factor
-            
-            #if neither condition is met, convert error as normal
+            flux_errs = np.sqrt(1/flux_errs) * conversion_factor
         else:
-            flux_errs[~no_flux_flag] = flux_errs[~no_flux_flag] * conversion_factor
-
+            flux_errs = flux_errs * conversion_factor
+        
         ###################
         # EXTINCTION CORR #
         ###################
         
         #check for flag indicating conversion from transmission to extinction (in magnitudes) is needed
         if params_class.transmission_to_extinction:
-            ext_values = -2.5 * np.log10(ext_tab[params_class.extinction_col+i])
-        else:
-            ext_values = ext_tab[params_class.extinction_col+i]
+            ext_values = -2.5 * np.log10(ext_values)
         
         #Milky Way (MW) extinction corrections (SFD) for each band, given in magnitudes.
         ext_corrections = 10.**(ext_values/2.5)   #converting to linear scale factors
-                
-        #now apply SFD extinction correction (per Legacy Survey)
-        flux_errs[~no_flux_flag] *= ext_corrections[~no_flux_flag]
-        fluxes[~no_flux_flag] *= ext_corrections[~no_flux_flag]
         
-        #################
-        # ERROR FLOORS #
-        #################
-        
-        #If the relative error dF/F < 0.10, then let dF = 0.10*F
-        #the idea is that our MINIMUM error floor for fluxes will be set as 10% of the flux value
-        #for grz and 15% for W1-4 & NUV+FUV. 
-        #CURRENTLY --> using 10% for grz; 13% for FUV, NUV, W1-4.
-        flux_errs[~no_flux_flag] = apply_error_floor(fluxes[~no_flux_flag], flux_errs[~no_flux_flag], band=i)
+        #now apply SFD extinction correction (per Legacy Survey)
+        flux_errs *= ext_corrections
+        fluxes *= ext_corrections
+    
+    #any row with no fluxes will be assigned an np.nan
+    fluxes[no_flux_flag] = np.nan
+    flux_errs[no_flux_flag] = np.nan
+    
+    #################
+    # ERROR FLOORS #
+    #################
+    
+    #If the relative error dF/F < 0.10, then let dF = 0.10*F
+    #CURRENTLY --> using 10% for grz; 13% for FUV, NUV, W1-4.
+    flux_errs = apply_error_floor_2d(fluxes, flux_errs, bands)
+    
+    #####################
+    # REMOVING PROBLEMS #
+    #####################
+    
+    #if zero is within the 4-sigma confidence interval of the flux value, keep the negative value. 
+    #if the flux is OUTSIDE of this limit, then set to NaN. 
+    with np.errstate(invalid='ignore'):
+        fluxes, flux_errs = clip_negative_outliers(fluxes, flux_errs)
+    
+    return fluxes, flux_errs
 
-        #####################
-        # REMOVING PROBLEMS #
-        #####################
 
-        #...another conditional statement. if zero is within the 4-sigma confidence interval of the flux value, keep the negative value. if the flux is OUTSIDE of this limit, then set to NaN. 
-        fluxes, flux_errs = clip_negative_outliers(fluxes, flux_errs)
-          
-        ######################################
-        # ADDING FLUX ROWS TO THE FAUX TABLE #
-        ######################################
-
-        #appending arrays to faux table
-        faux_tab[i] = fluxes
-        faux_tab[f'{i}_err'] = flux_errs
-        
-    faux_tab.add_columns([flag_n,flag_s],names=['flag_north','flag_south'])
+def create_fauxarray(params_class, flux_tab, ext_tab, IDs, redshifts, bands=filter_names_all, pacs_tab=None):
+    '''
+    compact structured array with OBJID, redshift, <band>, <band>_err for every band, flag_north, flag_south.
+    pacs_tab (row-matched PACS1-3 fluxes and errors in mJy, see pacs_utils.py) adds PACS1, PACS1_err, ...
+    '''
+    
+    #isolate north and south galaxies
+    dec_col = 'DEC_MOMENT' if 'DEC_MOMENT' in flux_tab.colnames else 'DEC'
+    dec = np.asarray(flux_tab[dec_col])
+    
+    IDs = np.asarray(IDs)
+    redshifts = np.asarray(redshifts)
+    
+    fluxes, flux_errs = clean_photometry(params_class, flux_tab, ext_tab, bands)
+    
+    #far-IR fluxes need no Milky Way extinction correction, so they skip the cleaning chain
+    pacs_bands = [] if pacs_tab is None else [name for name in pacs_tab.colnames if not name.endswith('_err')]
+    
+    dtype = [('OBJID', IDs.dtype), ('redshift', redshifts.dtype)]
+    for band in bands + pacs_bands:
+        dtype += [(band, fluxes.dtype), (f'{band}_err', fluxes.dtype)]
+    dtype += [('flag_north', bool), ('flag_south', bool)]
+    
+    faux_array = np.empty(len(dec), dtype=dtype)
+    faux_array['OBJID'] = IDs
+    faux_array['redshift'] = redshifts
+    for n, band in enumerate(bands):
+        faux_array[band] = fluxes[:, n]
+        faux_array[f'{band}_err'] = flux_errs[:, n]
+    for band in pacs_bands:
+        faux_array[band] = pacs_tab[band]
+        faux_array[f'{band}_err'] = pacs_tab[f'{band}_err']
+    faux_array['flag_north'] = dec > 32   #isolates north galaxies
+    faux_array['flag_south'] = dec < 32   #isolates south galaxies
+    
+    return faux_array
+
+
+def create_fauxtab(params_class, flux_tab, ext_tab, IDs, redshifts):
+    
+    #order: FUV, NUV, g, r, (z,) W1, W2, W3, W4
+    faux_array = create_fauxarray(params_class, flux_tab, ext_tab, IDs, redshifts)
+    
+    return Table(faux_array, copy=False)
+
+
+###############################
+# galaxy_data.txt band layout #
+###############################
+class BandLayout():
+    '''
+    flux columns of galaxy_data.txt, compiled once from the bands_north and bands_south lists in params.txt.
+    
+        labels        -- CIGALE filter label of every flux column, in output order. a band observed in both
+                         hemispheres with the same filter (FUV, NUV, W1-4) gets one column; G and R get one
+                         per hemisphere (BASS-g, decamDR1-g, ...)
+        band_axis     -- faux table bands the gather indexes point into: filter_names_all, plus PACS1-3 if
+                         PACS is listed (written as PACS-blue, PACS-green, PACS-red)
+        gather[n_s]   -- for every column, the band (index into band_axis) north/south galaxies
+                         take their flux from, or -1 --> nan (band not observed in that hemisphere)
+    '''
+    
+    def __init__(self, bands_north, bands_south):
+        
+        flux_dicts = {'north': define_flux_dict('n'), 'south': define_flux_dict('s')}
+        region_bands = {'north': bands_north, 'south': bands_south}
+        
+        #PACS (Herschel) comes from its own catalog, and has the same filters in both hemispheres
+        self.has_pacs = ('PACS' in bands_north) or ('PACS' in bands_south)
+        self.band_axis = list(filter_names_all) + (pacs_bands if self.has_pacs else [])
+        for region in ['north', 'south']:
+            flux_dicts[region].update(pacs_labels)
+            if 'PACS' in region_bands[region]:
+                region_bands[region] = [band for band in region_bands[region] if band != 'PACS'] + pacs_bands
+        
+        for region, bands in region_bands.items():
+            for band in bands:
+                if band not in flux_dicts[region]:
+                    print(f'{band} (bands_{region} in params.txt) has no {region} CIGALE filter. '
+                          f'options: {"-".join(flux_dicts[region])}. exiting.')
+                    sys.exit()
+        
+        #in filter_names_all order; north label first, so the file reads BASS-g BASS-g_err decamDR1-g ...
+        self.labels = []
+        columns = {}
+        for band_index, band in enumerate(self.band_axis):
+            for region in ['north', 'south']:
+                if band in region_bands[region]:
+                    label = flux_dicts[region][band]
+                    if label not in columns:
+                        self.labels.append(label)
+                        columns[label] = {}
+                    columns[label][region] = band_index
+        
+        self.gather = {region: np.array([columns[label].get(region, -1) for label in self.labels], dtype=int) 
+                       for region in ['north', 'south']}
+    
+    def header(self):
+        return '# id redshift ' + ''.join(f'{label} {label}_err ' for label in self.labels) + ' \n'
+    
+    def bands(self, region):
+        #bands (band_axis names) that region writes, in column order; None --> nan
+        return [self.band_axis[n] if n >= 0 else None for n in self.gather[region]]
+
+
+#fluxes and errors of every output column of a (north or south) block, from one gather over the band axis
+#(-1 --> the nan column). returns (galaxy IDs as str, redshifts, values) with values = flux, err, flux, err, ...
+def gather_region_values(table, gather, band_axis=filter_names_all):
+    
+    IDs = np.asarray(table['OBJID'])
+    if IDs.dtype.kind == 'S':
+        IDs = np.char.decode(IDs, 'utf-8')
+    
+    nan_column = np.full((len(table), 1), np.nan)
+    fluxes = np.hstack([np.column_stack([table[band] for band in band_axis]), nan_column])
+    flux_errs = np.hstack([np.column_stack([table[f'{band}_err'] for band in band_axis]), nan_column])
+    
+    values = np.empty((len(table), 2*len(gather)))
+    values[:, 0::2] = fluxes[:, gather]
+    values[:, 1::2] = flux_errs[:, gather]
+    
+    return IDs.astype(str), np.asarray(table['redshift'], dtype=float), values
+
+
+#format every row of a (north or south) block with one row template.
+def format_region_lines(table, gather, band_axis=filter_names_all):
+    
+    IDs, redshifts, values = gather_region_values(table, gather, band_axis)
+    
+    #redshift is written as round(z,4), flux values and errors are rounded to 4 decimal places
+    redshifts = [f'{round(z,4)}' for z in redshifts.tolist()]
+    
+    row_format = '%s %s ' + '%.4f %.4f ' * len(gather) + '\n'
+    
+    return [row_format % (galaxy_id, z, *row) 
+            for galaxy_id, z, row in zip(IDs.tolist(), redshifts, values.tolist())]
+
+
+#the same block as a table with the galaxy_data.txt column names, for data_format fits/votable.
+#fluxes keep their full precision; redshift is rounded to 4 decimals as in the text file
+def region_table(table, layout, region):
+    
+    IDs, redshifts, values = gather_region_values(table[table[f'flag_{region}']], layout.gather[region], 
+                                                  layout.band_axis)
+    
+    columns = [IDs, np.round(redshifts, 4)] + [values[:, n] for n in range(values.shape[1])]
+    names = ['id', 'redshift'] + [name for label in layout.labels for name in (label, f'{label}_err')]
+    return Table(columns, names=names, copy=False)
+
+
+#fixed-width FITS records of the same block, so data_format fits can be streamed chunk by chunk
+def data_record_dtype(layout, id_width):
+    names = ['redshift'] + [name for label in layout.labels for name in (label, f'{label}_err')]
+    return np.dtype([('id', f'S{id_width}')] + [(name, '>f8') for name in names])
 
-    return faux_tab
+
+def id_width(id_dtype):
+    #characters any galaxy ID of this dtype can take (integers: up to 20, sign included)
+    if id_dtype.kind == 'U':
+        return id_dtype.itemsize // 4
+    if id_dtype.kind == 'S':
+        return id_dtype.itemsize
+    return 20
+
+
+def region_records(table, layout, region, dtype):
+    
+    IDs, redshifts, values = gather_region_values(table[table[f'flag_{region}']], layout.gather[region], 
+                                                  layout.band_axis)
+    
+    records = np.empty(len(IDs), dtype=dtype)
+    records['id'] = np.char.encode(IDs, 'utf-8')
+    records['redshift'] = np.round(redshifts, 4)
+    for n, name in enumerate(dtype.names[2:]):
+        records[name] = values[:, n]
+    return records
+
+
+def fits_table_header(dtype, nrows):
+    #header of a binary table HDU with these columns and nrows rows (its size does not depend on nrows)
+    header = fits.BinTableHDU(np.zeros(0, dtype=dtype)).header
+    header['NAXIS2'] = nrows
+    return header.tostring().encode('ascii')
 
 
 #generalizing the writing of rows for north and south galaxies...
-def write_region(file, table, flux_dict, filter_labels_all, filter_comp_names, region):
-    for n in table[table[f'flag_{region}']]:
-
-        #the first two will be ID [0] and redshift [1], by design.
-        s_gal = f'{n[0]} {round(n[1],4) } '
-
-        for i in range(len(filter_labels_all)):
-            if (filter_comp_names[i]!='Z'):
-                if filter_labels_all[i] == flux_dict[filter_comp_names[i]]:
-                    flux_val = n[filter_comp_names[i]]
-                    flux_err = n[f'{filter_comp_names[i]}_err']
-                    #for the flux values and errors, round to 4 decimal places
-                    s_gal += f"{flux_val:.4f} {flux_err:.4f} "
-
-                else:
-                    s_gal += 'nan nan '
-            else:
-                s_gal += 'nan nan '
-
-        s_gal += '\n'
-        file.write(s_gal)
+def write_region(file, table, layout, region, chunk_size=100000, verbose=True):
+    
+    region_rows = table[table[f'flag_{region}']]
+    
+    #format and write in chunks so the string buffer stays small for very large catalogs
+    for start in range(0, len(region_rows), chunk_size):
+        file.writelines(format_region_lines(region_rows[start:start+chunk_size], layout.gather[region], 
+                                            layout.band_axis))
         
-    print(f"{region} galaxies finished", len(table[table[f'flag_{region}']]))
+    if verbose:
+        print(f"{region} galaxies finished", len(region_rows))
+    
+    return len(region_rows)
 
-def create_flux_table(params_class, trim=True):
-        
-    #define flux table, extinction table
-    ext_tab = params_class.ext_tab
-    flux_tab = params_class.flux_tab
+
+#faux table(s) of the catalog: one for the whole table, or one per chunk_size rows in streaming mode
+#(never holding the full photometry tables in memory). pacs_tab is matched to the main table rows.
+def iter_fauxtabs(params_class, trim=True, pacs_tab=None, scan=None):
     
-    IDs = params_class.IDs
-    redshifts = params_class.redshifts
+    #rows dropped by trim_tables never reach the faux tables, so a PreflightScan is shown them here
+    def count_trimmed(IDs, redshifts):
+        if trim and scan is not None:
+            with substage('preflight_scan'):
+                scan.add_trimmed(IDs, redshifts)
     
-    #re-define variables with trimmed data
-    if trim:
-        IDs, redshifts, flux_tab, ext_tab = trim_tables(IDs, redshifts, flux_tab, ext_tab)
+    if not params_class.chunk_size:
+        
+        #define flux table, extinction table
+        with substage('load_tables'):
+            ext_tab = params_class.ext_tab
+            flux_tab = params_class.flux_tab
+
+            IDs = params_class.IDs
+            redshifts = params_class.redshifts
+
+            #re-define variables with trimmed data
+            count_trimmed(IDs, redshifts)
+            if trim and pacs_tab is not None:
+                IDs, redshifts, flux_tab, ext_tab, pacs_tab = trim_tables(IDs, redshifts, flux_tab, ext_tab, pacs_tab)
+            elif trim:
+                IDs, redshifts, flux_tab, ext_tab = trim_tables(IDs, redshifts, flux_tab, ext_tab)
+
+        #contains FUV, NUV, G, R, Z, W1, W2, W3, W4, (PACS1-3,) north flag, south flag for all galaxies
+        with substage('fauxtab', galaxies=len(IDs)):
+            faux_table = create_fauxarray(params_class, flux_tab=flux_tab, ext_tab=ext_tab, IDs=IDs, redshifts=redshifts,
+                                          pacs_tab=pacs_tab)
+        yield faux_table
+        return
     
-    #contains FUV, NUV, G, R, Z, W1, W2, W3, W4, north flag, south flag for all galaxies
-    faux_table = create_fauxtab(params_class, flux_tab=flux_tab, ext_tab=ext_tab, IDs=IDs, redshifts=redshifts)
+    n_rows = 0   #main-table rows read so far (PACS photometry is matched to these, before trimming)
     
-    #generate flux dictionaries to map the params.txt flux bands to their CIGALE labels
-    flux_dict_north = define_flux_dict('n')
-    flux_dict_south = define_flux_dict('s')
+    chunks = params_class.iter_chunks(filter_names_all)
+    while True:
+        
+        #the chunk is read from disk on next(), so that is where table loading is measured
+        with substage('load_tables'):
+            chunk = next(chunks, None)
+            if chunk is not None:
+                pacs_chunk = [] if pacs_tab is None else [pacs_tab[n_rows:n_rows+len(chunk[0])]]
+                n_rows += len(chunk[0])
+                count_trimmed(*chunk[:2])
+                chunk = trim_tables(*chunk, *pacs_chunk) if trim else (*chunk, *pacs_chunk)
+        if chunk is None:
+            break
+        IDs, redshifts, flux_tab, ext_tab = chunk[:4]
+        
+        with substage('fauxtab', galaxies=len(IDs)):
+            faux_chunk = create_fauxarray(params_class, flux_tab=flux_tab, ext_tab=ext_tab, IDs=IDs, redshifts=redshifts,
+                                          pacs_tab=chunk[4] if pacs_tab is not None else None)
+        yield faux_chunk
+
+
+#streaming version of the north + south blocks: write the faux tables one chunk at a time.
+#south rows are spooled to a temporary file so the output matches the all-north-then-all-south layout.
+def write_regions_chunked(file, fauxtabs, layout):
     
-    bands_north = list(flux_dict_north.keys())
-    bands_south = list(flux_dict_south.keys())
+    n_north = 0
+    n_south = 0
     
-    #write files...
-    check_dir(params_class.dir_path)
+    with tempfile.TemporaryFile('w+') as south_file:
         
-    with open(params_class.dir_path+'/galaxy_data.txt', 'w') as file:
+        for faux_chunk in fauxtabs:
+            with substage('write_galaxy_data'):
+                n_north += write_region(file, faux_chunk, layout, 'north', verbose=False)
+                n_south += write_region(south_file, faux_chunk, layout, 'south', verbose=False)
         
-        #create file header!
-        s = '# id redshift '
+        print("north galaxies finished", n_north)
         
-        #if the band appears in both hemispheres (like G, R), write only once.
-        #otherwise, write labels only if they exist in north/south dict.
-        for flux in filter_names_all:
-            
-            #len(flux)>=2 isolates NUV, FUV, W1-4 bands. excludes gr(z) bands
-            if (flux in bands_north) & (flux in bands_south) & (len(flux)>=2):
-                s = s + f'{flux_dict_north[flux]} {flux_dict_north[flux]}_err ' #same for N & S
+        with substage('write_galaxy_data'):
+            south_file.seek(0)
+            shutil.copyfileobj(south_file, file)
+        
+        print("south galaxies finished", n_south)
+
+
+#data_format fits: the north + south blocks as one binary table, in the same row order as the text file.
+#like the text file, rows are written as they come (south rows spooled to a temporary file), so chunk_size
+#still bounds the memory; NAXIS2 is filled in once all rows are written.
+def write_fits_data(path, fauxtabs, layout):
+    
+    n_rows = {'north': 0, 'south': 0}
+    dtype = None
+    
+    with open(path, 'wb') as file, tempfile.TemporaryFile() as south_file:
+        
+        for faux_table in fauxtabs:
+            with substage('write_galaxy_data'):
+                if dtype is None:
+                    dtype = data_record_dtype(layout, id_width(faux_table['OBJID'].dtype))
+                    file.write(fits.PrimaryHDU().header.tostring().encode('ascii'))
+                    header_start = file.tell()
+                    file.write(fits_table_header(dtype, 0))
+                
+                for region, target in [('north', file), ('south', south_file)]:
+                    records = region_records(faux_table, layout, region, dtype)
+                    target.write(records.tobytes())
+                    n_rows[region] += len(records)
+        
+        with substage('write_galaxy_data'):
+            #no galaxies at all --> an empty table
+            if dtype is None:
+                dtype = data_record_dtype(layout, id_width(np.dtype(int)))
+                file.write(fits.PrimaryHDU().header.tostring().encode('ascii'))
+                header_start = file.tell()
+                file.write(fits_table_header(dtype, 0))
             
-            #for G and R, add twice (as we will need one label each for BASS-g north and DECam-g south
-            #add labels if needed, else ''.
-            #adding them consecutively ensures the file will read something like BASS-g BASS-g_err DECam-g DECam-g_err ...
-            #I guess '' is a failsafe in case the band is not in north or south...effectively skips the header label
-            #maybe I set that up once upon a time to accommodate Z-band? I don't know.
-            else:
-                s = s + f'{flux_dict_north[flux]} {flux_dict_north[flux]}_err ' if flux in bands_north else s + ''
-                s = s + f'{flux_dict_south[flux]} {flux_dict_south[flux]}_err ' if flux in bands_south else s + ''
+            south_file.seek(0)
+            shutil.copyfileobj(south_file, file)
             
-        s = s + ' \n'
-        file.write(s)
+            #data blocks are padded to a multiple of 2880 bytes
+            file.write(b'\0' * (-file.tell() % 2880))
+            file.seek(header_start)
+            file.write(fits_table_header(dtype, n_rows['north'] + n_rows['south']))
+    
+    for region in n_rows:
+        print(f"{region} galaxies finished", n_rows[region])
+
+
+#data_format votable: astropy writes a VOTable in one go, so the blocks are stacked in memory first
+#(chunk_size then only bounds the memory of the photometry tables, not of the output)
+def write_votable_data(path, fauxtabs, layout):
+    
+    blocks = {'north': [], 'south': []}
+    for faux_table in fauxtabs:
+        with substage('write_galaxy_data'):
+            for region in blocks:
+                blocks[region].append(region_table(faux_table, layout, region))
+    
+    with substage('write_galaxy_data'):
+        for region in blocks:
+            print(f"{region} galaxies finished", sum(len(block) for block in blocks[region]))
         
-        #storing header informtaion in a list so I can interate over it
-        #however, I am only keeping the CIGALE FILTER LABELS. no #, no id, no redshift
-        filter_labels_all = [x for x in s.split() if ('_err' not in x) & (x!='#') & (x!='id') & (x!='redshift')]
+        #BINARY serialization; the default TABLEDATA would be XML text again
+        data_table = vstack(blocks['north'] + blocks['south'])
+        data_table.write(path, format='votable', tabledata_format='binary', overwrite=True)
+
+
+def create_flux_table(params_class, trim=True):
+    
+    #flux columns of the file and, per hemisphere, which band fills each of them (bands_north/south in params.txt)
+    layout = BandLayout(params_class.bands_north, params_class.bands_south)
+    
+    #write files...
+    check_dir(params_class.dir_path)
+    print(layout.labels)
+    
+    #Herschel/PACS fluxes, matched to the main table rows (see pacs_utils.py)
+    pacs_tab = None
+    if layout.has_pacs:
+        if params_class.pacs_table is None:
+            print('PACS is listed in bands_north/bands_south, but no pacs_table is given in params.txt. exiting.')
+            sys.exit()
+        with substage('load_pacs'):
+            pacs_tab = load_pacs_photometry(params_class)
+    
+    #for every "good" galaxy in flux_tab, add a row with relevant information.
+    #every faux table is also scanned for pre-flight problems on its way to the file (see preflight_utils.py)
+    scan = PreflightScan(layout)
+    fauxtabs = iter_fauxtabs(params_class, trim=trim, pacs_tab=pacs_tab, scan=scan)
+    
+    #redshift_tolerance > 0 --> redshifts snapped to bins, so CIGALE builds fewer model grids (redshift_bin_utils.py)
+    binner = None
+    if params_class.redshift_tolerance > 0:
+        binner = RedshiftBinner(params_class.redshift_tolerance)
+        fauxtabs = binner.watch(fauxtabs)
+    
+    fauxtabs = scan.watch(fauxtabs)
+    data_path = os.path.join(params_class.dir_path, params_class.data_file)
+    
+    #fits/votable -- straight from the flux arrays, no text formatting (and no rounding of the fluxes)
+    if params_class.data_format == 'fits':
+        write_fits_data(data_path, fauxtabs, layout)
+    
+    elif params_class.data_format == 'votable':
+        write_votable_data(data_path, fauxtabs, layout)
+    
+    else:
+        write_text_data(data_path, fauxtabs, layout, streaming=bool(params_class.chunk_size))
+    
+    with substage('preflight_scan'):
+        write_preflight(params_class.dir_path, {'inputs': scan.result()})
+    
+    if binner is not None:
+        binner.write(params_class.dir_path)
+
+
+def write_text_data(data_path, fauxtabs, layout, streaming=False):
+    
+    with open(data_path, 'w') as file:
         
-        #you may wonder why G and R are included TWICE!
-            #There are two sources of G and R depending on whether galaxy is in northern
-            #or southern hemisphere. The first G (from flux_dict_north) becomes 'BASS-g,' the second 'decamDR1-g'
-            #this is how I set up the header file earlier!
-        filter_comp_names = ['FUV','NUV','G','G','R','R','Z','W1','W2','W3','W4']
-        print(filter_labels_all)
+        #create file header!
+        file.write(layout.header())
         
-        #for every "good" galaxy in flux_tab, add a row to the text file with relevant information
+        #streaming mode -- south rows wait in a temporary file
+        if streaming:
+            write_regions_chunked(file, fauxtabs, layout)
+            return
         
-        ####################
-        ###NORTH GALAXIES###
-        ####################
-        write_region(file, faux_table, flux_dict_north, filter_labels_all, filter_comp_names, 'north')
+        faux_table = next(fauxtabs)
         
-        ####################
-        ###SOUTH GALAXIES###
-        ####################
-        write_region(file, faux_table, flux_dict_south, filter_labels_all, filter_comp_names, 'south')
+        with substage('write_galaxy_data'):
+            ####################
+            ###NORTH GALAXIES###
+            ####################
+            write_region(file, faux_table, layout, 'north')
+            
+            ####################
+            ###SOUTH GALAXIES###
+            ####################
+            write_region(file, faux_table, layout, 'south')
 
         
 def create_ini_files(params_class): #dir_path, sfh_module, dust_module, ncores):
@@ -300,11 +592,11 @@ def create_ini_files(params_class): #dir_path, sfh_module, dust_module, ncores):
     
     #create pcigale.ini files
     with open(params_class.dir_path+'/pcigale.ini', 'w') as file:
-        file.write('data_file = galaxy_data.txt \n')
+        file.write(f'data_file = {params_class.data_file} \n')
         file.write('parameters_file = \n')
         file.write(f'sed_modules = {params_class.sfh_module}, bc03, nebular, dustatt_modified_CF00, {params_class.dust_module}, skirtor2016, redshifting \n')
         file.write('analysis_method = pdf_analysis \n')
-        file.write(f'cores = {params_class.ncores} \n')  
+        file.write(f'cores = {1 if params_class.auto_ncores else params_class.ncores} \n')   #auto: set after genconf
 
     #create pcigale.ini.spec files
     
@@ -321,89 +613,6 @@ def create_ini_files(params_class): #dir_path, sfh_module, dust_module, ncores):
 ##################################################
 def add_params(dir_path,sed_plots=False,lim_flag='noscaling',nblocks=1, create_pdfs=False):
     
-    #different modules, different naming schemes...
-    #sfhdelayed --> age_main, age_burst
-    #sfh2exp --> age, burst_age
-
-    with open(dir_path+'/pcigale.ini','r') as file:
-        lines = file.readlines()
-        
-    #modify lines...enjoy.
-    modified_lines = []
-    for line in lines:
-        
-        if re.match(r'^\s*save_best_sed\s*=', line):
-            if sed_plots:
-                modified_lines.append("  save_best_sed = True \n")
-                print('line changed: save_best_sed = True')
-            else:
-                modified_lines.append(line)
-        
-        elif re.match(r'^\s*tau_main\s*=', line):
-            modified_lines.append('   tau_main = 300, 500, 1000, 3000, 6000, 1e5 \n')
-        
-        elif re.match(r'^\s*age\s*=', line):
-            modified_lines.append('   age = 1e3, 3e3, 5e3, 7e3, 1e4, 13000 \n') 
-        
-        elif re.match(r'^\s*age_main\s*=', line):
-            modified_lines.append('   age_main = 1e3, 3e3, 5e3, 7e3, 1e4, 13000 \n')  
-        
-        elif re.match(r'^\s*tau_burst\s*=', line):
-            modified_lines.append('   tau_burst = 100, 200, 400 \n')
-        
-        elif re.match(fr'^\s*burst_age\s*=', line):
-            modified_lines.append('   burst_age = 20, 80, 200, 400, 800, 1e3 \n')
-        
-        elif re.match(fr'^\s*age_burst\s*=', line):
-            modified_lines.append('   age_burst = 20, 80, 200, 400, 800, 1e3 \n')    
-        
-        elif re.match(r'^\s*f_burst\s*=', line):
-            modified_lines.append('   f_burst = 0, 0.001, 0.005, 0.01, 0.05, 0.1 \n')
-        
-        elif re.match(r'^\s*imf\s*=', line):
-            modified_lines.append('   imf = 1 \n')
-        
-        elif re.match(r'^\s*metallicity\s*=', line):
-            modified_lines.append('   metallicity = 0.004, 0.02, 0.05 \n')
-        
-        elif re.match(r'^\s*variables\s*=',line):
-            #modified_lines.append('  variables = sfh.sfr, stellar.m_star, sfh.burst_age, sfh.age, sfh.f_burst, sfh.tau_burst, sfh.tau_main, attenuation.Av_ISM, dust.alpha, dust.gamma, dust.qpah, dust.umean, dust.umin, dust.mass \n') 
-            modified_lines.append('  variables = sfh.sfr, stellar.m_star, stellar.metallicity, sfh.burst_age, sfh.age, sfh.f_burst, sfh.tau_burst, sfh.tau_main, agn.fracAGN, attenuation.Av_ISM, dust.mass \n') 
-        
-        elif re.match(r'^\s*normalise\s*=',line):
-            modified_lines.append('   normalise = True \n')
-        
-        elif re.match(r'^\s*Av_ISM\s*=',line):
-            modified_lines.append('  Av_ISM = 0.0, 0.01, 0.025, 0.03, 0.035, 0.04, 0.05, 0.06, 0.12, 0.15, 1.0, 1.3, 1.5, 1.8, 2.1, 2.4, 2.7, 3.0, 3.3 \n')
-        
-        elif re.match(r'^\s*fracAGN\s*=',line):
-            modified_lines.append('  fracAGN = 0.0, 0.05, 0.1, 0.5 \n')
-        
-        elif re.match(r'^\s*umin\s*=',line):
-            modified_lines.append('  umin = 1.0, 5.0, 10.0 \n')
-        
-        elif re.match(r'^\s*alpha\s*=',line):
-            modified_lines.append('  alpha = 1.0, 2.0, 2.8 \n')
-        
-        elif re.match(r'^\s*gamma\s*=',line):
-            modified_lines.append('  gamma = 0.02, 0.1 \n')  
-        
-        elif re.match(r'^\s*blocks\s*=',line):
-            modified_lines.append(f'  blocks = {nblocks} \n')  
-        
-        elif re.match(r'^\s*lim_flag\s*=',line):
-            modified_lines.append(f'  lim_flag = {lim_flag} \n')
-        
-        elif re.match(r'^\s*save_chi2\s*=',line):
-            
-            if create_pdfs:
-                modified_lines.append("  save_chi2 = properties \n")
-                print('line changed: save_chi2 = properties')
-            else:
-                modified_lines.append(line)            
-        else:
-            modified_lines.append(line)
-    
-    #write modified lines back into the file...or, rather, recreate the file with ALL lines, modified or otherwise
-    with open(dir_path+'/pcigale.ini', 'w') as file:
-        file.writelines(modified_lines)
\ No newline at end of file
+    #the parameter values themselves live in ini_utils.py (module_param_values, analysis_param_values),
+    #and are set section by section in the genconf-generated pcigale.ini
+    apply_param_values(dir_path, sed_plots, lim_flag, nblocks, create_pdfs)
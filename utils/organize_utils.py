@@ -0,0 +1,137 @@
+'''
+Tidy up the per-galaxy files CIGALE leaves in out/, without the shell: one directory scan sorts every file by
+galaxy ID and kind, and each kind is then deleted, renamed into its sub-directory, or appended to an archive
+in one pass.
+
+    kind             file                          default
+    best_model_fits  {id}_best_model.fits          deleted (only needed by pcigale-plots)
+    best_model       {id}_best_model.pdf/.png/...  --> best_SED_models/
+    sfh              {id}_SFH.fits                 deleted
+    pdf_fits         {id}_{parameter}.fits         --> PDF_fits/ (or deleted, with delete_PDF_fits = 1)
+
+With output_archive = tar or zip, the files that would be moved go into out/best_SED_models.tar (.zip) and
+out/PDF_fits.tar (.zip) instead, grouped by galaxy. Archives are appended to, so resumed runs add to them.
+'''
+
+import os
+import sys
+import tarfile
+import zipfile
+
+#(kind, marker) -- the galaxy ID is everything before the marker
+marker_kinds = [('best_model_fits', '_best_model.fits'),
+                ('best_model', '_best_model.'),
+                ('sfh', '_SFH')]
+
+#where the files of each kind go when they are kept
+kind_subdirs = {'best_model': 'best_SED_models', 'pdf_fits': 'PDF_fits'}
+
+archive_formats = ['none', 'tar', 'zip']
+
+
+############
+# Scan out #
+############
+
+def classify(name, pdf_suffixes):
+    #(galaxy ID, kind) of one file name, or None for anything that is not a per-galaxy file
+    for kind, marker in marker_kinds:
+        position = name.rfind(marker)
+        if position > 0:
+            return name[:position], kind
+    for suffix in pdf_suffixes:
+        if name.endswith(suffix) and len(name) > len(suffix):
+            return name[:-len(suffix)], 'pdf_fits'
+    return None
+
+
+def scan_output(out_dir, param_names=()):
+    '''
+    single scan of out_dir. returns {kind: {galaxy ID: [file names]}}.
+    param_names are the bayes parameters without the 'bayes.' prefix (e.g., 'sfh.sfr'); only
+    {id}_{parameter}.fits files of these parameters are recognized as PDF .fits files.
+    '''
+    #longest suffix first, so that e.g. '_sfh.burst_age.fits' is never mistaken for a shorter parameter
+    pdf_suffixes = sorted([f'_{param}.fits' for param in param_names], key=len, reverse=True)
+
+    groups = {}
+    with os.scandir(out_dir) as entries:
+        for entry in entries:
+            if not entry.is_file():
+                continue
+            found = classify(entry.name, pdf_suffixes)
+            if found is not None:
+                galaxy_id, kind = found
+                groups.setdefault(kind, {}).setdefault(galaxy_id, []).append(entry.name)
+    return groups
+
+
+###########
+# Actions #
+###########
+
+def delete_files(out_dir, galaxy_files):
+    for names in galaxy_files.values():
+        for name in names:
+            os.remove(os.path.join(out_dir, name))
+
+
+def move_files(out_dir, galaxy_files, subdir):
+    target = os.path.join(out_dir, subdir)
+    os.makedirs(target, exist_ok=True)
+    for names in galaxy_files.values():
+        for name in names:
+            os.replace(os.path.join(out_dir, name), os.path.join(target, name))
+
+
+def archive_files(out_dir, galaxy_files, subdir, archive_format):
+    '''
+    append the files to out_dir/{subdir}.{tar|zip} as {subdir}/{name}, galaxy by galaxy (so that extracting
+    the archive gives the same layout as move_files), then delete them. returns the archive path.
+    '''
+    path = os.path.join(out_dir, f'{subdir}.{archive_format}')
+    members = [name for galaxy_id in sorted(galaxy_files) for name in galaxy_files[galaxy_id]]
+
+    if archive_format == 'tar':
+        #uncompressed, so the archive can be appended to
+        with tarfile.open(path, 'a') as archive:
+            for name in members:
+                archive.add(os.path.join(out_dir, name), arcname=f'{subdir}/{name}')
+    else:
+        with zipfile.ZipFile(path, 'a', compression=zipfile.ZIP_DEFLATED) as archive:
+            for name in members:
+                archive.write(os.path.join(out_dir, name), arcname=f'{subdir}/{name}')
+
+    delete_files(out_dir, galaxy_files)
+    return path
+
+
+#################
+# Organize out/ #
+#################
+
+def organize_output(out_dir, kinds, param_names=(), delete_kinds=(), archive='none'):
+    '''
+    delete the files of every kind in delete_kinds, and move (or archive) the files of the other kinds.
+    returns {kind: number of files handled}.
+    '''
+    if archive not in archive_formats:
+        print(f'output_archive must be one of {archive_formats}, not {archive}. exiting.')
+        sys.exit()
+
+    groups = scan_output(out_dir, param_names)
+
+    counts = {}
+    for kind in kinds:
+        galaxy_files = groups.get(kind, {})
+        counts[kind] = sum(len(names) for names in galaxy_files.values())
+        if not galaxy_files:
+            continue
+        if kind in delete_kinds:
+            delete_files(out_dir, galaxy_files)
+        elif archive != 'none':
+            archive_files(out_dir, galaxy_files, kind_subdirs[kind], archive)
+        else:
+            move_files(out_dir, galaxy_files, kind_subdirs[kind])
+
+    return counts
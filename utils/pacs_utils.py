@@ -0,0 +1,96 @@
+'''
+Herschel/PACS photometry from an external catalog (pacs_table in params.txt), matched to the main table
+either by galaxy ID (pacs_match id) or by position within pacs_radius arcsec (pacs_match sky).
+
+The result is one row per main-table row -- PACS1, PACS2, PACS3 (70, 100, 160 um) and their errors, in
+mJy, nan where a galaxy has no PACS counterpart -- so it can be trimmed and chunked exactly like the
+optical/WISE photometry. create_fauxarray() then carries the three bands into galaxy_data.txt as
+PACS-blue, PACS-green and PACS-red.
+'''
+
+import os
+import sys
+import numpy as np
+from astropy.table import Table
+
+from param_utils import open_fits_data, read_fits_columns
+from compare_utils import match_ids, match_sky, unique_matches
+
+#faux table names of the three PACS bands, and their CIGALE filter labels
+pacs_bands = ['PACS1', 'PACS2', 'PACS3']
+pacs_labels = {'PACS1': 'PACS-blue', 'PACS2': 'PACS-green', 'PACS3': 'PACS-red'}
+
+
+def read_main_positions(params):
+    #RA, DEC of every main-table row (memory-mapped; only these two columns are copied)
+    hduls = {}
+    try:
+        main_data = open_fits_data(params.path_to_repos + params.main_table, hduls)
+        names = main_data.columns.names
+        ra_col = 'RA_MOMENT' if 'RA_MOMENT' in names else 'RA'
+        dec_col = 'DEC_MOMENT' if 'DEC_MOMENT' in names else 'DEC'
+        positions = read_fits_columns(main_data, [ra_col, dec_col])
+    finally:
+        for hdul in hduls.values():
+            hdul.close()
+    return np.asarray(positions[ra_col], dtype=float), np.asarray(positions[dec_col], dtype=float)
+
+
+def read_pacs_catalog(params):
+    #only the columns the match and the photometry need
+    columns = params.pacs_flux_cols + params.pacs_err_cols
+    if params.pacs_match == 'sky':
+        columns += [params.pacs_ra_col, params.pacs_dec_col]
+    else:
+        columns += [params.pacs_id_col]
+
+    hduls = {}
+    try:
+        pacs_data = open_fits_data(os.path.join(params.path_to_repos, params.pacs_table), hduls)
+        missing = [column for column in columns if column not in pacs_data.columns.names]
+        if missing:
+            print(f'{params.pacs_table} has no column(s) {missing}. exiting.')
+            sys.exit()
+        return read_fits_columns(pacs_data, columns)
+    finally:
+        for hdul in hduls.values():
+            hdul.close()
+
+
+def match_pacs(params, pacs_tab):
+    '''
+    returns (main-table rows, PACS catalog rows) of every matched galaxy
+    '''
+    if params.pacs_match == 'sky':
+        ra, dec = read_main_positions(params)
+        rows_main, rows_pacs, separations = match_sky(ra, dec, pacs_tab[params.pacs_ra_col],
+                                                      pacs_tab[params.pacs_dec_col], params.pacs_radius)
+        
+        #a PACS source is given to its nearest galaxy only, never copied onto its neighbours as well
+        rows_main, rows_pacs, _, n_conflicts = unique_matches(rows_main, rows_pacs, separations)
+        if n_conflicts:
+            print(f'{n_conflicts} galaxies share their nearest PACS source with a closer galaxy within '
+                  f'{params.pacs_radius} arcsec; they are left without PACS photometry.')
+    else:
+        rows_main, rows_pacs = match_ids(params.IDs, pacs_tab[params.pacs_id_col])
+    return rows_main, rows_pacs
+
+
+def load_pacs_photometry(params):
+    '''
+    PACS1-3 fluxes and errors (mJy) for every main-table row, as a Table with columns PACS1, PACS1_err, ...
+    '''
+    pacs_tab = read_pacs_catalog(params)
+    rows_main, rows_pacs = match_pacs(params, pacs_tab)
+
+    nrows = len(params.IDs)
+    photometry = Table()
+    for band, flux_col, err_col in zip(pacs_bands, params.pacs_flux_cols, params.pacs_err_cols):
+        for name, column in [(band, flux_col), (f'{band}_err', err_col)]:
+            values = np.full(nrows, np.nan)
+            values[rows_main] = np.asarray(pacs_tab[column], dtype=float)[rows_pacs] * params.pacs_to_mJy
+            photometry[name] = values
+
+    print(f'PACS photometry matched for {len(rows_main)} of {nrows} galaxies '
+          f'({len(pacs_tab)} rows in {params.pacs_table}, matched by {params.pacs_match}).')
+    return photometry
@@ -1,7 +1,13 @@
 #create dictionary with keyword and values from param textfile
 
+import os
+import sys
+from functools import cached_property
+import numpy as np
 from astropy.table import Table, Row
+from astropy.io import fits
 from conversion_utils import get_redshift
+from redshift_bin_utils import min_tolerance
 
 
 #used for reading the params.txt file!
@@ -21,6 +27,28 @@ def read_params(param_file):
     return param_dict
 
 
+#open a FITS file once (memory-mapped) and return its first table HDU's data
+#hduls is a {path: HDUList} cache, so main/phot/extinction tables pointing at the same file share one handle
+def open_fits_data(path, hduls):
+    if path not in hduls:
+        hduls[path] = fits.open(path, memmap=True)
+    for hdu in hduls[path]:
+        if isinstance(hdu, (fits.BinTableHDU, fits.TableHDU)):
+            return hdu.data
+    print(f'No table HDU found in {path}. exiting.')
+    sys.exit()
+
+
+#copy only the requested columns (and rows start:stop) out of a memory-mapped FITS table
+def read_fits_columns(fits_data, columns, start=None, stop=None):
+    rows = fits_data[start:stop]
+    return Table([np.array(rows.field(col)) for col in columns], names=columns)
+
+
+#CIGALE input file written for each data_format (CIGALE reads all three as data_file)
+data_file_names = {'txt': 'galaxy_data.txt', 'fits': 'galaxy_data.fits', 'votable': 'galaxy_data.xml'}
+
+
 #define a class...easier for me to organize parameters!
 class Params():
     
@@ -48,17 +76,49 @@ class Params():
 
         self.ncores = param_dict['ncores']
         self.nblocks = param_dict['nblocks']
+        
+        #'auto' --> chosen from free RAM, CPU count and grid size once pcigale.ini is rendered (tuning_utils.py)
+        self.auto_ncores = (self.ncores == 'auto')
+        self.auto_nblocks = (self.nblocks == 'auto')
+        
+        #split the catalog into nshards CIGALE runs (by rows, redshift or region), run under cpu_budget cores
+        self.nshards = int(param_dict.get('nshards', 1))
+        self.shard_by = param_dict.get('shard_by', 'rows')
+        
+        #redshifts snapped to the nearest multiple of this before CIGALE sees them (0 --> full precision)
+        self.redshift_tolerance = float(param_dict.get('redshift_tolerance', 0.))
+        if 0. < self.redshift_tolerance < min_tolerance:
+            print(f'redshift_tolerance {self.redshift_tolerance} is finer than the {min_tolerance} the data file '
+                  'writes redshifts with (bins would merge). use 0 or >= 1e-4. exiting.')
+            sys.exit()
+        self.cpu_budget = int(param_dict.get('cpu_budget', 0)) or os.cpu_count()
+        
+        #only refit galaxies whose input row (or the pcigale.ini grid) changed since the last run
+        self.incremental = bool(int(param_dict.get('incremental', 0)))
         self.output_dir_name = 'out'
 
-        #in order to save the probability distribution functions, ncores = nblocks = 1
+        #in order to save the probability distribution functions, ncores = nblocks = 1 for each CIGALE run...
+        #...so the catalog is instead split into ncores shards, each fit by its own single-core CIGALE process
         self.create_pdfs = bool(int(param_dict['create_pdfs']))
         self.delete_pdf_fits = bool(int(param_dict['delete_PDF_fits']))
+        self.pdf_shards = 1
+        self.pdf_workers = int(param_dict.get('pdf_workers', 1))   #processes used to render the PDF plots
+        self.pdf_store = bool(int(param_dict.get('pdf_store', 0)))   #pack PDF .fits files into one store
+        self.results_store = bool(int(param_dict.get('results_store', 0)))   #export results.fits column by column
+        self.output_archive = param_dict.get('output_archive', 'none')   #none, tar or zip: bundle the per-galaxy files
         if self.create_pdfs:
+            self.pdf_shards = self.cpu_budget if self.auto_ncores else int(self.ncores)
             self.ncores = 1
             self.nblocks = 1
+            self.auto_ncores = self.auto_nblocks = False
 
         self.lim_flag = param_dict['lim_flag']
         
+        #genconf output is cached here per set of SED modules. 'none' --> always run pcigale genconf
+        self.genconf_cache = os.path.expanduser(param_dict.get('genconf_cache', '~/.cache/wiseseds_genconf'))
+        if self.genconf_cache.lower() == 'none':
+            self.genconf_cache = None
+        
         self.sfh_module = param_dict['sfh_module']
         self.dust_module = param_dict['dust_module']
         
@@ -76,35 +136,175 @@ class Params():
         
         self.sed_plots = bool(int(param_dict['sed_plots']))
         
-        self.load_tables()
+        #batch driver (batch_utils.py): walk every brick under brick_root, like the one path_to_repos points at
+        self.brick_root = param_dict.get('brick_root', None)
+        self.batch_mode = param_dict.get('batch_mode', 'per_brick')   #per_brick or combined
+        self.batch_workers = int(param_dict.get('batch_workers', 1))   #processes building the bricks' inputs
+        
+        #cProfile dump of every pipeline stage to {destination}/profiles/{stage}.prof
+        self.profile_stages = bool(int(param_dict.get('profile_stages', 0)))
         
+        #Herschel/PACS photometry from a separate catalog, matched to the main table by ID or by position
+        self.pacs_table = param_dict.get('pacs_table', None)
+        if (self.pacs_table is not None) and (self.pacs_table.lower() == 'none'):
+            self.pacs_table = None
+        self.pacs_match = param_dict.get('pacs_match', 'id')   #id or sky
+        self.pacs_id_col = param_dict.get('pacs_ID_col', self.id_col)
+        self.pacs_ra_col = param_dict.get('pacs_RA_col', 'RA')
+        self.pacs_dec_col = param_dict.get('pacs_DEC_col', 'DEC')
+        self.pacs_radius = float(param_dict.get('pacs_radius', 6.))   #arcsec
+        self.pacs_flux_cols = param_dict.get('pacs_flux_cols', 'F70-F100-F160').split('-')
+        self.pacs_err_cols = param_dict.get('pacs_err_cols', 'E70-E100-E160').split('-')
+        self.pacs_to_mJy = float(param_dict.get('pacs_to_mJy', 1.))
+        
+        #pre-flight thresholds (preflight_utils.py): CIGALE is not launched if any is exceeded. none --> no limit
+        self.preflight_max_bad_frac = self.optional_float(param_dict.get('preflight_max_bad_frac', 'none'))
+        self.preflight_max_evals = self.optional_float(param_dict.get('preflight_max_evals', 'none'))
+        self.preflight_max_hours = self.optional_float(param_dict.get('preflight_max_hours', 'none'))
+        
+        #number of rows per chunk when streaming the photometry tables. 0 --> read tables whole
+        self.chunk_size = int(param_dict.get('chunk_size', 0))
+        
+        #txt (galaxy_data.txt), or a fits/votable binary table written straight from the flux arrays
+        self.data_format = param_dict.get('data_format', 'txt')
+        if self.data_format not in data_file_names:
+            print(f'data_format must be one of {list(data_file_names)}, not {self.data_format}. exiting.')
+            sys.exit()
+        self.data_file = data_file_names[self.data_format]
+        
+        #shards and incremental runs split/compare galaxy_data.txt line by line
+        if (self.data_format != 'txt') and (self.nshards > 1 or self.pdf_shards > 1 or self.incremental):
+            print(f'data_format {self.data_format} cannot be used with nshards > 1, incremental = 1 or '
+                  'create_pdfs = 1 with ncores > 1. use data_format txt. exiting.')
+            sys.exit()
+        
+        #incremental runs carry over the per-galaxy files of best_SED_models/ and PDF_fits/, not archive members
+        if (self.output_archive != 'none') and self.incremental:
+            print(f'output_archive {self.output_archive} cannot be used with incremental = 1 (unchanged galaxies '
+                  'keep their files from best_SED_models/ and PDF_fits/). use output_archive none. exiting.')
+            sys.exit()
+        
+        #...nor the packed PDF grids of out/pdf_store/
+        if self.pdf_store and self.incremental:
+            print('pdf_store = 1 cannot be used with incremental = 1 (unchanged galaxies keep their PDF .fits files '
+                  'from PDF_fits/). use pdf_store 0. exiting.')
+            sys.exit()
+        
+        #tables are NOT read here -- main_tab, flux_tab and ext_tab are loaded on first use
+        self._table_cache = {}
+        
+    @staticmethod
+    def optional_float(value):
+        return None if value.lower() == 'none' else float(value)
+    
     ##################################################
     # class functions for loading tables and columns #
     ##################################################
 
-    def load_tables(self):
+    def read_table(self, table_name):
         #suppress warning text...do not want, do not need.
         import warnings
         from astropy.units import UnitsWarning
         warnings.filterwarnings("ignore", category=UnitsWarning)
-                
-        #load the tables
-        self.main_tab = Table.read(self.path_to_repos + self.main_table)
-        self.flux_tab = Table.read(self.path_to_repos + self.phot_table)
-        self.ext_tab = Table.read(self.path_to_repos + self.extinction_table)
+        
+        #main, phot and extinction tables pointing at the same file are read (and held) only once
+        path = self.path_to_repos + table_name
+        if path not in self._table_cache:
+            self._table_cache[path] = Table.read(path)
+        return self._table_cache[path]
+    
+    @cached_property
+    def main_tab(self):
+        
+        #streaming mode: only pull ID and redshift (or Vcosmic) out of the main table.
+        #the photometry is read chunk-by-chunk later on (see iter_chunks)
+        if self.chunk_size:
+            hduls = {}
+            try:
+                main_data = open_fits_data(self.path_to_repos + self.main_table, hduls)
+                return read_fits_columns(main_data, [self.id_col, self.z_column()])
+            finally:
+                for hdul in hduls.values():
+                    hdul.close()
+        
+        return self.read_table(self.main_table)
+    
+    @cached_property
+    def flux_tab(self):
+        return self.read_table(self.phot_table)
+    
+    @cached_property
+    def ext_tab(self):
+        return self.read_table(self.extinction_table)
+    
+    #load every table now rather than on first use
+    def load_tables(self):
+        self.main_tab
+        if not self.chunk_size:
+            self.flux_tab
+            self.ext_tab
+    
+    #if "vf" in the vcosmic_table name, then must be using Virgo catalogs...thus, Vcosmic column is available
+    #otherwise, just use the redshift column
+    def z_column(self):
+        if 'vf' in self.phot_table:
+            return self.Vcosmic_column
+        return self.redshift_column
+    
+    def to_redshift(self, z_values):
+        if 'vf' in self.phot_table:
+            return get_redshift(z_values)
+        return z_values
             
     def load_columns(self):
         self.IDs = self.main_tab[self.id_col]
-
-        #if "vf" in the vcosmic_table name, then must be using Virgo catalogs...thus, Vcosmic column is available
-        if 'vf' in self.phot_table:
-            Vcosmic_array = self.main_tab[self.Vcosmic_column]
-            self.redshifts = get_redshift(Vcosmic_array)
-
-        #otherwise, just use the redshift column
-        else:
-            self.redshifts = self.main_tab[self.redshift_column]
+        self.redshifts = self.to_redshift(self.main_tab[self.z_column()])
+    
+    #############################################################
+    # stream the tables in fixed-size row chunks (memory-mapped) #
+    #############################################################
+    
+    def iter_chunks(self, bands, chunk_size=None):
+        '''
+        yields (IDs, redshifts, flux_tab, ext_tab) for every block of chunk_size rows.
+        each FITS file is opened once and memory-mapped; only ID, redshift/Vcosmic, DEC and the 
+        flux, flux error and extinction columns of the requested bands are ever copied into memory.
+        '''
+        chunk_size = chunk_size or self.chunk_size
+        
+        hduls = {}
+        try:
+            main_data = open_fits_data(self.path_to_repos + self.main_table, hduls)
+            flux_data = open_fits_data(self.path_to_repos + self.phot_table, hduls)
+            ext_data = open_fits_data(self.path_to_repos + self.extinction_table, hduls)
             
+            dec_col = 'DEC_MOMENT' if 'DEC_MOMENT' in flux_data.columns.names else 'DEC'
+            flux_cols = [dec_col] + [self.flux_id_col + band for band in bands] \
+                                  + [self.flux_id_col_err + band for band in bands]
+            ext_cols = [self.extinction_col + band for band in bands]
+            
+            #photometry and extinction in the same file --> read both column sets in one go
+            same_file = (self.phot_table == self.extinction_table)
+            
+            for start in range(0, len(main_data), chunk_size):
+                stop = start + chunk_size
+                
+                main_chunk = read_fits_columns(main_data, [self.id_col, self.z_column()], start, stop)
+                if same_file:
+                    flux_chunk = read_fits_columns(flux_data, flux_cols + ext_cols, start, stop)
+                    ext_chunk = flux_chunk
+                else:
+                    flux_chunk = read_fits_columns(flux_data, flux_cols, start, stop)
+                    ext_chunk = read_fits_columns(ext_data, ext_cols, start, stop)
+                
+                IDs = np.asarray(main_chunk[self.id_col])
+                redshifts = np.asarray(self.to_redshift(main_chunk[self.z_column()]))
+                
+                yield IDs, redshifts, flux_chunk, ext_chunk
+        finally:
+            for hdul in hduls.values():
+                hdul.close()
+        
         
     #finds the name of the directory to which CIGALE is moving the contents of '/out' before executing this next run.
     def find_out(self):
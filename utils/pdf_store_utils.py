@@ -0,0 +1,149 @@
+'''
+Consolidated store for the per-galaxy, per-parameter PDF .fits files that CIGALE writes into out/
+when save_chi2 = properties.
+
+Instead of 9+ tiny {galaxy_id}_{param}.fits files per galaxy, a store directory holds:
+    values.npy        -- every parameter grid, concatenated (float64, memory-mappable)
+    probability.npy   -- the matching probabilities, concatenated
+    index.fits        -- one row per (galaxy, parameter): id, param, xcol, offset, length
+'''
+
+import os
+import numpy as np
+from astropy.table import Table, vstack
+from astropy.io import fits
+
+
+###########################################
+# Pack {galaxy_id}_{param}.fits --> store #
+###########################################
+
+def find_pdf_fits(out_dir, param_names):
+    '''
+    single scan of out_dir. returns a list of (galaxy_id, param, filename) for every PDF .fits file.
+    param_names are the bayes parameters without the 'bayes.' prefix (e.g., 'sfh.sfr').
+    '''
+    #longest suffix first, so that e.g. '_sfh.burst_age.fits' is never mistaken for a shorter parameter
+    suffixes = sorted([(f'_{param}.fits', param) for param in param_names], key=lambda x: -len(x[0]))
+
+    found = []
+    with os.scandir(out_dir) as entries:
+        for entry in entries:
+            if not entry.name.endswith('.fits') or not entry.is_file():
+                continue
+            for suffix, param in suffixes:
+                if entry.name.endswith(suffix):
+                    found.append((entry.name[:-len(suffix)], param, entry.name))
+                    break
+
+    return found
+
+
+def pack_pdf_fits(out_dir, param_names, store_name='pdf_store', delete_fits=True):
+    '''
+    pack every PDF .fits file in out_dir into out_dir/store_name (appending if the store already exists).
+    the original .fits files are removed once the store is written, unless delete_fits=False.
+    returns the path to the store, or None if there is nothing to pack and no store yet.
+    '''
+    store_dir = os.path.join(out_dir, store_name)
+    pdf_files = find_pdf_fits(out_dir, param_names)
+
+    if not pdf_files:
+        print(f'No PDF .fits files found in {out_dir}. Nothing to pack.')
+        return store_dir if os.path.exists(os.path.join(store_dir, 'index.fits')) else None
+
+    values, probabilities = [], []
+    ids, params, xcols, lengths = [], [], [], []
+
+    for galaxy_id, param, filename in pdf_files:
+        with fits.open(os.path.join(out_dir, filename), memmap=False) as hdul:
+            data = hdul[1].data
+            xcol = [c for c in data.columns.names if c != 'probability'][0]
+            values.append(np.asarray(data[xcol], dtype=np.float64))
+            probabilities.append(np.asarray(data['probability'], dtype=np.float64))
+
+        ids.append(galaxy_id)
+        params.append(param)
+        xcols.append(xcol)
+        lengths.append(len(values[-1]))
+
+    values = np.concatenate(values)
+    probabilities = np.concatenate(probabilities)
+    lengths = np.array(lengths, dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+
+    #existing store (e.g., from an earlier shard or incremental run) --> append behind it
+    os.makedirs(store_dir, exist_ok=True)
+    index_path = os.path.join(store_dir, 'index.fits')
+    if os.path.exists(index_path):
+        old_index = Table.read(index_path)
+        old_values = np.load(os.path.join(store_dir, 'values.npy'))
+        old_probabilities = np.load(os.path.join(store_dir, 'probability.npy'))
+
+        offsets = offsets + len(old_values)
+        values = np.concatenate([old_values, values])
+        probabilities = np.concatenate([old_probabilities, probabilities])
+
+    index = Table([ids, params, xcols, offsets, lengths], names=['id', 'param', 'xcol', 'offset', 'length'])
+    if os.path.exists(index_path):
+        index = vstack([old_index, index])
+
+    np.save(os.path.join(store_dir, 'values.npy'), values)
+    np.save(os.path.join(store_dir, 'probability.npy'), probabilities)
+    index.write(index_path, overwrite=True)
+
+    if delete_fits:
+        for _, _, filename in pdf_files:
+            os.remove(os.path.join(out_dir, filename))
+
+    print(f'Packed {len(pdf_files)} PDF .fits files into {store_dir}')
+
+    return store_dir
+
+
+######################
+# Read from the store #
+######################
+
+class PDFStore():
+    '''
+    read-only access to a packed store. the value/probability blocks are memory-mapped, so opening a
+    store is cheap and only the requested grids are ever read from disk.
+    '''
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+
+        self.index = Table.read(os.path.join(store_dir, 'index.fits'))
+        self.values = np.load(os.path.join(store_dir, 'values.npy'), mmap_mode='r')
+        self.probability = np.load(os.path.join(store_dir, 'probability.npy'), mmap_mode='r')
+
+        #(galaxy_id, param) --> row of the index. later rows (re-packed galaxies) win.
+        self._rows = {(str(galaxy_id), str(param)): n
+                      for n, (galaxy_id, param) in enumerate(zip(self.index['id'], self.index['param']))}
+
+    def __contains__(self, key):
+        return (str(key[0]), str(key[1])) in self._rows
+
+    def galaxy_ids(self):
+        return sorted(set(galaxy_id for galaxy_id, _ in self._rows))
+
+    def params(self, galaxy_id):
+        return [param for gal, param in self._rows if gal == str(galaxy_id)]
+
+    def get(self, galaxy_id, param):
+        '''
+        returns (xcol, x values, probability) for one galaxy and one parameter (no 'bayes.' prefix)
+        '''
+        try:
+            row = self.index[self._rows[(str(galaxy_id), str(param))]]
+        except KeyError:
+            raise KeyError(f'{galaxy_id} {param} not found in {self.store_dir}')
+
+        start, stop = row['offset'], row['offset'] + row['length']
+        return str(row['xcol']), np.array(self.values[start:stop]), np.array(self.probability[start:stop])
+
+    def get_table(self, galaxy_id, param):
+        #same layout as the original {galaxy_id}_{param}.fits file
+        xcol, x, probability = self.get(galaxy_id, param)
+        return Table([x, probability], names=[xcol, 'probability'])
@@ -0,0 +1,223 @@
+'''
+In-process version of the run_cigale.py workflow. Each stage is a plain function of one shared Params
+object, so catalogs are read (at most) once and nothing is re-imported between stages.
+
+stages, in order: write_inputs --> genconf --> preflight --> run --> export_results --> sed_plots --> pdfs
+'''
+
+import os
+from astropy.table import Table
+
+from init_utils import create_flux_table, create_ini_files, add_params, get_bayes_list
+from cigale_utils import run_cigale, run_sed_plots, organize_sed_output
+from shard_utils import run_cigale_sharded
+from incremental_utils import run_cigale_incremental
+from ini_utils import generate_pcigale_ini
+from tuning_utils import apply_auto_tuning, resolve_auto_tuning
+from results_store_utils import export_results, ResultsStore
+from preflight_utils import run_preflight
+from profile_utils import profile_stage, substage, stage_galaxies, write_run_report, print_run_report
+
+
+##########
+# Stages #
+##########
+
+def stage_write_inputs(params):
+
+    #send the print warning about where previous run's CIGALE output will be moved
+    params.find_out()
+
+    #load IDs and redshifts!
+    with substage('load_columns'):
+        params.load_columns()
+
+    print('Generating flux table and input .ini files for CIGALE...')
+    create_flux_table(params)
+    create_ini_files(params)
+
+
+def stage_genconf(params):
+
+    #configure input files and generate configuration files
+    print('Configuring input text files...')
+    generate_pcigale_ini(params.dir_path, params.genconf_cache)
+
+    #modify pcigale.ini according to our settings
+    add_params(params.dir_path, params.sed_plots, params.lim_flag, 1 if params.auto_nblocks else params.nblocks,
+               create_pdfs=params.create_pdfs)
+    
+    #ncores/nblocks = auto --> size them to this machine and the grid now that pcigale.ini is complete
+    if params.auto_ncores or params.auto_nblocks:
+        apply_auto_tuning(params)
+
+
+def stage_preflight(params):
+
+    #input problems + cost of the run. exits here (before CIGALE) if a preflight_* threshold is exceeded
+    run_preflight(params)
+
+
+def stage_run(params):
+
+    #pick up auto-tuned ncores/nblocks if genconf ran in another process
+    resolve_auto_tuning(params)
+
+    #only new/changed galaxies are fit (sharded as below), then merged into the previous out/ (incremental_utils.py)
+    if params.incremental:
+        print('Executing CIGALE (incremental)...')
+        if params.create_pdfs:
+            nshards = max(params.pdf_shards, params.nshards)
+            cores, cpu_budget = 1, min(params.cpu_budget, nshards)
+        else:
+            nshards, cores, cpu_budget = params.nshards, int(params.ncores), params.cpu_budget
+        run_cigale_incremental(params.destination, cores=cores, out_dir_name=params.output_dir_name, nshards=nshards,
+                               by=params.shard_by, cpu_budget=cpu_budget, sed_plots=params.sed_plots)
+    
+    #PDF runs need cores = blocks = 1 per CIGALE process. run several single-core shards side by side instead.
+    elif params.create_pdfs and (max(params.pdf_shards, params.nshards) > 1):
+        print('Executing CIGALE on single-core shards...')
+        #as many shards side by side as there are, never more than cpu_budget
+        nshards = max(params.pdf_shards, params.nshards)
+        run_cigale_sharded(params.destination, nshards, by=params.shard_by, cores_per_shard=1,
+                           cpu_budget=min(params.cpu_budget, nshards), out_dir_name=params.output_dir_name)
+    
+    #sharded run: each shard gets ncores cores, at most cpu_budget cores in use at once
+    elif params.nshards > 1:
+        print(f'Executing CIGALE on {params.nshards} shards...')
+        run_cigale_sharded(params.destination, params.nshards, by=params.shard_by, cores_per_shard=int(params.ncores),
+                           cpu_budget=params.cpu_budget, out_dir_name=params.output_dir_name)
+    
+    else:
+        print('Executing CIGALE...')
+        run_cigale(params.destination)
+
+    params.find_out()     #determine most recently edited out*/ directory. needed!
+
+
+def stage_export_results(params):
+
+    if not params.results_store:
+        return
+
+    print('Exporting results.fits to the columnar results store...')
+    export_results(os.path.join(params.destination, params.output_dir_name))
+
+
+def stage_sed_plots(params):
+
+    #incremental runs plot the refit galaxies before the merge; the others keep their plots from earlier runs
+    if not params.sed_plots or params.incremental:
+        return
+
+    print('Generating SED plots...')
+    run_sed_plots(params.destination)
+
+    print('Organizing output...')
+    organize_sed_output(params.destination, out_dir_name=params.output_dir_name, archive=params.output_archive)
+
+
+def stage_pdfs(params):
+
+    if not params.create_pdfs:
+        return
+
+    render_all_pdfs(params)
+
+
+#PDF + corner plot for every galaxy in results.fits, then tidy up the per-galaxy PDF .fits files
+def render_all_pdfs(params):
+
+    #matplotlib + seaborn are slow to import. only pay for them if PDFs are requested.
+    from plotting_utils import generate_pdfs_parallel, organize_pdf_fits
+
+    out_dir = os.path.join(params.destination, params.output_dir_name)
+
+    #columnar store --> only the id, bayes, bayes error and best columns the plots use are read
+    if params.results_store and os.path.isdir(os.path.join(out_dir, 'results_store')):
+        store = ResultsStore(os.path.join(out_dir, 'results_store'))
+        bayes_list = store.bayes_list()
+        params_only = [item.replace('bayes.','') for item in bayes_list]
+        results = store.get(['id'] + bayes_list + [item+'_err' for item in bayes_list] +
+                            [f'best.{item}' for item in params_only if f'best.{item}' in store.colnames])
+    else:
+        #read results.fits output ONCE
+        results = Table.read(os.path.join(out_dir, 'results.fits'))
+
+        #get list of bayes parameters!
+        bayes_list = get_bayes_list(results)
+
+    #ensure output directory exists...
+    os.makedirs(os.path.join(out_dir, 'PDF_fits'), exist_ok=True)
+
+    #pack the per-galaxy PDF .fits files into one store (and remove them) before plotting
+    store_dir = None
+    if params.pdf_store:
+        from pdf_store_utils import pack_pdf_fits
+        store_dir = pack_pdf_fits(out_dir, [item.replace('bayes.','') for item in bayes_list])
+        if store_dir is None:
+            print('No PDF .fits files and no PDF store (was save_chi2 = properties set?). No PDFs to plot.')
+            return
+
+    #one PDF + corner plot per galaxy, spread over pdf_workers processes. 
+    #galaxies with both .pdf files already on disk (from an interrupted run) are skipped.
+    generate_pdfs_parallel(results, params.destination, bayes_list, params.output_dir_name, 
+                           nworkers=params.pdf_workers, store_dir=store_dir)
+
+    #PDF .fits files were already consolidated into the store
+    if params.pdf_store:
+        return
+
+    #removes the .fits used for the PDFs (9 per galaxy)...or moves (archives) them all to PDF_fits in one sweep
+    organize_pdf_fits(out_dir, [item.replace('bayes.','') for item in bayes_list], params.delete_pdf_fits,
+                      params.output_archive)
+
+
+stage_list = [('write_inputs', stage_write_inputs),
+              ('genconf', stage_genconf),
+              ('preflight', stage_preflight),
+              ('run', stage_run),
+              ('export_results', stage_export_results),
+              ('sed_plots', stage_sed_plots),
+              ('pdfs', stage_pdfs)]
+
+
+##################
+# Run the stages #
+##################
+
+def run_pipeline(params, stages=None):
+    '''
+    run the requested stages (default: all of them, in order) and return a {stage: seconds} dictionary.
+    the working directory is restored after every stage, since the CIGALE helpers os.chdir() around.
+    every stage is also profiled (time, memory, I/O, galaxies) into {destination}/run_report.json.
+    '''
+    if stages is None:
+        stages = [name for name, _ in stage_list]
+
+    cwd = os.getcwd()
+    destination = os.path.abspath(params.destination)
+    profile_dir = os.path.join(destination, 'profiles') if params.profile_stages else None
+    records = []
+
+    try:
+        for name, stage in stage_list:
+            if name not in stages:
+                continue
+            try:
+                record = profile_stage(name, stage, params, profile_dir)
+            finally:
+                os.chdir(cwd)
+            record['galaxies'] = stage_galaxies(name, params)
+            records.append(record)
+    finally:
+        #stages that finished are reported even if a later one fails
+        if records:
+            write_run_report(destination, records)
+
+    print_run_report(records)
+    print(f'Run report written to {os.path.join(destination, "run_report.json")}')
+    if profile_dir:
+        print(f'cProfile dumps written to {profile_dir}/{{stage}}.prof (read with python -m pstats)')
+
+    return {record['name']: record['wall_s'] for record in records}
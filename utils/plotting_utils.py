@@ -14,39 +14,20 @@ from astropy.table import Table
 from seaborn import pairplot, load_dataset
 import pandas as pd
 
+from pdf_store_utils import PDFStore
+from organize_utils import organize_output
+
 
 ################################################################
 # Move or delete PDF fits files once used for diagnostic plots #
 ################################################################
-def organize_pdf_fits(destination, main_tab, id_col, out_dir_name):
-    #move to out/ directory
-    os.chdir(os.path.join(destination, out_dir_name))
+def organize_pdf_fits(out_dir, param_names, delete_fits=False, archive='none'):
     
-    #create directory for PDF fits
-    os.makedirs('PDF_fits', exist_ok=True)
+    #one scan of out/ for every {galaxy_id}_{param}.fits file --> removed, or moved to PDF_fits/ (or its archive)
+    counts = organize_output(out_dir, ['pdf_fits'], param_names, 
+                             delete_kinds=('pdf_fits',) if delete_fits else (), archive=archive)
     
-    len_tab = len(main_tab)
-
-    #4 for VFID (VFS), 5 for OBJID (WISESize)
-    if len(str(id_col)) == 4:
-        formatted_strings = [f"{num:04}" for num in range(len_tab)]
-        ID_prefix='VFID'
-    else:
-        formatted_strings = [f"{num:05}" for num in range(len_tab)]
-        ID_prefix='OBJID'
-
-    #move all galaxy fits files to PDF_fits
-    for num in formatted_strings:
-        galID = f'{ID_prefix}{num}'
-        os.system(f'mv {galID}*fits PDF_fits')
-
-
-def handle_pdf_fits(destination, main_tab, galaxy_id, id_col, delete_fits, out_dir_name):
-    
-    if delete_fits:
-        os.system(f'rm {destination}{out_dir_name}/{galaxy_id}*.fits')
-    else:
-        organize_pdf_fits(destination, main_tab, id_col, out_dir_name)
+    print(f"{counts['pdf_fits']} PDF .fits files {'removed' if delete_fits else 'organized'}")
 
 ####################################
 # Code to generate the corner plot #
@@ -57,13 +38,13 @@ def corner_plot(df, destination, out_dir_name, galaxy_id, color='orange'):
     cplot = pairplot(df,kind='kde',corner=True,diag_kws={'color': color},
             plot_kws={'color': f'dark{color}'})
     cplot.savefig(f'{destination}{out_dir_name}/PDF_fits/{galaxy_id}_corner.pdf')
-    plt.close()
+    plt.close(cplot.figure)
 
 
 #####################
 # Generate the PDFs #
 #####################
-def generate_PDF_plot(results, destination, index, bayes_list, out_dir_name):
+def generate_PDF_plot(results, destination, index, bayes_list, out_dir_name, fig=None, ax=None, store=None):
     
     #create empty table into which I will add all read-in variables and probabilities
     df = pd.DataFrame([])
@@ -76,9 +57,15 @@ def generate_PDF_plot(results, destination, index, bayes_list, out_dir_name):
     except:
         print('bayes.sfh.tau_main and/or bayes.stellar.metallicity not found. not removed from list of bayes parameters.')
     
-    fig, ax = plt.subplots(3, 3,figsize=(26,16))
+    #reuse a figure template if one is given (parallel workers); otherwise create a fresh figure
+    reuse_figure = fig is not None
+    if reuse_figure:
+        for a in ax:
+            a.cla()
+    else:
+        fig, ax = plt.subplots(3, 3,figsize=(26,16))
+        ax = ax.flatten()
     fig.suptitle(f'{galaxy_id} Probability Distribution Functions',fontsize=30,y=0.92)
-    ax = ax.flatten()
     
     for n, item in enumerate(bayes_list):
         
@@ -89,7 +76,12 @@ def generate_PDF_plot(results, destination, index, bayes_list, out_dir_name):
         ax[n].axvspan(x_val-x_err, x_val+x_err, alpha=0.1, color='red')   #shaded region
 
         item = item.replace('bayes.','')
-        prob_tab = Table.read(f'{destination}{out_dir_name}/{galaxy_id}_{item}.fits')
+        
+        #read the probability grid from the packed PDF store if there is one, else from the .fits file
+        if store is not None:
+            prob_tab = store.get_table(galaxy_id, item)
+        else:
+            prob_tab = Table.read(f'{destination}{out_dir_name}/{galaxy_id}_{item}.fits')
 
         xcol=[c for c in prob_tab.colnames if c != 'probability'][0]
         
@@ -113,7 +105,8 @@ def generate_PDF_plot(results, destination, index, bayes_list, out_dir_name):
 
     fig.savefig(f'{destination}{out_dir_name}/PDF_fits/{galaxy_id}_PDF.pdf', 
                 bbox_inches='tight', pad_inches=0.2, dpi=100)
-    plt.close()
+    if not reuse_figure:
+        plt.close(fig)
     
     return df, galaxy_id
     
@@ -121,9 +114,85 @@ def generate_PDF_plot(results, destination, index, bayes_list, out_dir_name):
 ###############################################
 # Generate the PDFs AND the corner plot .pdfs #
 ###############################################
-def generate_pdfs(results, destination, index, bayes_list, out_dir_name):
+def generate_pdfs(results, destination, index, bayes_list, out_dir_name, fig=None, ax=None, store=None):
     
     #simple function -- two lines. yay.
     #(or four, if you count these two comments. OR five, if you count the def ____: line)
-    df, galaxy_id = generate_PDF_plot(results, destination, index, bayes_list, out_dir_name)
-    corner_plot(df, destination, out_dir_name, galaxy_id)
\ No newline at end of file
+    df, galaxy_id = generate_PDF_plot(results, destination, index, bayes_list, out_dir_name, 
+                                      fig=fig, ax=ax, store=store)
+    corner_plot(df, destination, out_dir_name, galaxy_id)
+
+
+#########################################################
+# Generate PDFs + corner plots for MANY galaxies at once #
+#########################################################
+
+#both output .pdf files already exist --> galaxy can be skipped when resuming
+def pdfs_exist(destination, out_dir_name, galaxy_id):
+    pdf_dir = f'{destination}{out_dir_name}/PDF_fits'
+    return os.path.exists(f'{pdf_dir}/{galaxy_id}_PDF.pdf') & os.path.exists(f'{pdf_dir}/{galaxy_id}_corner.pdf')
+
+
+#every worker (or the main process, if serial) holds the results table and ONE reusable 3x3 figure
+_worker_state = {}
+
+def _init_pdf_worker(results, destination, bayes_list, out_dir_name, store_dir=None, backend='Agg'):
+    
+    #non-interactive backend: nothing is ever shown, only saved
+    if backend is not None:
+        plt.switch_backend(backend)
+    
+    fig, ax = plt.subplots(3, 3, figsize=(26,16))
+    
+    #each worker opens (memory-maps) the PDF store itself; only the path crosses process boundaries
+    store = PDFStore(store_dir) if store_dir is not None else None
+    
+    _worker_state.update(results=results, destination=destination, bayes_list=bayes_list, 
+                         out_dir_name=out_dir_name, fig=fig, ax=ax.flatten(), store=store)
+
+
+def _render_pdf(index):
+    state = _worker_state
+    
+    #generate_PDF_plot trims the bayes list, so hand it a copy every time
+    generate_pdfs(state['results'], state['destination'], index, list(state['bayes_list']), 
+                  state['out_dir_name'], fig=state['fig'], ax=state['ax'], store=state['store'])
+    
+    return state['results']['id'][index]
+
+
+def generate_pdfs_parallel(results, destination, bayes_list, out_dir_name, nworkers=1, overwrite=False, 
+                           store_dir=None):
+    '''
+    PDF + corner plot for every galaxy in results, spread over nworkers processes.
+    probability grids are read from the packed PDF store in store_dir if given (see pdf_store_utils.py).
+    galaxies whose _PDF.pdf and _corner.pdf already exist are skipped unless overwrite=True.
+    returns the list of galaxy IDs rendered during this call.
+    '''
+    
+    indices = [index for index in range(len(results)) 
+               if overwrite or not pdfs_exist(destination, out_dir_name, results['id'][index])]
+    
+    n_skipped = len(results) - len(indices)
+    if n_skipped:
+        print(f'{n_skipped} galaxies already have PDF + corner plots. skipping these.')
+    
+    if not indices:
+        return []
+    
+    #serial: no pool, same figure template, current backend
+    if nworkers <= 1:
+        _init_pdf_worker(results, destination, bayes_list, out_dir_name, store_dir=store_dir, backend=None)
+        try:
+            return [_render_pdf(index) for index in indices]
+        finally:
+            plt.close(_worker_state['fig'])
+            _worker_state.clear()
+    
+    from multiprocessing import Pool
+    
+    with Pool(processes=nworkers, initializer=_init_pdf_worker, 
+              initargs=(results, destination, bayes_list, out_dir_name, store_dir)) as pool:
+        rendered = pool.map(_render_pdf, indices, chunksize=max(1, len(indices)//(4*nworkers)))
+    
+    return rendered
\ No newline at end of file
@@ -0,0 +1,238 @@
+'''
+Pre-flight checks of the CIGALE input, before a (possibly hours-long) pcigale run is launched.
+
+While create_flux_table() writes the data file, PreflightScan looks at every faux table on the way through
+(no extra reads) and counts, per failure class,
+    trimmed_redshift -- redshift <= 0 or not finite, dropped by trim_tables before the faux tables are built
+    nan_photometry   -- galaxies with no finite flux in any band their hemisphere writes
+    bad_redshift     -- redshift <= 0 or not finite, yet written (trim = False, or a trim_tables that missed them)
+    no_hemisphere    -- DEC exactly 32 (or nan): neither flag_north nor flag_south, so never written
+    duplicate_id     -- rows whose galaxy ID already appeared earlier in the catalog
+plus the per-band coverage and the galaxies per hemisphere. Fractions are taken over all rows read, trimmed or not. The counts go to {destination}/preflight.json.
+
+The preflight stage (after genconf) adds the cost of the run from plan_grid() -- galaxies x models per redshift,
+models in total and, once calibrated, the predicted wall time -- prints the report, and refuses to launch CIGALE
+when a threshold in params.txt is exceeded:
+    preflight_max_bad_frac   largest fraction of galaxies allowed in any failure class
+    preflight_max_evals      largest galaxies x models per redshift
+    preflight_max_hours      longest predicted wall time (needs CLI_scripts/plan_grid.py -calibrate)
+'''
+
+import os
+import sys
+import json
+import numpy as np
+
+from grid_utils import plan_grid, predict_walltime
+from profile_utils import substage
+
+failure_classes = ['trimmed_redshift', 'nan_photometry', 'bad_redshift', 'no_hemisphere', 'duplicate_id']
+
+#galaxy IDs listed in the report for each failure class
+n_examples = 5
+
+
+################
+# Input checks #
+################
+
+class PreflightScan():
+    '''
+    failure counts, band coverage and hemisphere counts, accumulated over the faux table(s) of one catalog.
+    layout is the BandLayout the data file is written with.
+    '''
+
+    def __init__(self, layout):
+        self.layout = layout
+        self.counts = {'rows_read': 0, 'rows': 0, 'north': 0, 'south': 0, **{name: 0 for name in failure_classes}}
+        self.coverage = np.zeros(len(layout.labels), dtype=int)
+        self.examples = {name: [] for name in failure_classes}
+        self._ids = []
+        self._trim_seen = False   #rows_read comes from add_trimmed() when the catalog is trimmed
+
+    def flag(self, name, IDs, bad):
+        self.counts[name] += int(np.count_nonzero(bad))
+        room = n_examples - len(self.examples[name])
+        if room > 0:
+            self.examples[name] += IDs[bad][:room].tolist()
+
+    @staticmethod
+    def galaxy_ids(IDs):
+        IDs = np.asarray(IDs)
+        if IDs.dtype.kind == 'S':
+            IDs = np.char.decode(IDs, 'utf-8')
+        return IDs.astype(str)
+
+    def add_trimmed(self, IDs, redshifts):
+        #rows of the catalog before trim_tables; the ones it drops are counted here, the rest again in add()
+        IDs = self.galaxy_ids(IDs)
+        self.counts['rows_read'] += len(IDs)
+        with np.errstate(invalid='ignore'):
+            self.flag('trimmed_redshift', IDs, ~(np.asarray(redshifts, dtype=float) > 0.))
+        self._trim_seen = True
+
+    def add(self, faux_table):
+
+        IDs = self.galaxy_ids(faux_table['OBJID'])
+        self._ids.append(IDs)
+        self.counts['rows'] += len(IDs)
+        if not self._trim_seen:
+            self.counts['rows_read'] += len(IDs)
+
+        with np.errstate(invalid='ignore'):
+            z = np.asarray(faux_table['redshift'], dtype=float)
+            self.flag('bad_redshift', IDs, ~(z > 0.))
+
+        north = np.asarray(faux_table['flag_north'])
+        south = np.asarray(faux_table['flag_south'])
+        self.flag('no_hemisphere', IDs, ~(north | south))
+
+        #fluxes of every output column, for the rows of each hemisphere (-1 --> the nan column)
+        fluxes = np.column_stack([np.asarray(faux_table[band], dtype=float) for band in self.layout.band_axis] +
+                                 [np.full(len(IDs), np.nan)])
+        for region, rows in [('north', north), ('south', south)]:
+            finite = np.isfinite(fluxes[rows][:, self.layout.gather[region]])
+            self.counts[region] += int(np.count_nonzero(rows))
+            self.coverage += finite.sum(axis=0)
+            self.flag('nan_photometry', IDs[rows], ~finite.any(axis=1))
+
+    def watch(self, fauxtabs):
+        #pass the faux tables through unchanged, scanning each one on the way
+        for faux_table in fauxtabs:
+            with substage('preflight_scan'):
+                self.add(faux_table)
+            yield faux_table
+
+    def result(self):
+
+        #IDs may repeat across chunks, so duplicates are only counted once the whole catalog is seen
+        IDs = np.concatenate(self._ids) if self._ids else np.array([], dtype=str)
+        unique, first, counts = np.unique(IDs, return_index=True, return_counts=True)
+        self.counts['duplicate_id'] = int(len(IDs) - len(unique))
+        self.examples['duplicate_id'] = unique[counts > 1][np.argsort(first[counts > 1])][:n_examples].tolist()
+
+        written = self.counts['north'] + self.counts['south']
+        return {'counts': dict(self.counts),
+                'examples': {name: ids for name, ids in self.examples.items() if ids},
+                'coverage': {label: int(n) for label, n in zip(self.layout.labels, self.coverage)},
+                'written': written}
+
+
+def write_preflight(destination, report):
+    with open(os.path.join(destination, 'preflight.json'), 'w') as file:
+        json.dump(report, file, indent=1)
+
+
+def read_preflight(destination):
+    path = os.path.join(destination, 'preflight.json')
+    if not os.path.exists(path):
+        return None
+    with open(path) as file:
+        return json.load(file)
+
+
+########
+# Cost #
+########
+
+def estimate_cost(params):
+    #cost of fitting the data file with the rendered pcigale.ini, or None before genconf
+    ini_path = os.path.join(params.destination, 'pcigale.ini')
+    data_path = os.path.join(params.destination, params.data_file)
+    if not os.path.exists(ini_path):
+        return None
+
+    plan = plan_grid(ini_path, data_path if os.path.exists(data_path) else None)
+    predicted = predict_walltime(os.path.join(params.destination, 'grid_calibration.json'), plan)
+    n_galaxies = plan['n_galaxies'] or 0
+
+    return {'galaxies': n_galaxies,
+            'models_per_redshift': plan['models_per_redshift'],
+            'n_redshifts': plan['n_redshifts'],
+            'models_total': plan['models_total'],
+            'evaluations': n_galaxies * plan['models_per_redshift'],
+            'predicted_hours': None if predicted is None else predicted / 3600}
+
+
+##############
+# Thresholds #
+##############
+
+def check_thresholds(report, params):
+    #reasons to refuse the launch (empty list --> go)
+    problems = []
+
+    inputs = report.get('inputs')
+    if inputs and params.preflight_max_bad_frac is not None:
+        n_rows = max(1, inputs['counts'].get('rows_read', inputs['counts']['rows']))
+        for name in failure_classes:
+            frac = inputs['counts'][name] / n_rows
+            if frac > params.preflight_max_bad_frac:
+                problems.append(f'{name}: {frac:.2%} of the galaxies (preflight_max_bad_frac '
+                                f'{params.preflight_max_bad_frac:.2%})')
+
+    cost = report.get('cost')
+    if cost and params.preflight_max_evals is not None and cost['evaluations'] > params.preflight_max_evals:
+        problems.append(f'{cost["evaluations"]:.3g} galaxy x model evaluations (preflight_max_evals '
+                        f'{params.preflight_max_evals:.3g})')
+    if cost and params.preflight_max_hours is not None and cost['predicted_hours'] is not None \
+       and cost['predicted_hours'] > params.preflight_max_hours:
+        problems.append(f'predicted wall time {cost["predicted_hours"]:.2f} h (preflight_max_hours '
+                        f'{params.preflight_max_hours:.2f} h)')
+
+    return problems
+
+
+##########
+# Report #
+##########
+
+def print_preflight(report):
+    print('\n##################### Pre-flight #####################')
+
+    inputs = report.get('inputs')
+    if inputs is None:
+        print('no preflight.json input scan (data file not written by write_inputs); input checks skipped')
+    else:
+        counts = inputs['counts']
+        print(f'{"rows read":<25} {counts.get("rows_read", counts["rows"]):>12,d}')
+        print(f'{"rows scanned":<25} {counts["rows"]:>12,d}')
+        print(f'{"north galaxies":<25} {counts["north"]:>12,d}')
+        print(f'{"south galaxies":<25} {counts["south"]:>12,d}')
+        for name in failure_classes:
+            examples = inputs['examples'].get(name)
+            print(f'{name:<25} {counts[name]:>12,d}' + (f'   e.g. {", ".join(examples)}' if examples else ''))
+        print('band coverage (galaxies with a finite flux):')
+        for label, n in inputs['coverage'].items():
+            print(f'    {label:<21} {n:>12,d}   {n / max(1, inputs["written"]):>7.1%}')
+
+    cost = report.get('cost')
+    if cost is not None:
+        print(f'{"models per redshift":<25} {cost["models_per_redshift"]:>12,d}')
+        print(f'{"distinct redshifts":<25} {cost["n_redshifts"]:>12,d}')
+        print(f'{"models in total":<25} {cost["models_total"]:>12,d}')
+        print(f'{"galaxies x models":<25} {cost["evaluations"]:>12.3g}')
+        if cost['predicted_hours'] is not None:
+            print(f'{"predicted wall time":<25} {cost["predicted_hours"]:>10.2f} h')
+
+    print('######################################################\n')
+
+
+def run_preflight(params):
+    '''
+    input scan (from write_inputs) + cost --> printed report and {destination}/preflight.json.
+    exits when a params.txt threshold is exceeded, before CIGALE is launched.
+    '''
+    report = read_preflight(params.destination) or {}
+    report['cost'] = estimate_cost(params)
+    report['refused'] = check_thresholds(report, params)
+    write_preflight(params.destination, report)
+
+    print_preflight(report)
+
+    if report['refused']:
+        for problem in report['refused']:
+            print(f'Pre-flight threshold exceeded -- {problem}')
+        print('Refusing to launch CIGALE (see preflight.json; raise or remove the preflight_* thresholds in '
+              'params.txt to run anyway). exiting.')
+        sys.exit()
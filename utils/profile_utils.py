@@ -0,0 +1,270 @@
+'''
+Where the time and memory go. Every pipeline stage (and a few steps inside write_inputs) is measured for
+    wall time, CPU time (this process and its finished child processes, e.g. pcigale),
+    peak RSS (this process during the step, and the largest child so far),
+    bytes read/written (this process, /proc/self/io; children, from their block I/O counts),
+and the galaxies the step handled. run_pipeline() writes the measurements to {destination}/run_report.json,
+and, with profile_stages = 1, a cProfile dump per stage to {destination}/profiles/{stage}.prof.
+
+Linux-only counters (/proc) are simply left out elsewhere.
+'''
+
+import os
+import sys
+import json
+import time
+import resource
+import cProfile
+import platform
+from datetime import datetime
+from contextlib import contextmanager
+
+#ru_maxrss is in kB on Linux, bytes on macOS
+rss_unit = 1 if sys.platform == 'darwin' else 1024
+
+#steps measured inside the running stage (see substage)
+_active_steps = None
+
+#Measurements currently open, innermost last (substages nest inside their stage)
+_open_measurements = []
+
+
+####################
+# Process counters #
+####################
+
+def read_proc_io():
+    #{'rchar': ..., 'wchar': ..., 'read_bytes': ..., 'write_bytes': ...} of this process, or {} without /proc
+    try:
+        with open('/proc/self/io') as file:
+            return {key: int(value) for key, value in (line.split(':') for line in file)}
+    except (OSError, ValueError):
+        return {}
+
+
+def reset_peak_rss():
+    #Linux >= 4.0: reset VmHWM, so the next peak_rss() is the peak of this step alone. False if unsupported.
+    try:
+        with open('/proc/self/clear_refs', 'w') as file:
+            file.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss():
+    #VmHWM (peak since the last reset_peak_rss) if available, else the lifetime peak from getrusage
+    try:
+        with open('/proc/self/status') as file:
+            for line in file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * rss_unit
+
+
+def snapshot():
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    io = read_proc_io()
+    return {'wall': time.perf_counter(),
+            'cpu': time.process_time(),
+            'cpu_children': children.ru_utime + children.ru_stime,
+            'read': io.get('rchar'),
+            'write': io.get('wchar'),
+            'children_read': children.ru_inblock * 512,
+            'children_write': children.ru_oublock * 512}
+
+
+def difference(start, stop):
+    #counters that are missing (None) on this platform stay None
+    return {key: (None if start[key] is None or stop[key] is None else stop[key] - start[key]) for key in start}
+
+
+##################
+# Measure a step #
+##################
+
+class Measurement():
+    '''
+    context manager measuring one step. the result is a dictionary in .record.
+    
+    every step resets VmHWM, so its peak is its own. a step opened inside another first hands the peak so far to
+    the enclosing one, and its own peak on exit, so the enclosing peak still covers the whole of it.
+    '''
+
+    def __init__(self, name):
+        self.name = name
+        self.record = {'name': name}
+        self.peak_seen = 0
+
+    def __enter__(self):
+        if _open_measurements:
+            _open_measurements[-1].peak_seen = max(_open_measurements[-1].peak_seen, peak_rss())
+        _open_measurements.append(self)
+        self.peak_reset = reset_peak_rss()
+        self.start = snapshot()
+        return self
+
+    def __exit__(self, *exc):
+        _open_measurements.remove(self)
+        self.peak_seen = max(self.peak_seen, peak_rss())
+        if _open_measurements:
+            _open_measurements[-1].peak_seen = max(_open_measurements[-1].peak_seen, self.peak_seen)
+        
+        delta = difference(self.start, snapshot())
+        self.record.update({'wall_s': round(delta['wall'], 4),
+                            'cpu_s': round(delta['cpu'], 4),
+                            'cpu_children_s': round(delta['cpu_children'], 4),
+                            'peak_rss_bytes': self.peak_seen,
+                            'peak_rss_is_per_step': self.peak_reset,
+                            'peak_rss_children_bytes': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * rss_unit,
+                            'read_bytes': delta['read'],
+                            'write_bytes': delta['write'],
+                            'children_read_bytes': delta['children_read'],
+                            'children_write_bytes': delta['children_write']})
+        return False
+
+
+@contextmanager
+def substage(name, galaxies=None):
+    '''
+    measure a step inside the running stage (e.g., table loading, fauxtab construction, file writing).
+    a step entered again (e.g., once per chunk) adds to its first record. does nothing beyond running the
+    block when no stage is being profiled.
+    '''
+    if _active_steps is None:
+        yield
+        return
+    with Measurement(name) as measurement:
+        yield
+    record = measurement.record
+    if galaxies is not None:
+        record['galaxies'] = galaxies
+
+    previous = next((step for step in _active_steps if step['name'] == name), None)
+    if previous is None:
+        record['calls'] = 1
+        _active_steps.append(record)
+        return
+    previous['calls'] += 1
+    for key, value in record.items():
+        if key in ('name', 'peak_rss_is_per_step') or value is None or previous.get(key) is None:
+            previous.setdefault(key, value)
+        elif key.startswith('peak_rss'):
+            previous[key] = max(previous[key], value)
+        else:
+            previous[key] = round(previous[key] + value, 4)
+
+
+def profile_stage(name, stage, params, profile_dir=None):
+    '''
+    run stage(params) under a Measurement (and cProfile, if profile_dir is given).
+    returns the stage record, with the records of its substages under 'steps'.
+    '''
+    global _active_steps
+    _active_steps = []
+
+    profiler = cProfile.Profile() if profile_dir else None
+    try:
+        with Measurement(name) as measurement:
+            if profiler:
+                profiler.enable()
+            try:
+                stage(params)
+            finally:
+                if profiler:
+                    profiler.disable()
+    finally:
+        measurement.record['steps'] = _active_steps
+        _active_steps = None
+
+    if profiler:
+        os.makedirs(profile_dir, exist_ok=True)
+        profiler.dump_stats(os.path.join(profile_dir, f'{name}.prof'))
+
+    return measurement.record
+
+
+##########################
+# Galaxy counts + report #
+##########################
+
+def count_data_rows(path):
+    #rows of a CIGALE input file, without holding it in memory
+    if not os.path.exists(path):
+        return None
+    if path.endswith('.fits'):
+        return count_fits_rows(path)
+    if path.endswith('.xml'):
+        from astropy.table import Table
+        return len(Table.read(path, format='votable'))
+    with open(path, 'rb') as file:
+        return sum(1 for line in file if line.strip() and not line.startswith(b'#'))
+
+
+def count_fits_rows(path):
+    #NAXIS2 of the first table extension (header only)
+    if not os.path.exists(path):
+        return None
+    from astropy.io import fits
+    return fits.getheader(path, 1).get('NAXIS2')
+
+
+#which galaxies each stage handled: the input catalog, or the fit results
+def stage_galaxies(name, params):
+    if name in ('write_inputs', 'preflight'):
+        return count_data_rows(os.path.join(params.destination, params.data_file))
+    if name in ('run', 'export_results', 'sed_plots', 'pdfs'):
+        return count_fits_rows(os.path.join(params.destination, params.output_dir_name, 'results.fits'))
+    return None
+
+
+def write_run_report(destination, records):
+    '''
+    write (or update) {destination}/run_report.json. stages recorded by an earlier invocation (e.g.,
+    write_input_files.py before run_cigale_cli.py) are kept unless this run repeated them.
+    '''
+    path = os.path.join(destination, 'run_report.json')
+    stages = {}
+    if os.path.exists(path):
+        try:
+            with open(path) as file:
+                stages = {record['name']: record for record in json.load(file).get('stages', [])}
+        except (ValueError, KeyError):
+            stages = {}
+    stages.update({record['name']: record for record in records})
+
+    report = {'created': datetime.now().isoformat(timespec='seconds'),
+              'host': platform.node(),
+              'python': platform.python_version(),
+              'cpu_count': os.cpu_count(),
+              'total_wall_s': round(sum(record['wall_s'] for record in stages.values()), 4),
+              'stages': list(stages.values())}
+    with open(path, 'w') as file:
+        json.dump(report, file, indent=1)
+    return path
+
+
+def format_bytes_short(n_bytes):
+    if n_bytes is None:
+        return '-'
+    for unit in ['B', 'kB', 'MB', 'GB']:
+        if abs(n_bytes) < 1024:
+            return f'{n_bytes:.0f} {unit}'
+        n_bytes /= 1024
+    return f'{n_bytes:.1f} TB'
+
+
+def print_run_report(records):
+    print('\n'
+          '################################### Stage profile ###################################')
+    print(f'{"stage":<24} {"wall s":>9} {"cpu s":>9} {"child cpu":>9} {"peak RSS":>9} {"read":>9} {"written":>9} {"galaxies":>9}')
+    for record in records:
+        rows = [(record['name'], record)] + [(f'  {step["name"]}', step) for step in record.get('steps', [])]
+        for label, row in rows:
+            galaxies = row.get('galaxies')
+            print(f'{label:<24} {row["wall_s"]:>9.2f} {row["cpu_s"]:>9.2f} {row["cpu_children_s"]:>9.2f} '
+                  f'{format_bytes_short(row["peak_rss_bytes"]):>9} {format_bytes_short(row["read_bytes"]):>9} '
+                  f'{format_bytes_short(row["write_bytes"]):>9} {"-" if galaxies is None else galaxies:>9}')
+    print(f'{"total":<24} {sum(record["wall_s"] for record in records):>9.2f}\n')
@@ -0,0 +1,87 @@
+'''
+Redshift binning of the CIGALE input. CIGALE builds one model grid per distinct redshift in the data file,
+so a catalog written at full redshift precision can cost (nearly) one grid per galaxy. With
+redshift_tolerance > 0 in params.txt, every redshift is snapped to the nearest multiple of the tolerance
+before the data file is written, and the quantization error of each galaxy is recorded in
+{destination}/redshift_bins.txt:
+
+    # id redshift redshift_binned redshift_error
+
+Galaxies closer to z = 0 than half the tolerance go to the first bin, z = tolerance (a binned z = 0 cannot be
+fit), so their error can reach one full tolerance. Redshifts <= 0 are left as they are.
+
+The data file holds redshifts rounded to 4 decimals, so the binned redshifts (and their errors) are taken
+after that rounding -- exactly what CIGALE reads. Tolerances below 1e-4 would merge bins and are refused.
+
+Combined with nshards > 1 and shard_by redshift, the bins are spread over separate CIGALE jobs, each job
+holding whole bins (see shard_groups in shard_utils.py), so no redshift grid is built twice.
+'''
+
+import os
+import numpy as np
+
+bins_file_name = 'redshift_bins.txt'
+
+#decimals of the redshift column of galaxy_data.txt/.fits/.xml (see format_region_lines in init_utils.py)
+written_decimals = 4
+min_tolerance = 10.**-written_decimals
+
+
+def quantize_redshifts(redshifts, tolerance):
+    #nearest multiple of tolerance (rounded again, so that e.g. 3 * 0.001 is written as 0.003), never below the first
+    redshifts = np.asarray(redshifts, dtype=float)
+    decimals = max(0, int(np.ceil(-np.log10(tolerance)))) + 6
+    binned = np.round(np.maximum(np.round(redshifts / tolerance), 1.) * tolerance, decimals)
+    with np.errstate(invalid='ignore'):
+        return np.where(redshifts > 0., binned, redshifts)
+
+
+class RedshiftBinner():
+    '''
+    quantizes the redshift column of every faux table on its way to the data file, keeping the original
+    and binned redshift of each galaxy for redshift_bins.txt.
+    '''
+
+    def __init__(self, tolerance):
+        self.tolerance = tolerance
+        self._ids, self._redshifts, self._binned = [], [], []
+
+    def bin(self, faux_table):
+        redshifts = np.array(faux_table['redshift'], dtype=float)
+        binned = np.round(quantize_redshifts(redshifts, self.tolerance), written_decimals)
+        faux_table['redshift'] = binned
+
+        IDs = np.asarray(faux_table['OBJID'])
+        if IDs.dtype.kind == 'S':
+            IDs = np.char.decode(IDs, 'utf-8')
+        self._ids.append(IDs.astype(str))
+        self._redshifts.append(redshifts)
+        self._binned.append(binned)
+
+    def watch(self, fauxtabs):
+        #pass the faux tables through, with their redshifts binned
+        for faux_table in fauxtabs:
+            self.bin(faux_table)
+            yield faux_table
+
+    def write(self, dir_path):
+        '''
+        writes {dir_path}/redshift_bins.txt and prints a summary. returns the path.
+        '''
+        IDs = np.concatenate(self._ids) if self._ids else np.array([], dtype=str)
+        redshifts = np.concatenate(self._redshifts) if self._redshifts else np.array([])
+        binned = np.concatenate(self._binned) if self._binned else np.array([])
+        errors = binned - redshifts
+
+        path = os.path.join(dir_path, bins_file_name)
+        with open(path, 'w') as file:
+            file.write('# id redshift redshift_binned redshift_error\n')
+            file.writelines([f'{galaxy_id} {z:.6f} {zb:.6f} {dz:.6f}\n' for galaxy_id, z, zb, dz
+                             in zip(IDs.tolist(), redshifts.tolist(), binned.tolist(), errors.tolist())])
+
+        with np.errstate(invalid='ignore'):
+            finite = np.isfinite(errors)
+            print(f'Redshifts binned to {self.tolerance}: {len(np.unique(redshifts[finite]))} distinct redshifts '
+                  f'--> {len(np.unique(binned[finite]))} bins (largest |error| '
+                  f'{np.abs(errors[finite]).max() if finite.any() else 0.:.2g}). Written to {path}')
+        return path
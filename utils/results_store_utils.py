@@ -0,0 +1,154 @@
+'''
+Columnar copy of out/results.fits. CIGALE's results table is very wide (every bayes/best parameter, every band,
+every error) while most uses only need a handful of columns, so each column is exported once to its own
+memory-mappable .npy file:
+
+    out/results_store/
+        columns.fits       -- one row per column: name, kind (id/bayes/best/other), param, is_err, is_band,
+                              unit, file
+        columns/{name}.npy -- the column itself
+
+ResultsStore then reads only the requested columns (and rows), looks galaxies up by ID and filters on
+value ranges without ever loading the full table.
+'''
+
+import os
+import shutil
+import numpy as np
+from astropy.table import Table
+from astropy.io import fits
+
+from init_utils import cigale_band_names
+from compare_utils import IDIndex
+
+
+##########
+# Export #
+##########
+
+def describe_column(name):
+    #(kind, param, is_err, is_band) of a results.fits column, e.g. 'bayes.sfh.sfr_err' --> ('bayes', 'sfh.sfr', True, False)
+    kind, _, param = name.partition('.')
+    if kind not in ('bayes', 'best') or not param:
+        kind, param = ('id' if name == 'id' else 'other'), name
+    is_err = param.endswith('_err')
+    is_band = param[:-len('_err')] in cigale_band_names if is_err else param in cigale_band_names
+    return kind, param, is_err, is_band
+
+
+def export_results(out_dir, store_name='results_store'):
+    '''
+    write every column of out_dir/results.fits to out_dir/store_name (replacing an older store).
+    returns the path to the store.
+    '''
+    store_dir = os.path.join(out_dir, store_name)
+
+    #build next door and swap in, so readers never see a half-written store
+    tmp_dir = store_dir + '_tmp'
+    if os.path.isdir(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.makedirs(os.path.join(tmp_dir, 'columns'))
+
+    rows = []
+    with fits.open(os.path.join(out_dir, 'results.fits'), memmap=True) as hdul:
+        data = hdul[1].data
+        for column in hdul[1].columns:
+            values = np.asarray(data[column.name])
+            if values.dtype.kind == 'S':
+                values = np.char.strip(np.char.decode(values, 'utf-8'))
+            #native byte order, so the .npy files memory-map without conversion
+            values = values.astype(values.dtype.newbyteorder('='))
+            np.save(os.path.join(tmp_dir, 'columns', f'{column.name}.npy'), values)
+
+            kind, param, is_err, is_band = describe_column(column.name)
+            rows.append((column.name, kind, param, is_err, is_band, column.unit or '', f'{column.name}.npy'))
+
+    Table(rows=rows, names=['name', 'kind', 'param', 'is_err', 'is_band', 'unit', 'file']).write(
+        os.path.join(tmp_dir, 'columns.fits'))
+
+    if os.path.isdir(store_dir):
+        shutil.rmtree(store_dir)
+    os.rename(tmp_dir, store_dir)
+
+    print(f'Exported {len(rows)} results.fits columns to {store_dir}')
+    return store_dir
+
+
+#########
+# Query #
+#########
+
+class ResultsStore():
+    '''
+    read-only, column-at-a-time access to an exported results store. columns are memory-mapped on first use.
+    '''
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        self.meta = Table.read(os.path.join(store_dir, 'columns.fits'))
+        self._meta_rows = {str(name): n for n, name in enumerate(self.meta['name'])}
+        self._columns = {}
+        self._index = None
+
+    def __len__(self):
+        return len(self.column('id'))
+
+    @property
+    def colnames(self):
+        return [str(name) for name in self.meta['name']]
+
+    def column(self, name):
+        if name not in self._columns:
+            if name not in self._meta_rows:
+                raise KeyError(f'{name} not found in {self.store_dir}')
+            file = str(self.meta['file'][self._meta_rows[name]])
+            self._columns[name] = np.load(os.path.join(self.store_dir, 'columns', file), mmap_mode='r')
+        return self._columns[name]
+
+    def columns(self, kind=None, errors=None, bands=None):
+        #names of the columns with the given kind ('bayes', 'best', ...); errors/bands = True/False/None (either)
+        keep = np.ones(len(self.meta), dtype=bool)
+        if kind is not None:
+            keep &= self.meta['kind'] == kind
+        if errors is not None:
+            keep &= self.meta['is_err'] == errors
+        if bands is not None:
+            keep &= self.meta['is_band'] == bands
+        return [str(name) for name in self.meta['name'][keep]]
+
+    def bayes_list(self):
+        #same as init_utils.get_bayes_list(), from the metadata
+        return self.columns(kind='bayes', errors=False, bands=False)
+
+    def rows_for_ids(self, ids):
+        #row of every ID (-1 if absent)
+        if self._index is None:
+            self._index = IDIndex(self.column('id'))
+        return self._index.lookup(np.atleast_1d(ids))
+
+    def mask(self, ranges):
+        #{column: (low, high)} --> rows with low <= value <= high for every column. None = unbounded
+        keep = np.ones(len(self), dtype=bool)
+        for name, (low, high) in ranges.items():
+            values = self.column(name)
+            if low is not None:
+                keep &= values >= low
+            if high is not None:
+                keep &= values <= high
+        return keep
+
+    def get(self, columns=None, ids=None, ranges=None):
+        '''
+        Table of the requested columns (default: all), for the given galaxy IDs (in that order; unknown IDs are
+        dropped) and/or the rows inside every {column: (low, high)} range
+        '''
+        columns = self.colnames if columns is None else list(columns)
+
+        rows = np.arange(len(self))
+        if ids is not None:
+            rows = self.rows_for_ids(ids)
+            rows = rows[rows >= 0]
+        if ranges:
+            rows = rows[self.mask(ranges)[rows]]
+
+        return Table([np.asarray(self.column(name)[rows]) for name in columns], names=columns)
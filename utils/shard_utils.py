@@ -0,0 +1,274 @@
+'''
+Run CIGALE on several pieces (shards) of galaxy_data.txt side by side, then merge the output back
+under one out/ directory as though it came from a single run.
+
+Each shard lives in {destination}/shards/shard_NNN/ with its own galaxy_data.txt, a copy of
+pcigale.ini + pcigale.ini.spec, and its own out/ directory. Since everything goes through the
+filesystem, shards can also be prepared once and run on several nodes (see CLI_scripts/run_shards.py).
+'''
+
+import os
+import sys
+import re
+import shutil
+import subprocess
+import time
+from datetime import datetime
+import numpy as np
+from astropy.table import Table, vstack
+
+
+#CIGALE output files holding one row per galaxy. these are stacked; everything else is moved.
+stacked_outputs = ['results.fits', 'observations.fits']
+
+
+###########################
+# Split the input catalog #
+###########################
+
+def read_galaxy_data(data_path):
+    #returns (header lines, data lines) of a CIGALE ASCII input file
+    with open(data_path) as file:
+        lines = file.readlines()
+    header = [line for line in lines if line.startswith('#')]
+    rows = [line for line in lines if not line.startswith('#') and line.strip()]
+    return header, rows
+
+
+#galaxy_data.fits / galaxy_data.xml (data_format fits or votable) are read as tables
+def read_data_table(data_path):
+    return Table.read(data_path, format='votable' if data_path.endswith('.xml') else 'fits')
+
+
+def data_columns(data_path):
+    #column names of a CIGALE input file (id, redshift, bands + errors), in any data_format
+    if data_path.endswith('.txt'):
+        header, _ = read_galaxy_data(data_path)
+        return header[-1].split()[1:]   #drop the '#'
+    return read_data_table(data_path).colnames
+
+
+def data_redshifts(data_path):
+    #redshift of every row of a CIGALE input file, in any data_format
+    if data_path.endswith('.txt'):
+        _, rows = read_galaxy_data(data_path)
+        return np.array([float(row.split()[1]) for row in rows])
+    return np.asarray(read_data_table(data_path)['redshift'], dtype=float)
+
+
+#hemisphere of each row: north rows only ever carry BASS-g/r, south rows only decamDR1-g/r/z
+#(rows with no optical photometry at all are put with the north; shards are only a scheduling unit)
+def row_regions(header, rows):
+    columns = header[-1].split()[1:]   #drop the '#'
+    south_cols = [n for n, name in enumerate(columns) if name.startswith('decamDR1-') and not name.endswith('_err')]
+    regions = []
+    for row in rows:
+        values = row.split()
+        regions.append('south' if any(values[n] != 'nan' for n in south_cols) else 'north')
+    return np.array(regions)
+
+
+def shard_groups(header, rows, nshards, by='rows'):
+    '''
+    assign every row of galaxy_data.txt to one of (about) nshards shards. returns a list of row-index arrays.
+        by = 'rows'     --> contiguous blocks of rows
+        by = 'redshift' --> rows sorted by redshift, then split into about equal blocks at redshift boundaries
+                            (a redshift, and so its model grid, is never shared by two shards)
+        by = 'region'   --> north and south rows never share a shard; shards split between them by size
+    '''
+    nrows = len(rows)
+    
+    #no more shards than galaxies
+    nshards = max(1, min(nshards, nrows))
+    
+    if by == 'rows':
+        return np.array_split(np.arange(nrows), nshards)
+    
+    if by == 'redshift':
+        redshifts = np.array([float(row.split()[1]) for row in rows])
+        order = np.argsort(redshifts, kind='stable')
+        
+        #move every equal-size cut to the nearest change of redshift (fewer shards if there are few redshifts)
+        boundaries = np.flatnonzero(np.diff(redshifts[order]) != 0) + 1
+        if not len(boundaries):
+            return [order]
+        cuts = [boundaries[np.argmin(np.abs(boundaries - nrows * k / nshards))] for k in range(1, nshards)]
+        return np.split(order, np.unique(cuts))
+    
+    if by == 'region':
+        regions = row_regions(header, rows)
+        groups = []
+        for region in ['north', 'south']:
+            indices = np.flatnonzero(regions == region)
+            if len(indices):
+                groups += np.array_split(indices, max(1, round(nshards * len(indices) / nrows)))
+        return groups
+    
+    print(f'Unknown shard_by = {by}. Please use rows, redshift, or region.')
+    sys.exit()
+
+
+def split_galaxy_data(dir_path, nshards, data_file='galaxy_data.txt', by='rows', cores_per_shard=1):
+    '''
+    split {dir_path}/{data_file} into (about) nshards pieces (see shard_groups) and set up one shard
+    directory for each, with pcigale.ini set to cores = cores_per_shard. returns the list of shard directories.
+    '''
+    header, rows = read_galaxy_data(os.path.join(dir_path, data_file))
+    
+    shards_root = os.path.join(dir_path, 'shards')
+    if os.path.isdir(shards_root):
+        shutil.rmtree(shards_root)   #leftovers from a previous sharded run
+    
+    shard_dirs = []
+    for n, indices in enumerate(shard_groups(header, rows, nshards, by)):
+        shard_dir = os.path.join(shards_root, f'shard_{n:03d}')
+        os.makedirs(shard_dir)
+        
+        #keep input order within each shard
+        with open(os.path.join(shard_dir, data_file), 'w') as file:
+            file.writelines(header + [rows[i] for i in np.sort(indices)])
+        
+        shutil.copy(os.path.join(dir_path, 'pcigale.ini.spec'), shard_dir)
+        with open(os.path.join(dir_path, 'pcigale.ini')) as file:
+            ini_lines = file.readlines()
+        with open(os.path.join(shard_dir, 'pcigale.ini'), 'w') as file:
+            file.writelines([f'cores = {cores_per_shard}\n' if re.match(r'^\s*cores\s*=', line) else line 
+                             for line in ini_lines])
+        
+        shard_dirs.append(shard_dir)
+    
+    return shard_dirs
+
+
+def list_shards(dir_path):
+    #shard directories already set up by split_galaxy_data (e.g., on another node)
+    shards_root = os.path.join(dir_path, 'shards')
+    return sorted(os.path.join(shards_root, name) for name in os.listdir(shards_root) if name.startswith('shard_'))
+
+
+##################
+# Run the shards #
+##################
+
+def run_shards(shard_dirs, cpu_budget, cores_per_shard=1, timings=None):
+    '''
+    run 'pcigale run' in every shard directory, never using more than cpu_budget cores at once
+    (i.e., at most cpu_budget // cores_per_shard shards run concurrently).
+    output of each run goes to {shard_dir}/cigale.log. returns {shard_dir: return code}.
+    if a timings dictionary is given, it is filled with {shard_dir: wall time in seconds}.
+    '''
+    max_parallel = max(1, cpu_budget // cores_per_shard)
+    started = {}
+    
+    pending = list(shard_dirs)
+    running = {}
+    return_codes = {}
+
+    while pending or running:
+
+        #launch as many shards as the budget allows
+        while pending and (len(running) < max_parallel):
+            shard_dir = pending.pop(0)
+            log = open(os.path.join(shard_dir, 'cigale.log'), 'w')
+            running[shard_dir] = (subprocess.Popen(['pcigale', 'run'], cwd=shard_dir, stdout=log,
+                                                   stderr=subprocess.STDOUT), log)
+            started[shard_dir] = time.perf_counter()
+            print(f'Started CIGALE in {shard_dir}')
+
+        #collect finished shards
+        for shard_dir, (process, log) in list(running.items()):
+            if process.poll() is not None:
+                log.close()
+                return_codes[shard_dir] = process.returncode
+                if timings is not None:
+                    timings[shard_dir] = time.perf_counter() - started[shard_dir]
+                del running[shard_dir]
+                print(f'Finished CIGALE in {shard_dir} (return code {process.returncode})')
+
+        time.sleep(1)
+
+    return return_codes
+
+
+####################
+# Merge the output #
+####################
+
+def rotate_out_dir(destination, out_dir_name='out'):
+    '''
+    same convention as CIGALE: an existing out/ is renamed to {timestamp}_out/ rather than overwritten.
+    returns (new, empty out/ directory, where the previous one went -- or None)
+    '''
+    out_dir = os.path.join(destination, out_dir_name)
+    previous_dir = None
+    if os.path.isdir(out_dir):
+        previous_dir = os.path.join(destination, datetime.now().strftime('%Y%m%d%H%M%S') + '_' + out_dir_name)
+        os.rename(out_dir, previous_dir)
+        print(f'Previous {out_dir} moved to {previous_dir}')
+    os.makedirs(out_dir)
+    return out_dir, previous_dir
+
+
+def merge_shard_output(shard_dirs, destination, out_dir_name='out', data_file='galaxy_data.txt'):
+    '''
+    stack the per-galaxy tables (results.fits, observations.fits) of every shard, sorted back into the row
+    order of {destination}/{data_file}, and move all other shard output (PDF .fits files, best models, ...)
+    into {destination}/{out_dir_name}/. files with the same name in several shards (e.g., the copied 
+    pcigale.ini) are kept from the first shard.
+    '''
+    out_dir, _ = rotate_out_dir(destination, out_dir_name)
+    
+    #input position of every galaxy ID
+    _, rows = read_galaxy_data(os.path.join(destination, data_file))
+    input_order = {row.split(maxsplit=1)[0]: n for n, row in enumerate(rows)}
+
+    for table_name in stacked_outputs:
+        paths = [os.path.join(shard_dir, 'out', table_name) for shard_dir in shard_dirs]
+        paths = [path for path in paths if os.path.exists(path)]
+        if not paths:
+            continue
+        merged = vstack([Table.read(path) for path in paths])
+        order = np.argsort([input_order.get(str(galaxy_id), len(rows)) for galaxy_id in merged['id']], kind='stable')
+        merged[order].write(os.path.join(out_dir, table_name))
+
+    for shard_dir in shard_dirs:
+        shard_out = os.path.join(shard_dir, 'out')
+        if not os.path.isdir(shard_out):
+            continue
+        with os.scandir(shard_out) as entries:
+            for entry in entries:
+                target = os.path.join(out_dir, entry.name)
+                if (entry.name in stacked_outputs) or os.path.exists(target):
+                    continue
+                os.rename(entry.path, target)
+
+    return out_dir
+
+
+####################
+# All of the above #
+####################
+
+def run_cigale_sharded(dir_path, nshards, by='rows', cores_per_shard=1, cpu_budget=None, 
+                       out_dir_name='out', keep_shards=False):
+    '''
+    split galaxy_data.txt into nshards (by rows, redshift or region), run CIGALE on them under a budget of
+    cpu_budget cores (default: all of this machine's), and merge everything into {dir_path}/{out_dir_name}/.
+    the shard directories are removed afterwards unless keep_shards=True or a shard failed.
+    '''
+    shard_dirs = split_galaxy_data(dir_path, nshards, by=by, cores_per_shard=cores_per_shard)
+
+    print(f'Running CIGALE on {len(shard_dirs)} shards...')
+    return_codes = run_shards(shard_dirs, cpu_budget or os.cpu_count(), cores_per_shard)
+
+    failed = [shard_dir for shard_dir in shard_dirs if return_codes[shard_dir] != 0]
+    if failed:
+        print('CIGALE failed in:', *failed, sep='\n    ')
+        print('See cigale.log in each directory. Output of the successful shards is merged anyway.')
+
+    out_dir = merge_shard_output(shard_dirs, dir_path, out_dir_name)
+
+    if not (keep_shards or failed):
+        shutil.rmtree(os.path.join(dir_path, 'shards'))
+
+    return out_dir
@@ -0,0 +1,214 @@
+'''
+Parameter sweeps: run several variants of the SED model grid on the same photometry, side by side under
+one core budget, and compare them.
+
+A sweep file (JSON; see sweep_example.json) lists the variants. Each variant may set
+    name               -- required; the variant runs in {sweep destination}/{name}/
+    sfh_module, dust_module, lim_flag
+    module_params      -- {module: {parameter: 'comma-separated values'}}, on top of ini_utils.module_param_values
+    analysis_params    -- {parameter: value} for the [analysis_params] section
+    drop_bands         -- CIGALE band names (e.g., BASS-g) left out of the fit
+Anything not set is taken from params.txt. galaxy_data.txt is written once and shared by every variant.
+'''
+
+import os
+import sys
+import copy
+import json
+import shutil
+import numpy as np
+from astropy.table import Table
+
+from init_utils import create_flux_table, create_ini_files
+from ini_utils import generate_pcigale_ini, apply_param_values, drop_bands
+from shard_utils import run_shards
+from tuning_utils import apply_auto_tuning
+from grid_utils import plan_grid
+from compare_utils import match_ids
+
+variant_keys = ['name', 'sfh_module', 'dust_module', 'lim_flag', 'module_params', 'analysis_params', 'drop_bands']
+
+#results.fits columns compared between variants
+chi2_column = 'best.reduced_chi_square'
+offset_columns = {'logM': 'bayes.stellar.m_star', 'logSFR': 'bayes.sfh.sfr'}
+
+
+##################
+# The sweep file #
+##################
+
+def read_sweep(sweep_path, params):
+    '''
+    returns the sweep dictionary with 'destination', 'cpu_budget', 'reference' and 'variants' filled in
+    '''
+    with open(sweep_path) as file:
+        sweep = json.load(file)
+
+    variants = sweep.get('variants', [])
+    names = [variant.get('name') for variant in variants]
+    if not variants or None in names or len(set(names)) != len(names):
+        print(f'{sweep_path}: every variant needs a unique name. exiting.')
+        sys.exit()
+
+    for variant in variants:
+        unknown = set(variant) - set(variant_keys)
+        if unknown:
+            print(f'{sweep_path}: unknown setting(s) {sorted(unknown)} in variant {variant["name"]}. exiting.')
+            sys.exit()
+
+    sweep['destination'] = sweep.get('destination', os.path.join(params.destination, 'sweep'))
+    sweep['cpu_budget'] = int(sweep.get('cpu_budget', params.cpu_budget)) or os.cpu_count()
+    sweep['reference'] = sweep.get('reference', names[0])
+    if sweep['reference'] not in names:
+        print(f'{sweep_path}: reference variant {sweep["reference"]} is not in the sweep. exiting.')
+        sys.exit()
+
+    return sweep
+
+
+#####################
+# Prepare a variant #
+#####################
+
+def write_shared_photometry(params, sweep_dir):
+    #galaxy_data file for every variant. an existing one (from an earlier run of this sweep) is reused.
+    data_path = os.path.join(sweep_dir, params.data_file)
+    if os.path.exists(data_path):
+        print(f'Reusing {data_path}. Delete it to regenerate the photometry.')
+        return data_path
+
+    #written next door first, so that an interrupted write is never mistaken for finished photometry
+    params.load_columns()
+    shared = copy.copy(params)
+    shared.dir_path = shared.destination = os.path.join(sweep_dir, 'photometry_tmp')
+    create_flux_table(shared)
+    os.replace(os.path.join(shared.dir_path, params.data_file), data_path)
+    shutil.rmtree(shared.dir_path)
+    return data_path
+
+
+def variant_params(params, variant, variant_dir, cores):
+    #Params of one variant: its own destination and modules, everything else as in params.txt
+    vparams = copy.copy(params)
+    vparams.dir_path = vparams.destination = variant_dir
+    for key in ['sfh_module', 'dust_module', 'lim_flag']:
+        setattr(vparams, key, variant.get(key, getattr(params, key)))
+
+    #auto-tuned variants share the budget equally
+    vparams.cpu_budget = cores
+    if not vparams.auto_ncores:
+        vparams.ncores = int(params.ncores)
+    return vparams
+
+
+def link_or_copy(src, dest):
+    if os.path.exists(dest):
+        os.remove(dest)
+    try:
+        os.link(src, dest)
+    except OSError:
+        shutil.copy(src, dest)
+
+
+def prepare_variant(params, variant, sweep_dir, data_path, cores):
+    variant_dir = os.path.join(sweep_dir, variant['name'])
+    os.makedirs(variant_dir, exist_ok=True)
+    link_or_copy(data_path, os.path.join(variant_dir, params.data_file))
+
+    vparams = variant_params(params, variant, variant_dir, cores)
+    create_ini_files(vparams)
+    generate_pcigale_ini(variant_dir, params.genconf_cache)
+    apply_param_values(variant_dir, False, vparams.lim_flag, 1 if vparams.auto_nblocks else vparams.nblocks,
+                       params.create_pdfs, variant.get('module_params'), variant.get('analysis_params'))
+    if variant.get('drop_bands'):
+        drop_bands(os.path.join(variant_dir, 'pcigale.ini'), variant['drop_bands'])
+
+    if vparams.auto_ncores or vparams.auto_nblocks:
+        apply_auto_tuning(vparams)
+
+    return variant_dir
+
+
+###########
+# Compare #
+###########
+
+def matched_log_offsets(reference, results, column):
+    #log10(variant / reference) of one column, for the galaxies fit in both (and positive in both)
+    i_ref, i = match_ids(reference['id'], results['id'])
+
+    x_ref = np.asarray(reference[column], dtype=float)[i_ref]
+    x = np.asarray(results[column], dtype=float)[i]
+    good = (x_ref > 0) & (x > 0)
+    return np.log10(x[good] / x_ref[good])
+
+
+def summarize_sweep(sweep, timings, return_codes):
+    '''
+    one row per variant: return code, runtime, grid size, galaxies fit, mean reduced chi2, and the median and
+    scatter (dex) of the stellar mass and SFR offsets from the reference variant
+    '''
+    sweep_dir = sweep['destination']
+    results = {}
+    for variant in sweep['variants']:
+        path = os.path.join(sweep_dir, variant['name'], 'out', 'results.fits')
+        results[variant['name']] = Table.read(path) if os.path.exists(path) else None
+    reference = results[sweep['reference']]
+
+    rows = []
+    for variant in sweep['variants']:
+        name = variant['name']
+        variant_dir = os.path.join(sweep_dir, name)
+        plan = plan_grid(os.path.join(variant_dir, 'pcigale.ini'))
+        row = {'variant': name, 'return_code': return_codes.get(variant_dir, -1),
+               'runtime_s': round(timings.get(variant_dir, np.nan), 1), 'n_models': plan['models_total'],
+               'n_galaxies': 0, 'mean_chi2_red': np.nan}
+        for label in offset_columns:
+            row[f'd{label}_median'] = row[f'd{label}_std'] = np.nan
+
+        if results[name] is not None:
+            row['n_galaxies'] = len(results[name])
+            if chi2_column in results[name].colnames:
+                row['mean_chi2_red'] = np.nanmean(results[name][chi2_column])
+            for label, column in offset_columns.items():
+                if (reference is None) or (column not in results[name].colnames) or (column not in reference.colnames):
+                    continue
+                offsets = matched_log_offsets(reference, results[name], column)
+                if len(offsets):
+                    row[f'd{label}_median'] = np.median(offsets)
+                    row[f'd{label}_std'] = np.std(offsets)
+        rows.append(row)
+
+    summary = Table(rows=rows, names=list(rows[0]))
+    for column in summary.colnames[5:]:
+        summary[column].format = '.4f'
+    return summary
+
+
+#################
+# Run the sweep #
+#################
+
+def run_sweep(params, sweep):
+    '''
+    write the shared photometry, prepare every variant, run them all under the sweep's core budget, and write
+    {sweep destination}/sweep_summary.txt. returns the summary table.
+    '''
+    sweep_dir = sweep['destination']
+    os.makedirs(sweep_dir, exist_ok=True)
+    data_path = write_shared_photometry(params, sweep_dir)
+
+    #fixed ncores --> that many per variant; auto --> an equal share of the budget
+    nvariants = len(sweep['variants'])
+    cores = max(1, sweep['cpu_budget'] // nvariants) if params.auto_ncores else int(params.ncores)
+
+    print(f'Preparing {nvariants} variants in {sweep_dir}...')
+    variant_dirs = [prepare_variant(params, variant, sweep_dir, data_path, cores) for variant in sweep['variants']]
+
+    timings = {}
+    return_codes = run_shards(variant_dirs, sweep['cpu_budget'], cores, timings)
+
+    summary = summarize_sweep(sweep, timings, return_codes)
+    summary.write(os.path.join(sweep_dir, 'sweep_summary.txt'), format='ascii.fixed_width_two_line', overwrite=True)
+
+    return summary
@@ -0,0 +1,161 @@
+'''
+ncores = auto / nblocks = auto: pick CIGALE's core and block counts from the free RAM, the CPUs available
+to this process, and the size of the model grid in the rendered pcigale.ini (see grid_utils.py).
+The choice and the numbers behind it are recorded in {destination}/auto_tuning.json.
+'''
+
+import os
+import json
+import numpy as np
+
+from grid_utils import plan_grid, format_bytes
+from ini_utils import PcigaleIni
+
+#memory every CIGALE worker process needs regardless of the grid (interpreter, modules, filters)
+per_process_bytes = 250 * 1024**2
+
+#float64 arrays of one block's length that every worker holds during the analysis (chi2, weights, ...)
+per_process_arrays = 6
+
+#never plan for more than this fraction of the currently available memory
+memory_safety = 0.8
+
+
+#########################
+# What this machine has #
+#########################
+
+def available_memory():
+    #MemAvailable (Linux) counts reclaimable cache too; fall back on free pages elsewhere
+    try:
+        with open('/proc/meminfo') as file:
+            for line in file:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+
+
+def available_cores():
+    #respects taskset/cgroup CPU affinity where the platform supports it
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count()
+
+
+##################
+# Pick the knobs #
+##################
+
+def estimate_memory(models_total, bytes_per_model, nblocks, ncores):
+    #one shared copy of a block's models + per-worker arrays of the block's length + per-worker overhead
+    models_per_block = int(np.ceil(models_total / nblocks))
+    return models_per_block * (bytes_per_model + ncores * 8 * per_process_arrays) + ncores * per_process_bytes
+
+
+def tune_blocks_cores(models_total, bytes_per_model, memory_bytes, ncpu, ncores=None, nblocks=None):
+    '''
+    returns (ncores, nblocks, reasoning lines). pass ncores or nblocks to keep that one fixed.
+    more cores always help CIGALE as long as they fit in memory; blocks trade memory for some extra overhead,
+    so the fewest blocks that fit are chosen.
+    '''
+    budget = memory_safety * memory_bytes
+    reasoning = [f'{format_bytes(memory_bytes)} available; planning for {memory_safety:.0%} of it '
+                 f'({format_bytes(budget)}).',
+                 f'{ncpu} CPU cores available.',
+                 f'{models_total:,d} models of ~{bytes_per_model} bytes each.']
+
+    if ncores is None:
+        ncores = ncpu
+        #leave at least half of the budget for the models themselves
+        while (ncores > 1) and (ncores * per_process_bytes > budget / 2):
+            ncores -= 1
+        reasoning.append(f'ncores = {ncores}: all available cores whose per-process overhead '
+                         f'({format_bytes(per_process_bytes)} each) fits in half the budget.')
+    else:
+        reasoning.append(f'ncores = {ncores}: fixed in params.txt.')
+
+    if nblocks is None:
+        room = budget - ncores * per_process_bytes
+        nblocks = int(np.ceil(models_total * (bytes_per_model + ncores * 8 * per_process_arrays) / max(room, 1)))
+        nblocks = max(1, min(nblocks, max(models_total, 1)))
+        reasoning.append(f'nblocks = {nblocks}: fewest blocks keeping the estimated peak memory within the budget.')
+    else:
+        reasoning.append(f'nblocks = {nblocks}: fixed in params.txt.')
+
+    peak = estimate_memory(models_total, bytes_per_model, nblocks, ncores)
+    reasoning.append(f'Estimated peak memory: {format_bytes(peak)}.')
+    if peak > budget:
+        reasoning.append('WARNING: even this choice exceeds the memory budget. Consider a smaller grid.')
+
+    return ncores, nblocks, reasoning
+
+
+###################################
+# Apply to a rendered pcigale.ini #
+###################################
+
+def concurrent_shards(nshards, cpu_budget, ncores):
+    #shards run_shards keeps running side by side with ncores cores each
+    return max(1, min(nshards, cpu_budget // ncores))
+
+
+def apply_auto_tuning(params):
+    '''
+    resolve ncores = auto and/or nblocks = auto for the rendered {destination}/pcigale.ini: write the chosen
+    values into pcigale.ini and params, and record them (with the reasoning) in auto_tuning.json.
+    with nshards > 1, the memory and CPUs are shared between the shards that run at once.
+    '''
+    ini_path = os.path.join(params.destination, 'pcigale.ini')
+    data_path = os.path.join(params.destination, params.data_file)
+
+    plan = plan_grid(ini_path, data_path if os.path.exists(data_path) else None)
+    ncpu = min(available_cores(), params.cpu_budget)
+    memory_bytes = available_memory()
+
+    #ncores = auto --> spread the cores over as many shards as can run at once
+    nshards = max(1, params.nshards)
+    ncores = None if params.auto_ncores else int(params.ncores)
+    shard_cpu = max(1, ncpu // min(nshards, ncpu)) if ncores is None else ncpu
+    shards = concurrent_shards(nshards, params.cpu_budget, ncores or shard_cpu)
+
+    while True:
+        tuned_ncores, nblocks, reasoning = tune_blocks_cores(plan['models_total'], plan['bytes_per_model'],
+                                                             memory_bytes // shards, min(shard_cpu, ncpu), ncores=ncores,
+                                                             nblocks=None if params.auto_nblocks else int(params.nblocks))
+        #fewer cores per shard (to fit in memory) --> more shards at once, each with less memory: plan again
+        if concurrent_shards(nshards, params.cpu_budget, tuned_ncores) == shards:
+            break
+        shards = concurrent_shards(nshards, params.cpu_budget, tuned_ncores)
+        shard_cpu = tuned_ncores
+    ncores = tuned_ncores
+
+    if nshards > 1:
+        reasoning.insert(0, f'{nshards} shards, {shards} at once under cpu_budget = {params.cpu_budget}: '
+                            f'each planned with 1/{shards} of the memory.')
+
+    ini = PcigaleIni.read(ini_path)
+    ini.set('cores', ncores)
+    ini.set('blocks', nblocks, ('analysis_params',))
+    ini.write(ini_path)
+    params.ncores, params.nblocks = ncores, nblocks
+
+    with open(os.path.join(params.destination, 'auto_tuning.json'), 'w') as file:
+        json.dump({'ncores': ncores, 'nblocks': nblocks, 'available_memory_bytes': memory_bytes,
+                   'available_cores': ncpu, 'concurrent_shards': shards, 'models_total': plan['models_total'],
+                   'bytes_per_model': plan['bytes_per_model'], 'reasoning': reasoning}, file, indent=1)
+
+    print('auto tuning:', *reasoning, sep='\n    ')
+
+
+def resolve_auto_tuning(params):
+    #a separate process (e.g., run_cigale_cli.py) picks up the values already written into pcigale.ini
+    if not (params.auto_ncores or params.auto_nblocks):
+        return
+    ini = PcigaleIni.read(os.path.join(params.destination, 'pcigale.ini'))
+    if params.auto_ncores:
+        params.ncores = int(ini.get('cores'))
+    if params.auto_nblocks:
+        params.nblocks = int(ini.get('blocks', ('analysis_params',)))